@@ -1,6 +1,4 @@
-from flask import Flask                    # Flask application class
 from app.settings.config import Config     # Application configuration
-from app.routes.routes import bp           # Blueprint holding your route definitions
 from app.utils.logger import setup_logging, get_logger
 
 def create_app():
@@ -11,9 +9,16 @@ def create_app():
       1. Setup centralized logging system
       2. Instantiates Flask with the current module's name.
       3. Loads configuration from the Config class.
-      4. Registers your routes blueprint.
-      5. Returns the fully configured app.
+      4. Registers your routes blueprint (and attachment downloads).
+      5. Replays unfinished messages from the job journal (now and whenever a process dies).
+      6. Starts the background session renewer (if enabled).
+      7. Returns the fully configured app.
     """
+    # The Flask stack is imported here, not at package import, so that importing
+    # app.asgi (or any other app.* module) never builds the threaded pipeline
+    from flask import Flask                    # Flask application class
+    from app.routes.routes import bp           # Blueprint holding your route definitions
+
     # 1) Setup logging before anything else
     setup_logging()
     logger = get_logger(__name__)
@@ -24,12 +29,25 @@ def create_app():
     
     # 3) Load configuration settings
     app.config.from_object(Config)
-    logger.info(f"📋 Loaded config - Environment: {Config.FLASK_ENV}, Debug: {Config.DEBUG}, Host: {Config.HOST}, Port: {Config.PORT}")
+    logger.info("📋 Loaded config - Environment: %s, Debug: %s, Host: %s, Port: %s", Config.FLASK_ENV, Config.DEBUG, Config.HOST, Config.PORT)
     
-    # 4) Register the routes blueprint
+    # 4) Register the routes blueprint (and the attachment downloads, if enabled)
     app.register_blueprint(bp)
     logger.info("🔗 Registered routes blueprint")
+    if Config.ATTACHMENTS_ENABLED:
+        from app.routes.attachment_routes import attachments_bp
+        app.register_blueprint(attachments_bp)
+        logger.info("📎 Registered attachment downloads")
     
-    # 5) Return the configured Flask app
+    # 5) Replay messages a previous process accepted but never answered
+    from app.services.message_processor import replay_pending_jobs, start_job_reclaimer, session_renewer
+    replay_pending_jobs()
+    start_job_reclaimer()
+
+    # 6) Keep sessions fresh so users never wait on session creation
+    if session_renewer is not None:
+        session_renewer.start()
+
+    # 7) Return the configured Flask app
     logger.info("✅ Application factory completed successfully")
     return app
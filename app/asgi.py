@@ -0,0 +1,125 @@
+import asyncio
+import hmac
+from urllib.parse import parse_qsl
+from app.settings.config import Config
+from app.utils.metrics import metrics
+from app.utils.logger import setup_logging, get_logger
+
+def create_asgi_app():
+    """
+    Application factory for the asyncio execution mode (EXECUTION_MODE=async).
+
+    Returns a plain ASGI callable serving POST /whatsapp, GET /metrics (and
+    GET /attachments/... when attachments are enabled), to be run by an ASGI
+    server such as uvicorn. It needs no web framework: Quart releases that
+    install next to the pinned Flask/Werkzeug/Blinker versions do not exist.
+    """
+    setup_logging()
+    logger = get_logger(__name__)
+    logger.info("🚀 Initializing AskYourDBot asyncio application")
+    if Config.SESSION_RENEWER_ENABLED:
+        # The background renewer belongs to the threaded app; here it runs as its own process
+        logger.warning("⚠️ SESSION_RENEWER_ENABLED has no effect in async mode, "
+                       "run `python -m app.services.session_renewer` with SESSION_STORAGE_BACKEND=sqlite")
+
+    # Imported after logging is set up, like the blueprint in create_app()
+    from app.routes.async_routes import (whatsapp_webhook_async, shutdown_async, replay_pending_jobs_async,
+                                         start_job_reclaimer_async, stats_collectors)
+
+    async def _send_response(send, status: int, body: str, content_type: str):
+        payload = body.encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", content_type.encode()),
+                (b"content-length", str(len(payload)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    async def _read_body(receive) -> bytes:
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                return body
+
+    async def _send_metrics(send, headers: dict):
+        """Prometheus scrape endpoint, mirrors routes.metrics_endpoint."""
+        if not Config.METRICS_ENABLED:
+            return await _send_response(send, 404, "Not Found", "text/plain")
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        if Config.METRICS_TOKEN and not hmac.compare_digest(authorization, f"Bearer {Config.METRICS_TOKEN}"):
+            return await _send_response(send, 401, "Unauthorized", "text/plain")
+        body = await asyncio.to_thread(metrics.render, stats_collectors())
+        await _send_response(send, 200, body, "text/plain; version=0.0.4")
+
+    async def _send_attachment(send, path: str, headers: dict):
+        """Stream a stored attachment, gzip-encoded if the client accepts it."""
+        from app.services.attachments import attachment_store, iter_file
+
+        token, _, filename = path[len("/attachments/"):].partition("/")
+        found = attachment_store.open(token, filename) if attachment_store is not None else None
+        if found is None:
+            return await _send_response(send, 404, "Not Found", "text/plain")
+        file_path, content_type = found
+
+        gzip_ok = b"gzip" in headers.get(b"accept-encoding", b"")
+        response_headers = [
+            (b"content-type", content_type.encode()),
+            (b"content-disposition", f'inline; filename="{filename}"'.encode()),
+            (b"vary", b"Accept-Encoding"),
+        ]
+        if gzip_ok:
+            response_headers.append((b"content-encoding", b"gzip"))
+        await send({"type": "http.response.start", "status": 200, "headers": response_headers})
+
+        chunks = iter_file(file_path, decompress=not gzip_ok)
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, b"")
+            if not chunk:
+                break
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await replay_pending_jobs_async()
+                start_job_reclaimer_async()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await shutdown_async()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await _lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+
+        if scope["path"] == "/metrics" and scope["method"] == "GET":
+            return await _send_metrics(send, dict(scope.get("headers") or []))
+        if scope["path"].startswith("/attachments/") and scope["method"] in ("GET", "HEAD"):
+            return await _send_attachment(send, scope["path"], dict(scope.get("headers") or []))
+        if scope["path"] != "/whatsapp":
+            return await _send_response(send, 404, "Not Found", "text/plain")
+        if scope["method"] != "POST":
+            return await _send_response(send, 405, "Method Not Allowed", "text/plain")
+
+        headers = dict(scope.get("headers") or [])
+        signature = headers.get(b"x-twilio-signature", b"").decode("latin-1")
+        params = dict(parse_qsl(scope.get("query_string", b"").decode("utf-8"), keep_blank_values=True))
+        params.update(parse_qsl((await _read_body(receive)).decode("utf-8"), keep_blank_values=True))
+        client = scope.get("client") or ("", 0)
+
+        status, body = await whatsapp_webhook_async(params, signature, client[0])
+        content_type = "text/xml" if status == 200 else "text/plain"
+        await _send_response(send, status, body, content_type)
+
+    logger.info("✅ ASGI application factory completed successfully")
+    return app
@@ -0,0 +1,285 @@
+import asyncio
+import time
+from typing import Dict, Tuple
+from twilio.twiml.messaging_response import MessagingResponse
+
+from app.settings.config import Config
+from app.utils.twilio_validator import is_valid_twilio_signature
+from app.utils.rate_limiter import rate_limiter
+from app.utils.idempotency import idempotency_store
+from app.utils.upstream_guard import ayd_guard
+from app.services.async_message_processor import handle_incoming_async, session_ayd, request_coalescer
+from app.services.async_twilio_client import close_async_twilio
+from app.services.attachments import attachment_store
+from app.services.answer_cache import answer_cache
+from app.services.job_journal import job_journal
+from app.services.message_batch import MessageBatch
+from app.services.twilio_client import governor_for
+from app.utils.metrics import metrics
+from app.utils.logger import get_logger, get_logging_stats
+
+logger = get_logger(__name__)
+
+# In-flight message tasks, and the latest task per user (for per-user ordering)
+_tasks = set()
+_user_tails: Dict[str, asyncio.Task] = {}
+# Users whose latest message still waits in its merge window (MERGE_WINDOW > 0)
+_open_batches: Dict[str, MessageBatch] = {}
+_merged = 0
+# Task replaying journal jobs of processes that died while this one runs
+_reclaimer = None
+
+async def _run_after(previous: asyncio.Task, sender: str, phone_number: str, body: str,
+                     job_id: int = None, scheduled_at: float = 0.0):
+    """Wait for the user's previous message to finish, then process this one."""
+    if previous is not None:
+        await asyncio.wait([previous])
+    metrics.observe("queue_wait", time.perf_counter() - scheduled_at)
+    await handle_incoming_async(sender, phone_number, body)
+    if job_id is not None:
+        await asyncio.to_thread(job_journal.mark_done, job_id)
+
+async def _run_batch(previous: asyncio.Task, batch: MessageBatch):
+    """Wait out the batch's merge window and the user's previous message, then answer the batch."""
+    while True:
+        delay = batch.deadline() - time.monotonic()
+        if delay <= 0:
+            break
+        await asyncio.sleep(delay)
+    if _open_batches.get(batch.phone_number) is batch:
+        del _open_batches[batch.phone_number]
+
+    ready_at = time.perf_counter()
+    if previous is not None:
+        await asyncio.wait([previous])
+    metrics.observe("queue_wait", time.perf_counter() - ready_at)
+    if len(batch.bodies) > 1:
+        logger.info("🧩 Answering %s merged messages from %s as one question", len(batch.bodies), batch.phone_number)
+    try:
+        await handle_incoming_async(batch.sender, batch.phone_number, batch.text())
+    finally:
+        job_ids = batch.finish()
+        if job_journal is not None and job_ids:
+            await asyncio.to_thread(job_journal.mark_done, *job_ids)
+
+async def _merge(sender: str, phone_number: str, body: str) -> bool:
+    """
+    Add a message to the user's batch if it still waits in its merge window
+    (the event-loop counterpart of message_processor.merge_message).
+
+    Returns:
+        bool: True if merged, False to schedule the message normally
+    """
+    global _merged
+    batch = _open_batches.get(phone_number)
+    index = batch.add(body) if batch is not None else None
+    if index is None:
+        return False
+    _merged += 1
+
+    if job_journal is not None:
+        try:
+            job_id = await asyncio.to_thread(job_journal.append, sender, phone_number, body)
+        except Exception as e:
+            logger.error("❌ Failed to journal message from %s: %s", phone_number, e)
+            return True
+        if not batch.attach_job(index, job_id):
+            # The batch was answered while the job was written
+            await asyncio.to_thread(job_journal.mark_done, job_id)
+    return True
+
+def _forget(phone_number: str, task: asyncio.Task):
+    _tasks.discard(task)
+    if _user_tails.get(phone_number) is task:
+        del _user_tails[phone_number]
+
+def _schedule(sender: str, phone_number: str, body: str, job_id: int = None):
+    """
+    Start processing a message as a task, after the user's previous one. With
+    a merge window it opens a batch that _merge() adds follow-ups to.
+    """
+    previous = _user_tails.get(phone_number)
+    if Config.MERGE_WINDOW > 0:
+        batch = MessageBatch(sender, phone_number, body, job_id)
+        _open_batches[phone_number] = batch
+        task = asyncio.create_task(_run_batch(previous, batch))
+    else:
+        task = asyncio.create_task(_run_after(previous, sender, phone_number, body, job_id, time.perf_counter()))
+    _tasks.add(task)
+    _user_tails[phone_number] = task
+    task.add_done_callback(lambda t: _forget(phone_number, t))
+
+async def replay_pending_jobs_async() -> int:
+    """
+    Re-schedule journaled messages left unfinished by processes that are gone
+    (their lease expired). Called at startup, then every JOB_JOURNAL_LEASE
+    seconds by the reclaimer task.
+
+    Returns:
+        int: Number of replayed messages
+    """
+    if job_journal is None or Config.WORKER_MODE == "external":
+        return 0  # External workers recover their own jobs
+
+    await asyncio.to_thread(job_journal.purge)
+    jobs = await asyncio.to_thread(job_journal.claim_orphans)
+    for job in jobs:
+        _schedule(job["sender"], job["phone_number"], job["body"], job["id"])
+    if jobs:
+        logger.info("♻️ Replayed %s unfinished messages from the job journal", len(jobs))
+    return len(jobs)
+
+async def _reclaim_forever():
+    """Reclaimer task: replay jobs whose process died after this one started."""
+    while True:
+        await asyncio.sleep(job_journal.lease)
+        try:
+            await replay_pending_jobs_async()
+        except Exception as e:
+            logger.error("❌ Failed to replay unfinished jobs: %s", e)
+
+def start_job_reclaimer_async():
+    """Start the background task replaying orphaned journal jobs (if the journal is used in-process)."""
+    global _reclaimer
+    if job_journal is None or Config.WORKER_MODE == "external" or _reclaimer is not None:
+        return
+    _reclaimer = asyncio.create_task(_reclaim_forever())
+
+async def whatsapp_webhook_async(params: dict, signature: str, remote_addr: str = "") -> Tuple[int, str]:
+    """
+    asyncio WhatsApp webhook handler, mirrors routes.whatsapp_webhook.
+
+    1) Validate the Twilio signature.
+    2) Acknowledge Twilio retries of a message already received (same MessageSid) without doing anything.
+    3) Read incoming message & sender phone number.
+    4) Add it to the user's previous message if that still waits in its merge window (MERGE_WINDOW).
+    5) Journal the message (if enabled) and schedule processing as a task
+       (ordered per user, bounded in total).
+    6) Return empty TwiML immediately, or a "busy" reply if too many are in flight.
+
+    Returns:
+        tuple: (HTTP status, response body)
+    """
+    start = time.perf_counter()
+    valid = is_valid_twilio_signature(params, signature)
+    validated = time.perf_counter()
+    metrics.observe("signature_validation", validated - start)
+    if not valid:
+        logger.warning("🚫 Invalid Twilio signature from %s", remote_addr)
+        return 403, "Invalid Twilio signature"
+
+    message_sid = params.get("MessageSid", "")
+    if idempotency_store is not None and message_sid:
+        if idempotency_store.blocking:
+            first = await asyncio.to_thread(idempotency_store.claim, message_sid)
+        else:
+            first = idempotency_store.claim(message_sid)
+        checked = time.perf_counter()
+        metrics.observe("idempotency", checked - validated)
+        validated = checked
+        if not first:
+            logger.info("🔁 Ignoring retried webhook for %s", message_sid)
+            return 200, str(MessagingResponse())
+
+    incoming = params.get("Body", "").strip()
+    sender = params.get("From")  # WhatsApp phone number like "whatsapp:+15551234567"
+    phone_number = sender.replace("whatsapp:", "") if sender else ""
+
+    # A quick follow-up joins the question still waiting in its merge window: no extra AYD call, no rate limit
+    if Config.MERGE_WINDOW > 0:
+        if Config.WORKER_MODE == "external":
+            from app.services.message_processor import merge_message
+            merged = await asyncio.to_thread(merge_message, sender, phone_number, incoming)
+        else:
+            merged = await _merge(sender, phone_number, incoming)
+        if merged:
+            logger.info("🧩 Merged message from %s into their pending question: %s%s",
+                        phone_number, incoming[:100], '...' if len(incoming) > 100 else '')
+            return 200, str(MessagingResponse())
+
+    # Rate limiting check
+    if rate_limiter.blocking:
+        allowed = await asyncio.to_thread(rate_limiter.is_allowed, phone_number)
+    else:
+        allowed = rate_limiter.is_allowed(phone_number)
+    metrics.observe("rate_limit", time.perf_counter() - validated)
+    if not allowed:
+        if rate_limiter.blocking:
+            wait_time = await asyncio.to_thread(rate_limiter.get_wait_time, phone_number)
+        else:
+            wait_time = rate_limiter.get_wait_time(phone_number)
+        logger.warning("🚫 Rate limited user %s, wait %ss", phone_number, wait_time)
+        response = MessagingResponse()
+        response.message(f"Please wait {wait_time} seconds before sending another request.")
+        return 200, str(response)
+
+    logger.info("📥 Received from %s: %s%s", phone_number, incoming[:100], '...' if len(incoming) > 100 else '')
+
+    if Config.WORKER_MODE == "external":
+        # Worker processes do the AYD and Twilio work; only enqueue here
+        from app.services.message_processor import enqueue_message
+        queued = await asyncio.to_thread(enqueue_message, sender, phone_number, incoming)
+        if not queued:
+            logger.warning("🚧 Job queue full, rejecting message from %s", phone_number)
+            response = MessagingResponse()
+            response.message("We're handling a lot of messages right now. Please try again in a minute.")
+            return 200, str(response)
+        return 200, str(MessagingResponse())
+
+    if len(_tasks) >= Config.ASYNC_MAX_IN_FLIGHT:
+        logger.warning("🚧 Too many messages in flight, rejecting message from %s", phone_number)
+        response = MessagingResponse()
+        response.message("We're handling a lot of messages right now. Please try again in a minute.")
+        return 200, str(response)
+
+    job_id = None
+    if job_journal is not None:
+        try:
+            # Group commit blocks for a few milliseconds; keep it off the event loop
+            job_id = await asyncio.to_thread(job_journal.append, sender, phone_number, incoming)
+        except Exception as e:
+            logger.error("❌ Failed to journal message from %s: %s", phone_number, e)
+
+    _schedule(sender, phone_number, incoming, job_id)
+
+    # Always return valid TwiML immediately to acknowledge receipt
+    return 200, str(MessagingResponse())
+
+async def shutdown_async(timeout: float = Config.DISPATCHER_DRAIN_TIMEOUT):
+    """Wait for in-flight messages to finish, then close pooled connections."""
+    if _reclaimer is not None:
+        _reclaimer.cancel()
+    if _tasks:
+        logger.info("⏳ Draining %s in-flight messages", len(_tasks))
+        _, pending = await asyncio.wait(set(_tasks), timeout=timeout)
+        if pending:
+            logger.warning("⚠️ Drain timed out with %s messages still in flight", len(pending))
+    await session_ayd.close()
+    await close_async_twilio()
+
+def stats_collectors() -> dict:
+    """
+    The get_stats() sources of the asyncio mode for the /metrics endpoint.
+
+    Returns:
+        dict: Name -> callable returning a stats dict
+    """
+    collectors = {
+        "async_tasks": lambda: {"in_flight": len(_tasks), "users": len(_user_tails),
+                                "merging": len(_open_batches), "merged": _merged},
+        "twilio_governor": governor_for(f"whatsapp:{Config.TWILIO_FROM_NUMBER}").get_stats,
+    }
+    if job_journal is not None:
+        collectors["job_journal"] = lambda: {**job_journal.get_stats(), "pending": job_journal.pending_count()}
+    if attachment_store is not None:
+        collectors["attachments"] = attachment_store.get_stats
+    if answer_cache is not None:
+        collectors["answer_cache"] = answer_cache.get_stats
+    if request_coalescer is not None:
+        collectors["request_coalescer"] = request_coalescer.get_stats
+    if idempotency_store is not None:
+        collectors["idempotency"] = idempotency_store.get_stats
+    if ayd_guard is not None:
+        collectors["ayd_guard"] = ayd_guard.get_stats
+    collectors["logging"] = get_logging_stats
+    return collectors
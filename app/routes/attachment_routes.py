@@ -0,0 +1,31 @@
+import os
+from flask import Blueprint, Response, abort, request
+
+from app.services.attachments import attachment_store, iter_file
+from app.utils.logger import get_logger
+
+attachments_bp = Blueprint("attachments", __name__)
+logger = get_logger(__name__)
+
+@attachments_bp.route("/attachments/<token>/<filename>", methods=["GET", "HEAD"])
+def download_attachment(token: str, filename: str):
+    """
+    Serve a generated attachment to Twilio (or the user's browser).
+
+    Files are stored gzip-compressed and sent as-is with Content-Encoding: gzip
+    to clients that accept it; others get them decompressed on the fly.
+    """
+    found = attachment_store.open(token, filename) if attachment_store is not None else None
+    if found is None:
+        abort(404)
+    path, content_type = found
+
+    gzip_ok = "gzip" in request.accept_encodings
+    response = Response(iter_file(path, decompress=not gzip_ok), content_type=content_type)
+    if gzip_ok:
+        response.headers["Content-Encoding"] = "gzip"
+        response.content_length = os.path.getsize(path)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Content-Disposition"] = f'inline; filename="{filename}"'
+    logger.info("📎 Serving attachment %s (%s) to %s", filename, 'gzip' if gzip_ok else 'identity', request.remote_addr)
+    return response
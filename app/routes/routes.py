@@ -1,11 +1,14 @@
-import threading
-from flask import Blueprint, request
+import hmac
+import time
+from flask import Blueprint, Response, abort, request
 from twilio.twiml.messaging_response import MessagingResponse
 
+from app.settings.config import Config
 from app.utils.twilio_validator import validate_twilio_request
 from app.utils.rate_limiter import rate_limiter
-from app.services.message_processor import process_incoming
-from app.services.twilio_client import send_whatsapp_message
+from app.utils.idempotency import idempotency_store
+from app.utils.metrics import metrics
+from app.services.message_processor import enqueue_message, merge_message, stats_collectors
 from app.utils.logger import get_logger
 
 bp = Blueprint("whatsapp", __name__)
@@ -17,56 +20,70 @@ def whatsapp_webhook():
     WhatsApp webhook handler with session-based conversation support.
     
     1) Validate the Twilio signature.
-    2) Read incoming message & sender phone number.
-    3) Spawn a background thread to handle session-based processing.
-    4) Return empty TwiML immediately.
+    2) Acknowledge Twilio retries of a message already received (same MessageSid) without doing anything.
+    3) Read incoming message & sender phone number.
+    4) Add it to the user's previous message if that still waits in its merge window (MERGE_WINDOW).
+    5) Journal the message (if enabled) and queue it on the bounded worker pool (per-user FIFO).
+    6) Return empty TwiML immediately, or a "busy" reply if the queue is full.
     """
+    start = time.perf_counter()
     validate_twilio_request()
+    validated = time.perf_counter()
+    metrics.observe("signature_validation", validated - start)
+
+    # Twilio retries slow or failed webhooks with the same MessageSid; answer those before they cost anything
+    message_sid = request.values.get("MessageSid", "")
+    if idempotency_store is not None and message_sid:
+        first = idempotency_store.claim(message_sid)
+        checked = time.perf_counter()
+        metrics.observe("idempotency", checked - validated)
+        validated = checked
+        if not first:
+            logger.info("🔁 Ignoring retried webhook for %s", message_sid)
+            return str(MessagingResponse())
 
     incoming = request.values.get("Body", "").strip()
     sender = request.values.get("From")  # WhatsApp phone number like "whatsapp:+15551234567"
     # Clean phone number (remove whatsapp: prefix if present)
     phone_number = sender.replace("whatsapp:", "") if sender else ""
 
+    # A quick follow-up joins the question still waiting in its merge window: no extra AYD call, no rate limit
+    if merge_message(sender, phone_number, incoming):
+        logger.info("🧩 Merged message from %s into their pending question: %s%s",
+                    phone_number, incoming[:100], '...' if len(incoming) > 100 else '')
+        return str(MessagingResponse())
+
     # Rate limiting check
-    if not rate_limiter.is_allowed(phone_number):
+    allowed = rate_limiter.is_allowed(phone_number)
+    metrics.observe("rate_limit", time.perf_counter() - validated)
+    if not allowed:
         wait_time = rate_limiter.get_wait_time(phone_number)
-        logger.warning(f"🚫 Rate limited user {phone_number}, wait {wait_time}s")
+        logger.warning("🚫 Rate limited user %s, wait %ss", phone_number, wait_time)
         response = MessagingResponse()
         response.message(f"Please wait {wait_time} seconds before sending another request.")
         return str(response)
     
-    logger.info(f"📥 Received from {phone_number}: {incoming[:100]}{'...' if len(incoming) > 100 else ''}")
+    logger.info("📥 Received from %s: %s%s", phone_number, incoming[:100], '...' if len(incoming) > 100 else '')
 
-    def background_task(phone: str, body: str):
-        """Background task that processes the message with session context."""
-        try:
-            result = process_incoming(phone, body)
-            
-            if result.get("success"):
-                reply = result.get("aiResponse", "Sorry, I couldn't process your message.")
-            else:
-                reply = result.get("aiResponse", "Sorry, something went wrong. Please try again.")
-            
-            # Send reply back to user
-            send_whatsapp_message(to=sender, body=reply)  # Use original sender format for Twilio
-            logger.info(f"✅ Sent reply to {phone}: {len(reply)} chars")
-            
-        except Exception as e:
-            logger.error(f"❌ Error in background task for {phone}: {e}")
-            # Send error message to user
-            error_reply = "Sorry, I encountered an error processing your message. Please try again."
-            try:
-                send_whatsapp_message(to=sender, body=error_reply)
-            except Exception as send_error:
-                logger.error(f"❌ Failed to send error message: {send_error}")
-
-    # Start background processing
-    threading.Thread(
-        target=background_task,
-        args=(phone_number, incoming),
-        daemon=True
-    ).start()
+    # Persist, then queue for background processing on the bounded worker pool
+    if not enqueue_message(sender, phone_number, incoming):
+        logger.warning("🚧 Dispatcher queue full, rejecting message from %s", phone_number)
+        response = MessagingResponse()
+        response.message("We're handling a lot of messages right now. Please try again in a minute.")
+        return str(response)
 
     # Always return valid TwiML immediately to acknowledge receipt
     return str(MessagingResponse())
+
+@bp.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """
+    Prometheus scrape endpoint: per-stage latency histograms of this process,
+    plus the counters of the dispatcher, caches, journal and senders as gauges.
+    """
+    if not Config.METRICS_ENABLED:
+        abort(404)
+    expected = f"Bearer {Config.METRICS_TOKEN}"
+    if Config.METRICS_TOKEN and not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+        abort(401)
+    return Response(metrics.render(stats_collectors()), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,147 @@
+import re
+import sys
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Tuple
+from app.settings.config import Config
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_question(text: str) -> str:
+    """
+    Normalize question text for cache lookups: case-folded, whitespace
+    collapsed and trailing punctuation removed, so "Sales today?" and
+    "sales  today" share an entry.
+    """
+    return _WHITESPACE.sub(" ", text.casefold()).strip().rstrip("?!.").strip()
+
+class AnswerCache:
+    """
+    In-memory LRU cache of AYD answers keyed on normalized question text.
+
+    Entries expire after `ttl` seconds and the least recently used ones are
+    evicted once either `max_entries` or `max_bytes` (approximate memory of the
+    cached strings) is exceeded. The scope decides who shares answers:
+    "chatbot" (everyone asking the same chatbot) or "user" (per phone number).
+    """
+
+    def __init__(self, max_entries: int = Config.ANSWER_CACHE_MAX_ENTRIES,
+                 max_bytes: int = Config.ANSWER_CACHE_MAX_BYTES,
+                 ttl: float = Config.ANSWER_CACHE_TTL,
+                 scope: str = Config.ANSWER_CACHE_SCOPE,
+                 bypass_keyword: str = Config.ANSWER_CACHE_BYPASS_KEYWORD):
+        if scope not in ("chatbot", "user"):
+            raise ValueError(f"Unknown answer cache scope: {scope}")
+
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.ttl = ttl
+        self.scope = scope
+        self.bypass_keyword = bypass_keyword.casefold().strip()
+        self._entries = OrderedDict()  # key -> (expires_at, answer, size)
+        self._bytes = 0
+        self.lock = Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def strip_bypass(self, text: str) -> Tuple[str, bool]:
+        """
+        Detect and remove the bypass keyword at the start or end of a message.
+        It only counts as a whole word: "#fresh sales" bypasses the cache,
+        "#freshness report" does not.
+
+        Args:
+            text (str): Incoming message text
+
+        Returns:
+            tuple: (question without the keyword, True if the cache should be bypassed);
+                   the question is empty if the message was only the keyword
+        """
+        if not self.bypass_keyword:
+            return text, False
+
+        stripped = text.strip()
+        size = len(self.bypass_keyword)
+        if stripped[:size].casefold() == self.bypass_keyword and (len(stripped) == size or stripped[size].isspace()):
+            return stripped[size:].strip(), True
+        if stripped[-size:].casefold() == self.bypass_keyword and (len(stripped) == size or stripped[-size - 1].isspace()):
+            return stripped[:-size].strip(), True
+        return text, False
+
+    def _key(self, phone_number: str, question: str) -> tuple:
+        scope_id = phone_number if self.scope == "user" else Config.AYD_CHAT_ID
+        return (scope_id, normalize_question(question))
+
+    def get(self, phone_number: str, question: str) -> Optional[str]:
+        """
+        Look up a cached answer.
+
+        Returns:
+            str: Cached answer, or None on a miss
+        """
+        key = self._key(phone_number, question)
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, answer, size = entry
+                if time.monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return answer
+
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+
+            self.misses += 1
+            return None
+
+    def put(self, phone_number: str, question: str, answer: str):
+        """Store an answer, evicting least recently used entries if over budget."""
+        key = self._key(phone_number, question)
+        size = sys.getsizeof(answer) + sys.getsizeof(key[1])
+        if size > self.max_bytes:
+            return  # Larger than the whole cache, not worth keeping
+
+        with self.lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+
+            self._entries[key] = (time.monotonic() + self.ttl, answer, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def get_stats(self) -> dict:
+        """
+        Snapshot of cache size and hit/miss metrics.
+
+        Returns:
+            dict: Entry count, approximate bytes, hits, misses, hit ratio, evictions, expirations
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+# Global answer cache instance (None unless ANSWER_CACHE_ENABLED)
+answer_cache = AnswerCache() if Config.ANSWER_CACHE_ENABLED else None
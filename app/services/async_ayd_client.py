@@ -0,0 +1,273 @@
+import asyncio
+import time
+from typing import AsyncIterator, Dict, Optional
+
+import aiohttp
+
+from app.settings.config import Config
+from app.services.session_storage import create_session_storage
+from app.services.simple_ayd_client import rejected_result, upstream_failed
+from app.utils.upstream_guard import ayd_guard, Permit, UpstreamRejected
+from app.utils.sse import SSEParser, text_content
+from app.utils.metrics import metrics
+from app.utils.logger import get_logger
+
+class AsyncSessionBasedAYDClient:
+    """
+    asyncio counterpart of SessionBasedAYDClient, built on aiohttp.
+    Same session handling, SSE parsing and result format, but a waiting question
+    only holds a coroutine instead of an OS thread.
+    """
+
+    def __init__(self):
+        if not (Config.AYD_API_KEY and Config.AYD_CHAT_ID):
+            raise RuntimeError("Missing AYD config: check ASKYOURDATABASE_API_KEY and ASKYOURDATABASE_CHAT_ID")
+
+        self.base_url = Config.AYD_BASE_URL
+        self.api_key = Config.AYD_API_KEY
+        self.bot_id = Config.AYD_CHAT_ID
+
+        # Session storage (stores access tokens with expiry), backend picked by config
+        self.session_storage = create_session_storage()
+        self._http: Optional[aiohttp.ClientSession] = None
+        # Adaptive concurrency limit + circuit breaker (None if disabled)
+        self.guard = ayd_guard
+        self.logger = get_logger(__name__)
+        self.logger.info("🔧 AsyncSessionBasedAYDClient initialized")
+
+    def _http_session(self) -> aiohttp.ClientSession:
+        """
+        Return the shared aiohttp session, creating it inside the running loop on first use.
+        Cookies are not shared between users: logins read them from the responses instead.
+        """
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=Config.ASYNC_HTTP_POOL_LIMIT),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=Config.HTTP_CONNECT_TIMEOUT,
+                    sock_read=Config.HTTP_READ_TIMEOUT
+                ),
+                cookie_jar=aiohttp.DummyCookieJar()
+            )
+        return self._http
+
+    async def close(self):
+        """Close the pooled HTTP connections."""
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+
+    async def _create_session(self, phone_number: str) -> Optional[str]:
+        """
+        Create a new AYD session and return access token.
+        Returns access_token if successful, None otherwise.
+        """
+        start = time.perf_counter()
+        try:
+            self.logger.info("🆕 Creating new AYD session for %s", phone_number)
+            http = self._http_session()
+
+            async with http.post(
+                f"{self.base_url}/api/chatbot/v2/session",
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                json={
+                    "chatbotid": self.bot_id,
+                    "name": f"WhatsApp User {phone_number}",
+                    "email": f"wa{phone_number.replace('+', '')}@example.com"
+                }
+            ) as resp:
+                resp.raise_for_status()
+                callback_url = (await resp.json(content_type=None))["url"]
+            self.logger.debug("✅ Got callback URL for %s", phone_number)
+
+            # Login to get access token; the cookie may be set on any hop of the redirect chain
+            access_token = None
+            async with http.get(callback_url, allow_redirects=True) as login_resp:
+                login_resp.raise_for_status()
+                for hop in (*login_resp.history, login_resp):
+                    if "accessToken" in hop.cookies:
+                        access_token = hop.cookies["accessToken"].value
+
+            if not access_token:
+                self.logger.error("❌ No accessToken cookie found for %s", phone_number)
+                return None
+
+            # Get expiry (7 days from creation)
+            expires_at = time.time() + (7 * 24 * 3600)  # 7 days
+
+            # Store session (storage backends are blocking, keep them off the event loop)
+            success = await asyncio.to_thread(
+                self.session_storage.save_session, phone_number, access_token, expires_at
+            )
+
+            if success:
+                self.logger.info("✅ Created and stored session for %s", phone_number)
+                return access_token
+            else:
+                self.logger.error("❌ Failed to store session for %s", phone_number)
+                return None
+
+        except Exception as e:
+            self.logger.error("❌ Error creating session for %s: %s", phone_number, e)
+            return None
+        finally:
+            metrics.observe("session_create", time.perf_counter() - start)
+
+    def _lookup_session(self, phone_number: str) -> Optional[Dict]:
+        """Read the stored session and mark it used, in one trip to a worker thread."""
+        session = self.session_storage.get_session(phone_number)
+        if session:
+            self.session_storage.mark_used(phone_number)  # keeps it on the renewer's list
+        return session
+
+    async def _get_or_create_session(self, phone_number: str) -> Optional[str]:
+        """
+        Get existing access token or create a new session.
+        Returns access_token if successful, None otherwise.
+        """
+        start = time.perf_counter()
+        session = await asyncio.to_thread(self._lookup_session, phone_number)
+        metrics.observe("session_lookup", time.perf_counter() - start)
+        if session:
+            self.logger.info("📱 Using existing session for %s", phone_number)
+            return session['session_id']  # This is actually the access_token
+
+        return await self._create_session(phone_number)
+
+    async def _post_question(self, access_token: str, question: str) -> aiohttp.ClientResponse:
+        """Start the streaming /api/ask request. The caller must release the response."""
+        return await self._http_session().post(
+            f"{self.base_url}/api/ask?debug=false",
+            headers={"x-ayd-access-token": access_token},
+            json={
+                "question": question,
+                "fileUrls": [],
+                "botid": self.bot_id,
+                "debug": False
+            }
+        )
+
+    @staticmethod
+    async def _iter_sse_data(resp: aiohttp.ClientResponse, asked_at: float) -> AsyncIterator[bytes]:
+        """
+        Yield the data payload of every SSE event in the response body, recording
+        the time from asked_at (perf_counter) to the first body bytes.
+        """
+        parser = SSEParser()
+        first = True
+        async for chunk in resp.content.iter_any():
+            if first:
+                metrics.observe("ayd_first_byte", time.perf_counter() - asked_at)
+                first = False
+            for data in parser.feed(chunk):
+                yield data
+        for data in parser.flush():
+            yield data
+
+    async def ask_with_session(self, phone_number: str, question: str) -> Dict:
+        """
+        Send a question to AYD using session-based conversation with streaming response.
+        Concatenates all text chunks and returns the complete response.
+        Goes through the upstream guard like SessionBasedAYDClient.ask_with_session.
+        """
+        if self.guard is None:
+            return await self._ask(phone_number, question)
+
+        start = time.perf_counter()
+        try:
+            permit = await self.guard.acquire_async()
+        except UpstreamRejected as e:
+            self.logger.warning("🛑 AYD guard turned away question from %s: %s", phone_number, e.reason)
+            return rejected_result(e.reason)
+        finally:
+            metrics.observe("ayd_guard", time.perf_counter() - start)
+
+        result = {}
+        try:
+            result = await self._ask(phone_number, question, permit)
+            return result
+        finally:
+            self.guard.release(permit, success=not upstream_failed(result))
+
+    async def _ask(self, phone_number: str, question: str, permit: Optional[Permit] = None) -> Dict:
+        """ask_with_session without the upstream guard; records time to first event on permit."""
+        access_token = await self._get_or_create_session(phone_number)
+        if not access_token:
+            return {
+                "success": False,
+                "error": "SessionCreationFailed",
+                "aiResponse": "Sorry, I couldn't establish a conversation session. Please try again."
+            }
+
+        resp = None
+        try:
+            asked_at = time.perf_counter()
+            resp = await self._post_question(access_token, question)
+
+            # Handle 401 errors by recreating session
+            if resp.status == 401:
+                resp.release()
+                self.logger.info("🔄 Access token expired, creating new session for %s", phone_number)
+                await asyncio.to_thread(self.session_storage.remove_session, phone_number)
+
+                access_token = await self._create_session(phone_number)
+                if not access_token:
+                    return {
+                        "success": False,
+                        "error": "SessionRetryFailed",
+                        "aiResponse": "Sorry, I'm having trouble maintaining our conversation. Please try again."
+                    }
+                asked_at = time.perf_counter()
+                resp = await self._post_question(access_token, question)
+
+            resp.raise_for_status()
+
+            text_parts = []
+            malformed = 0
+            async for data in self._iter_sse_data(resp, asked_at):
+                if permit is not None and permit.first_event is None:
+                    permit.first_event = time.perf_counter() - asked_at
+                try:
+                    content = text_content(data)
+                except ValueError:
+                    malformed += 1
+                    continue
+                if content:
+                    text_parts.append(content)
+            metrics.observe("ayd_last_event", time.perf_counter() - asked_at)
+
+            if malformed:
+                self.logger.warning("⚠️ Skipped %s malformed text events for %s", malformed, phone_number)
+
+            full_response = "".join(text_parts).strip()
+            if not full_response:
+                full_response = "I processed your request but have no specific response to share."
+
+            self.logger.info("✅ Got response for %s: %s chars", phone_number, len(full_response))
+            return {
+                "success": True,
+                "aiResponse": full_response
+            }
+
+        except asyncio.TimeoutError:
+            self.logger.warning("⏰ Timeout for %s", phone_number)
+            return {
+                "success": False,
+                "error": "Timeout",
+                "aiResponse": "Sorry, the request took too long. Please try again."
+            }
+        except Exception as e:
+            self.logger.error("❌ Error for %s: %s", phone_number, e)
+            if isinstance(e, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+                error = "ConnectionFailed"
+            elif isinstance(e, aiohttp.ClientResponseError) and e.status >= 500:
+                error = "UpstreamError"
+            else:
+                error = "RequestFailed"  # 4xx, or an error on our side
+            return {
+                "success": False,
+                "error": error,
+                "aiResponse": "Sorry, something went wrong. Please try again."
+            }
+        finally:
+            if resp is not None:
+                resp.release()
@@ -0,0 +1,128 @@
+import asyncio
+import time
+from app.settings.config import Config
+from app.services.async_ayd_client import AsyncSessionBasedAYDClient
+from app.services.answer_cache import answer_cache, normalize_question
+from app.services.async_twilio_client import send_whatsapp_message_async, send_whatsapp_media_async
+from app.services.attachments import attachment_store
+from app.utils.single_flight import AsyncSingleFlight
+from app.utils.metrics import metrics
+from app.utils.logger import get_logger
+
+# Initialize session-based async AYD client
+session_ayd = AsyncSessionBasedAYDClient()
+# Shares one AYD call between concurrent identical questions (None unless enabled)
+request_coalescer = AsyncSingleFlight() if Config.REQUEST_COALESCING_ENABLED else None
+logger = get_logger(__name__)
+
+async def _ask_async(phone_number: str, text: str) -> dict:
+    """
+    asyncio version of message_processor._ask: ask AYD, joining an identical
+    question already in flight (within the answer cache's scope) when request
+    coalescing is enabled.
+    """
+    if request_coalescer is None:
+        return await session_ayd.ask_with_session(phone_number, text)
+
+    scope_id = phone_number if Config.ANSWER_CACHE_SCOPE == "user" else Config.AYD_CHAT_ID
+    key = (scope_id, normalize_question(text))
+    result, shared = await request_coalescer.do(
+        key, session_ayd.ask_with_session, phone_number, text,
+        max_age=Config.REQUEST_COALESCING_WINDOW
+    )
+    if not shared:
+        return result
+
+    logger.info("🔗 Coalesced question from %s with an in-flight AYD call", phone_number)
+    return {**result, "coalesced": True}
+
+async def process_incoming_async(phone_number: str, text: str) -> dict:
+    """
+    asyncio version of process_incoming: ask AYD with session context and return the result.
+    Repeated questions are answered from the answer cache when it is enabled
+    (in memory, so it is used directly on the event loop).
+    """
+    logger.info("📱 Processing message from %s: %s%s", phone_number, text[:50], '...' if len(text) > 50 else '')
+
+    bypass_cache = False
+    if answer_cache is not None:
+        text, bypass_cache = answer_cache.strip_bypass(text)
+        if bypass_cache and not text:
+            # Only the keyword, nothing to ask
+            return {
+                "success": False,
+                "error": "EmptyQuestion",
+                "aiResponse": f"Please add your question, e.g. \"{Config.ANSWER_CACHE_BYPASS_KEYWORD} how many orders today?\""
+            }
+        if not bypass_cache:
+            cached = answer_cache.get(phone_number, text)
+            if cached is not None:
+                logger.info("⚡ Answer cache hit for %s: %s chars", phone_number, len(cached))
+                return {
+                    "success": True,
+                    "aiResponse": cached,
+                    "cached": True
+                }
+
+    start = time.time()
+    result = await _ask_async(phone_number, text)
+    duration = time.time() - start
+
+    logger.info("🔍 AYD call took %.2fs, success=%s", duration, result.get('success'))
+
+    if answer_cache is not None and result.get("success"):
+        answer_cache.put(phone_number, text, result["aiResponse"])
+
+    return result
+
+async def _send_as_attachment_async(sender: str, phone_number: str, reply: str) -> bool:
+    """
+    asyncio version of message_processor._send_as_attachment; the file is
+    written on a worker thread.
+
+    Returns:
+        bool: True if the reply was sent as a file plus summary, False to send it as text
+    """
+    if attachment_store is None:
+        return False
+    try:
+        attachment = await asyncio.to_thread(attachment_store.prepare, reply)
+    except Exception as e:
+        logger.error("❌ Failed to write attachment for %s, sending text instead: %s", phone_number, e)
+        return False
+    if attachment is None:
+        return False
+
+    await send_whatsapp_media_async(to=sender, body=attachment.summary, media_url=attachment.url)
+    logger.info("✅ Sent reply to %s as %s (%s chars, %s bytes) with a %s-char summary", phone_number,
+                attachment.filename, len(reply), attachment.size, len(attachment.summary))
+    return True
+
+async def handle_incoming_async(sender: str, phone_number: str, body: str):
+    """
+    asyncio version of handle_incoming: ask AYD and send the reply back.
+    Errors are reported to the user.
+    """
+    start = time.perf_counter()
+    try:
+        result = await process_incoming_async(phone_number, body)
+
+        if result.get("success"):
+            reply = result.get("aiResponse", "Sorry, I couldn't process your message.")
+            if await _send_as_attachment_async(sender, phone_number, reply):
+                return
+        else:
+            reply = result.get("aiResponse", "Sorry, something went wrong. Please try again.")
+
+        await send_whatsapp_message_async(to=sender, body=reply)
+        logger.info("✅ Sent reply to %s: %s chars", phone_number, len(reply))
+
+    except Exception as e:
+        logger.error("❌ Error in async task for %s: %s", phone_number, e)
+        error_reply = "Sorry, I encountered an error processing your message. Please try again."
+        try:
+            await send_whatsapp_message_async(to=sender, body=error_reply)
+        except Exception as send_error:
+            logger.error("❌ Failed to send error message: %s", send_error)
+    finally:
+        metrics.observe("processing", time.perf_counter() - start)
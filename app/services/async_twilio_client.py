@@ -0,0 +1,103 @@
+import time
+from typing import Optional
+from twilio.rest import Client
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+from app.settings.config import Config
+from app.services.twilio_client import governor_for
+from app.utils.text_splitter import part_header, split_message
+from app.utils.metrics import metrics
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+_twilio = None
+
+def _async_twilio() -> Client:
+    """
+    Twilio REST client using the aiohttp-based HTTP client.
+    Created on first use so its connection pool binds to the running event loop.
+    Sends go to TWILIO_API_BASE_URL, like the threaded sender's.
+    """
+    global _twilio
+    if _twilio is None:
+        _twilio = Client(
+            Config.TWILIO_ACCOUNT_SID,
+            Config.TWILIO_AUTH_TOKEN,
+            http_client=AsyncTwilioHttpClient()
+        )
+        _twilio.api.base_url = Config.TWILIO_API_BASE_URL.rstrip("/")
+    return _twilio
+
+async def close_async_twilio():
+    """Close the pooled Twilio connections (call on shutdown)."""
+    global _twilio
+    if _twilio is not None:
+        await _twilio.http_client.close()
+        _twilio = None
+
+async def _create_message(to: str, body: str, media_url: Optional[str] = None):
+    """Wait for a slot from the outbound governor, then create one message."""
+    from_ = f"whatsapp:{Config.TWILIO_FROM_NUMBER}"
+    queued_at = time.perf_counter()
+    await governor_for(from_).acquire_async(to)
+    sent_at = time.perf_counter()
+    metrics.observe("twilio_queue", sent_at - queued_at)
+
+    extra = {"media_url": [media_url]} if media_url else {}
+    try:
+        return await _async_twilio().messages.create_async(from_=from_, body=body, to=to, **extra)
+    finally:
+        metrics.observe("twilio_send", time.perf_counter() - sent_at)
+
+async def send_whatsapp_message_async(to: str, body: str) -> list:
+    """
+    asyncio version of send_whatsapp_message: same splitting and part headers,
+    sent with messages.create_async so no thread blocks on Twilio, and paced by
+    the same outbound governor as the threaded sender.
+
+    Parameters:
+      to (str): The recipient's WhatsApp number, prefixed by 'whatsapp:'.
+      body (str): The text content of the message.
+
+    Returns:
+      list: List of MessageInstance objects representing the sent messages.
+    """
+    try:
+        start = time.perf_counter()
+        chunks = split_message(body, Config.MAX_MSG_CHARS)
+        metrics.observe("split", time.perf_counter() - start)
+
+        if len(chunks) == 1:
+            message = await _create_message(to, body)
+            logger.info("📤 Sent WhatsApp message to %s: %s chars (SID: %s)", to, len(body), message.sid)
+            return [message]
+
+        messages = []
+        for i, chunk in enumerate(chunks, 1):
+            chunk_with_header = part_header(i, len(chunks)) + chunk
+            message = await _create_message(to, chunk_with_header)
+            messages.append(message)
+            logger.info("📤 Sent part %s/%s to %s: %s chars (SID: %s)", i, len(chunks), to, len(chunk_with_header),
+                        message.sid)
+
+        logger.info("📤 Completed sending %s parts to %s: total %s chars", len(chunks), to, len(body))
+        return messages
+
+    except Exception as e:
+        logger.error("❌ Failed to send WhatsApp message to %s: %s", to, e)
+        raise
+
+async def send_whatsapp_media_async(to: str, body: str, media_url: str):
+    """
+    asyncio version of send_whatsapp_media: one message with an attached file.
+
+    Returns:
+      MessageInstance: The sent message.
+    """
+    try:
+        message = await _create_message(to, body, media_url)
+        logger.info("📎 Sent WhatsApp media to %s: %s with %s chars (SID: %s)", to, media_url, len(body),
+                    message.sid)
+        return message
+    except Exception as e:
+        logger.error("❌ Failed to send WhatsApp media to %s: %s", to, e)
+        raise
@@ -0,0 +1,267 @@
+import csv
+import gzip
+import os
+import re
+import secrets
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+from app.settings.config import Config
+from app.utils.text_splitter import find_tables, split_message, utf16_len
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Files are named "<token>-<filename>.gz"; both parts come from URLs, so only allow safe characters
+_TOKEN = re.compile(r"^[A-Za-z0-9_-]{22}$")
+_FILENAME = re.compile(r"^[A-Za-z0-9_-]+\.(csv|txt)$")
+_CONTENT_TYPES = {"csv": "text/csv; charset=utf-8", "txt": "text/plain; charset=utf-8"}
+# Cells are separated by unescaped pipes
+_CELL_SPLIT = re.compile(r"(?<!\\)\|")
+_SEPARATOR_ROW = re.compile(r"^[\s|:-]+$")
+
+def _default_base_url() -> str:
+    """Origin of the public webhook URL, which Twilio can already reach."""
+    parts = urlsplit(Config.TWILIO_WEBHOOK_URL or "")
+    return f"{parts.scheme}://{parts.netloc}" if parts.netloc else ""
+
+def _table_rows(text: str, start: int, end: int) -> Iterator[List[str]]:
+    """Yield the cells of each row of the markdown table in text[start:end], skipping the separator row."""
+    position = start
+    while position < end:
+        line_end = text.find("\n", position, end)
+        if line_end < 0:
+            line_end = end
+        line = text[position:line_end].strip()
+        position = line_end + 1
+        if not line or _SEPARATOR_ROW.match(line):
+            continue
+        if line.startswith("|"):
+            line = line[1:]
+        if line.endswith("|") and not line.endswith("\\|"):
+            line = line[:-1]
+        yield [cell.strip().replace("\\|", "|") for cell in _CELL_SPLIT.split(line)]
+
+class Attachment:
+    """A generated file and the summary message that goes with it."""
+
+    __slots__ = ("url", "filename", "summary", "rows", "size")
+
+    def __init__(self, url: str, filename: str, summary: str, rows: int, size: int):
+        self.url = url
+        self.filename = filename
+        self.summary = summary
+        self.rows = rows    # data rows written (CSV), 0 for text files
+        self.size = size    # compressed bytes on disk
+
+class AttachmentStore:
+    """
+    Turns large AYD answers into one downloadable file plus a short summary.
+
+    Answers holding a markdown table with at least `min_table_rows` rows are
+    written to a CSV file (all large tables, separated by an empty row) and
+    summarized with the surrounding text and a few preview rows. Other
+    answers that would need more than `max_parts` WhatsApp messages are
+    written to a text file and summarized with their beginning. Files are
+    gzip-compressed while they are written, row by row, under an unguessable
+    name, and deleted after `ttl` seconds.
+    """
+
+    def __init__(self, directory: str = Config.ATTACHMENTS_DIR,
+                 base_url: str = Config.ATTACHMENTS_BASE_URL or _default_base_url(),
+                 min_table_rows: int = Config.ATTACHMENTS_MIN_TABLE_ROWS,
+                 max_parts: int = Config.ATTACHMENTS_MAX_PARTS,
+                 preview_rows: int = Config.ATTACHMENTS_PREVIEW_ROWS,
+                 ttl: float = Config.ATTACHMENTS_TTL,
+                 max_chars: int = Config.MAX_MSG_CHARS):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+        self.min_table_rows = max(1, min_table_rows)
+        self.max_parts = max(1, max_parts)
+        self.preview_rows = max(0, preview_rows)
+        self.ttl = ttl
+        self.max_chars = max_chars
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        if not self.base_url:
+            logger.warning("⚠️ Attachments enabled without ATTACHMENTS_BASE_URL or TWILIO_WEBHOOK_URL, "
+                           "Twilio will not be able to download files")
+
+        # Metrics
+        self.created = 0
+        self.bytes_written = 0
+        self.purged = 0
+
+    def prepare(self, text: str) -> Optional[Attachment]:
+        """
+        Write an attachment for the answer if it is large enough to need one.
+
+        Args:
+            text (str): The complete AYD answer
+
+        Returns:
+            Attachment: The file URL and summary, or None to send the answer as text
+        """
+        tables = [(start, end) for start, end in find_tables(text)
+                  if text.count("\n", start, end) - 1 >= self.min_table_rows]  # minus header and separator
+        if tables:
+            return self._write_csv(text, tables)
+        if utf16_len(text) > self.max_parts * self.max_chars:
+            return self._write_text(text)
+        return None
+
+    def _new_file(self, filename: str) -> Tuple[str, str, str]:
+        """Pick a token; return (token, final path, temporary path)."""
+        token = secrets.token_urlsafe(16)
+        path = os.path.join(self.directory, f"{token}-{filename}.gz")
+        return token, path, f"{path}.tmp"
+
+    def _publish(self, token: str, filename: str, path: str, tmp_path: str) -> Tuple[str, int]:
+        """Move a finished file into place; return its URL and size."""
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self.created += 1
+            self.bytes_written += size
+        self.purge_expired()
+        return f"{self.base_url}/attachments/{token}/{filename}", size
+
+    def _write_csv(self, text: str, tables: List[Tuple[int, int]]) -> Attachment:
+        filename = "results.csv"
+        token, path, tmp_path = self._new_file(filename)
+        rows = 0
+        summary_parts = []
+        previous_end = 0
+        with gzip.open(tmp_path, "wt", encoding="utf-8", newline="", compresslevel=6) as file:
+            writer = csv.writer(file)
+            for number, (start, end) in enumerate(tables):
+                if number:
+                    writer.writerow([])
+                table_rows = 0
+                preview = []
+                for cells in _table_rows(text, start, end):
+                    writer.writerow(cells)
+                    if table_rows <= self.preview_rows:  # header + preview rows
+                        preview.append(cells)
+                    table_rows += 1
+                data_rows = max(0, table_rows - 1)
+                rows += data_rows
+
+                summary_parts.append(text[previous_end:start])
+                summary_parts.append(self._preview(preview, data_rows))
+                previous_end = end
+        summary_parts.append(text[previous_end:])
+
+        url, size = self._publish(token, filename, path, tmp_path)
+        note = f"📎 Full results ({rows:,} rows) are in the attached {filename}."
+        logger.info("📎 Wrote %s with %s rows (%s bytes compressed) for a %s-char answer", filename, rows, size, len(text))
+        return Attachment(url, filename, self._summary("".join(summary_parts), note), rows, size)
+
+    def _write_text(self, text: str) -> Attachment:
+        filename = "answer.txt"
+        token, path, tmp_path = self._new_file(filename)
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as file:
+            file.write(text)
+
+        url, size = self._publish(token, filename, path, tmp_path)
+        note = f"📎 The full answer ({len(text):,} characters) is in the attached {filename}."
+        logger.info("📎 Wrote %s (%s bytes compressed) for a %s-char answer", filename, size, len(text))
+        return Attachment(url, filename, self._summary(text, note), 0, size)
+
+    @staticmethod
+    def _preview(rows: List[List[str]], data_rows: int) -> str:
+        """A short markdown table: the header and the first rows."""
+        if not rows:
+            return ""
+        lines = ["| " + " | ".join(rows[0]) + " |", "|" + "---|" * len(rows[0])]
+        lines += ["| " + " | ".join(cells) + " |" for cells in rows[1:]]
+        shown = len(rows) - 1
+        if data_rows > shown:
+            lines.append(f"… {data_rows - shown:,} more rows")
+        return "\n".join(lines)
+
+    def _summary(self, text: str, note: str) -> str:
+        """Fit the text and the note into one message, cutting the text at a natural break."""
+        note = "\n\n" + note
+        budget = self.max_chars - utf16_len(note)
+        text = text.strip()
+        if utf16_len(text) > budget:
+            text = split_message(text, budget)[0].rstrip() + " …"
+            if utf16_len(text) > budget:  # split_message reserved header space, so this is rare
+                text = text[:max(0, budget - 2)] + " …"
+        return text + note
+
+    def open(self, token: str, filename: str) -> Optional[Tuple[str, str]]:
+        """
+        Look up a file served at /attachments/<token>/<filename>.
+
+        Returns:
+            tuple: (path of the gzip file, content type), or None if unknown or expired
+        """
+        match = _FILENAME.match(filename)
+        if not _TOKEN.match(token) or not match:
+            return None
+        path = os.path.join(self.directory, f"{token}-{filename}.gz")
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+        except OSError:
+            return None
+        return path, _CONTENT_TYPES[match.group(1)]
+
+    def purge_expired(self, interval: float = 300) -> int:
+        """
+        Delete files older than the TTL, at most once per `interval` seconds.
+
+        Returns:
+            int: Number of deleted files
+        """
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < interval:
+                return 0
+            self._last_purge = now
+
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and now - entry.stat().st_mtime > self.ttl:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    continue  # Removed by another process in the meantime
+        if removed:
+            with self._lock:
+                self.purged += removed
+            logger.info("🧹 Deleted %s expired attachments", removed)
+        return removed
+
+    def get_stats(self) -> dict:
+        """
+        Snapshot of attachment metrics.
+
+        Returns:
+            dict: Files created, compressed bytes written and expired files deleted
+        """
+        with self._lock:
+            return {
+                "created": self.created,
+                "bytes_written": self.bytes_written,
+                "purged": self.purged,
+            }
+
+def iter_file(path: str, chunk_size: int = 65536, decompress: bool = False) -> Iterator[bytes]:
+    """Yield a stored file in chunks, decompressed for clients that don't accept gzip."""
+    opener = gzip.open if decompress else open
+    with opener(path, "rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+# Global attachment store (None unless enabled)
+attachment_store = AttachmentStore() if Config.ATTACHMENTS_ENABLED else None
@@ -0,0 +1,258 @@
+import atexit
+import heapq
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+from app.settings.config import Config
+from app.utils.metrics import metrics
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class MessageDispatcher:
+    """
+    Bounded worker pool for processing incoming WhatsApp messages.
+
+    - A fixed number of worker threads replaces the thread-per-webhook model.
+    - The total number of queued messages is bounded; submit() returns False when
+      the queue is full so the webhook can answer with a "busy" reply instead.
+    - Messages from the same user run one at a time, in arrival order, while
+      different users are served round-robin.
+    - An item can be held back for a while (submit(..., delay=...)) and extended
+      in place with merge() until then, so messages a user sends in quick
+      succession are answered together.
+    - shutdown() stops accepting work and drains what is already queued.
+    """
+
+    def __init__(self, workers: int = Config.DISPATCHER_WORKERS,
+                 max_queue_size: int = Config.DISPATCHER_MAX_QUEUE_SIZE):
+        self.workers = max(1, workers)
+        self.max_queue_size = max(1, max_queue_size)
+        self._cond = threading.Condition()
+        self._user_queues: Dict[str, deque] = {}  # pending items per user (present while ready or active)
+        self._ready = deque()                     # users with pending items and no running item
+        self._active = set()                      # users with an item currently running
+        self._held = []                           # heap of (ready_at, key): users whose next item is held back
+        self._depth = 0
+        self._accepting = True
+        self._stopping = False
+        self._threads = []
+
+        # Metrics
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._merged = 0
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _ensure_started_unsafe(self):
+        """
+        Start the worker threads on first use. NOT thread-safe - must be called within the condition.
+        Starting lazily keeps the dispatcher safe to import before a pre-fork server forks.
+        """
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"dispatcher-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("🧵 Started dispatcher with %s workers, queue size %s", self.workers, self.max_queue_size)
+
+    def _schedule_unsafe(self, key: str):
+        """
+        Make a user with pending items eligible to run: ready now, or held until
+        its next item's ready time. NOT thread-safe - must be called within the condition.
+        """
+        ready_at = self._user_queues[key][0][3]
+        if self._accepting and ready_at > time.monotonic():
+            heapq.heappush(self._held, (ready_at, key))
+        else:
+            self._ready.append(key)
+        self._cond.notify()  # a waiting worker runs it, or shortens its wait to the ready time
+
+    def _release_held_unsafe(self):
+        """Move users whose held item is due (all of them once shutting down) to the ready queue."""
+        now = time.monotonic()
+        while self._held and (self._held[0][0] <= now or not self._accepting):
+            _, key = heapq.heappop(self._held)
+            ready_at = self._user_queues[key][0][3]
+            if self._accepting and ready_at > now:
+                # Extended by merge() since it was pushed
+                heapq.heappush(self._held, (ready_at, key))
+            else:
+                self._ready.append(key)
+
+    def submit(self, key: str, func: Callable, *args, delay: float = 0.0) -> bool:
+        """
+        Queue func(*args) for execution, ordered after earlier items with the same key.
+
+        Args:
+            key (str): Ordering key (phone number)
+            func (Callable): Function to run on a worker thread
+            delay (float): Seconds to hold the item back; held items accept merge() until they run
+
+        Returns:
+            bool: True if queued, False if the queue is full or shutting down
+        """
+        with self._cond:
+            if not self._accepting or self._depth >= self.max_queue_size:
+                self._rejected += 1
+                return False
+
+            self._ensure_started_unsafe()
+
+            now = time.monotonic()
+            item = [now, func, args, now + delay if delay > 0 else 0.0]
+            queue = self._user_queues.get(key)
+            if queue is None:
+                queue = deque()
+                self._user_queues[key] = queue
+                queue.append(item)
+                self._schedule_unsafe(key)
+            else:
+                queue.append(item)
+
+            self._depth += 1
+            self._submitted += 1
+            return True
+
+    def merge(self, key: str, merge: Callable[..., Optional[float]]) -> bool:
+        """
+        Fold new work into the user's last queued item, if it is still held back.
+
+        merge(*args) is called with that item's arguments, under the dispatcher's
+        lock, and returns the item's new ready time (time.monotonic() based) or
+        None to decline.
+
+        Args:
+            key (str): Ordering key (phone number)
+            merge (Callable): Updates the held item's arguments in place
+
+        Returns:
+            bool: True if merged, False if there is no held item or merge() declined
+        """
+        with self._cond:
+            queue = self._user_queues.get(key)
+            if not self._accepting or not queue or not queue[-1][3]:
+                return False
+            item = queue[-1]
+            ready_at = merge(*item[2])
+            if ready_at is None:
+                return False
+            item[3] = ready_at
+            self._merged += 1
+            return True
+
+    def _worker(self):
+        """Worker loop: take the next ready user, run one of its items, requeue the user if needed."""
+        while True:
+            with self._cond:
+                while True:
+                    self._release_held_unsafe()
+                    if self._ready or self._stopping:
+                        break
+                    self._cond.wait(self._held[0][0] - time.monotonic() if self._held else None)
+                if not self._ready:
+                    return
+
+                if self._held:
+                    self._cond.notify()  # hand the wait for held items to an idle worker
+
+                key = self._ready.popleft()
+                enqueued_at, func, args, ready_at = self._user_queues[key].popleft()
+                self._active.add(key)
+                self._depth -= 1
+
+                # Time spent held back on purpose isn't queueing delay
+                wait = max(0.0, time.monotonic() - max(enqueued_at, ready_at))
+                self._wait_count += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+            metrics.observe("queue_wait", wait)
+
+            failed = False
+            try:
+                func(*args)
+            except Exception as e:
+                failed = True
+                logger.error("❌ Dispatcher task failed for %s: %s", key, e)
+
+            with self._cond:
+                self._active.discard(key)
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+
+                if self._user_queues[key]:
+                    # Back of the line, so other users get their turn
+                    self._schedule_unsafe(key)
+                else:
+                    del self._user_queues[key]
+                    if not self._user_queues:
+                        self._cond.notify_all()  # wake up a draining shutdown()
+
+    def shutdown(self, timeout: float = Config.DISPATCHER_DRAIN_TIMEOUT) -> bool:
+        """
+        Stop accepting new messages and wait for queued and running ones to finish.
+
+        Args:
+            timeout (float): Maximum seconds to wait for the queue to drain
+
+        Returns:
+            bool: True if everything drained, False if the timeout expired first
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._accepting = False
+            self._cond.notify_all()  # held items run right away
+            if self._user_queues:
+                logger.info("⏳ Draining dispatcher: %s queued, %s running", self._depth, len(self._active))
+            while self._user_queues:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            drained = not self._user_queues
+            self._stopping = True
+            self._cond.notify_all()
+
+        if drained:
+            logger.info("✅ Dispatcher drained")
+        else:
+            logger.warning("⚠️ Dispatcher drain timed out with %s messages still queued", self._depth)
+        return drained
+
+    def get_stats(self) -> dict:
+        """
+        Snapshot of queue depth and wait-time metrics.
+
+        Returns:
+            dict: Counters, current depth and queue wait statistics (seconds)
+        """
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "max_queue_size": self.max_queue_size,
+                "queue_depth": self._depth,
+                "active": len(self._active),
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "completed": self._completed,
+                "failed": self._failed,
+                "merged": self._merged,
+                "wait_avg": self._wait_total / self._wait_count if self._wait_count else 0.0,
+                "wait_max": self._wait_max,
+            }
+
+# Global dispatcher instance
+dispatcher = MessageDispatcher(
+    workers=Config.DISPATCHER_WORKERS,
+    max_queue_size=Config.DISPATCHER_MAX_QUEUE_SIZE
+)
+atexit.register(dispatcher.shutdown)
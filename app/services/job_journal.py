@@ -0,0 +1,422 @@
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional
+from app.settings.config import Config
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Job states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+REJECTED = "rejected"
+FAILED = "failed"
+
+class _Write:
+    """One statement waiting for the writer thread, plus its outcome for the caller."""
+
+    __slots__ = ("sql", "params", "done", "result", "error")
+
+    def __init__(self, sql: str, params: tuple):
+        self.sql = sql
+        self.params = params
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class JobJournal:
+    """
+    Durable SQLite journal of accepted webhook messages.
+
+    Every message is recorded before the TwiML acknowledgement goes out, marked
+    done once its reply was sent, and replayed if its owning process died
+    before finishing. Writes go through a single writer thread that
+    group-commits: concurrent webhook requests arriving within
+    `commit_interval` share one transaction, and therefore one fsync.
+
+    Unfinished jobs are leased: the writer thread refreshes `updated_at` of
+    its process's jobs every lease / 3 seconds, and a job whose lease is
+    older than `lease` seconds belongs to a process that is gone, whatever
+    host, container or PID it ran under. Such a job is taken over, or marked
+    failed once it was attempted `max_attempts` times, so a message that
+    crashes its worker is not retried forever.
+    """
+
+    def __init__(self, db_path: str = Config.JOB_JOURNAL_PATH,
+                 commit_interval: float = Config.JOB_JOURNAL_COMMIT_INTERVAL_MS / 1000,
+                 batch_size: int = Config.JOB_JOURNAL_BATCH_SIZE,
+                 lease: float = Config.JOB_JOURNAL_LEASE,
+                 max_attempts: int = Config.JOB_JOURNAL_MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.commit_interval = commit_interval
+        self.batch_size = max(1, batch_size)
+        self.lease = lease
+        self.max_attempts = max(1, max_attempts)
+        self.owner = self._new_owner()
+        self._writes = queue.Queue()
+        self._writer = None
+        self._writer_pid = None
+        self._start_lock = threading.Lock()
+        self._local = threading.local()
+
+        # Metrics
+        self.commits = 0
+        self.committed_writes = 0
+
+        self._ensure_schema()
+
+    @staticmethod
+    def _new_owner() -> str:
+        """Owner id of this process: "host:pid:token", unique even when a PID is reused."""
+        return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")  # a committed job survives power loss
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _ensure_schema(self):
+        conn = self._connection()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                sender       TEXT NOT NULL,
+                phone_number TEXT NOT NULL,
+                body         TEXT NOT NULL,
+                status       TEXT NOT NULL,
+                owner        TEXT NOT NULL,
+                attempts     INTEGER NOT NULL DEFAULT 0,
+                created_at   REAL NOT NULL,
+                updated_at   REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_phone_status ON jobs (phone_number, status)")
+
+    def _ensure_writer(self):
+        """Start the writer thread on first use in each process (fork safe)."""
+        if self._writer_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._writer_pid != os.getpid():
+                self.owner = self._new_owner()
+                self._writes = queue.Queue()
+                self._writer = threading.Thread(target=self._write_loop, name="job-journal-writer", daemon=True)
+                self._writer.start()
+                self._writer_pid = os.getpid()
+
+    def _write_loop(self):
+        """
+        Writer thread: collect writes for up to commit_interval and commit them
+        together, and renew the lease of this process's jobs along the way.
+        """
+        conn = self._connection()
+        heartbeat_interval = self.lease / 3
+        next_heartbeat = time.monotonic() + heartbeat_interval
+        while True:
+            try:
+                batch = [self._writes.get(timeout=max(0.0, next_heartbeat - time.monotonic()))]
+            except queue.Empty:
+                batch = []
+            deadline = time.monotonic() + self.commit_interval
+            while batch and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._writes.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            if time.monotonic() >= next_heartbeat:
+                batch.append(_Write(
+                    "UPDATE jobs SET updated_at = ? WHERE owner = ? AND status IN (?, ?)",
+                    (time.time(), self.owner, PENDING, RUNNING)
+                ))
+                next_heartbeat = time.monotonic() + heartbeat_interval
+            if not batch:
+                continue  # woke up a little before the heartbeat was due
+
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for write in batch:
+                    write.result = conn.execute(write.sql, write.params).lastrowid
+                conn.execute("COMMIT")
+                self.commits += 1
+                self.committed_writes += len(batch)
+            except Exception as e:
+                logger.error("❌ Job journal commit of %s writes failed: %s", len(batch), e)
+                try:
+                    conn.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+                for write in batch:
+                    write.error = e
+
+            for write in batch:
+                write.done.set()
+
+    def _submit(self, sql: str, params: tuple, wait: bool):
+        self._ensure_writer()
+        write = _Write(sql, params)
+        self._writes.put(write)
+        if not wait:
+            return None
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def append(self, sender: str, phone_number: str, body: str) -> int:
+        """
+        Durably record an accepted message. Blocks until its group commit finished.
+
+        Returns:
+            int: Job id
+        """
+        self._ensure_writer()  # sets the owner of a freshly forked process
+        now = time.time()
+        return self._submit(
+            "INSERT INTO jobs (sender, phone_number, body, status, owner, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (sender, phone_number, body, PENDING, self.owner, now, now),
+            wait=True
+        )
+
+    def set_status(self, job_id: int, status: str, wait: bool = False):
+        """
+        Update a job's status. By default the update rides along with the next
+        group commit without blocking the caller.
+        """
+        self._submit(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+            (status, time.time(), job_id),
+            wait=wait
+        )
+
+    def mark_done(self, *job_ids: int):
+        """Mark jobs finished (reply sent, or error reported to the user). Waits for the commit."""
+        for job_id in job_ids[:-1]:
+            self.set_status(job_id, DONE)
+        # The writer commits in order, so the last one's commit covers the others
+        self.set_status(job_ids[-1], DONE, wait=True)
+
+    def claim_next(self, merge_window: float = Config.MERGE_WINDOW, max_wait: float = Config.MERGE_MAX_WAIT,
+                   max_messages: int = Config.MERGE_MAX_MESSAGES) -> Optional[dict]:
+        """
+        Claim the oldest pending job for out-of-process workers.
+
+        Jobs of a phone number that already has a running job are skipped, so
+        each user's messages are still processed one at a time, in order.
+
+        With a merge window, a user's pending messages are claimed together
+        (up to max_messages) once none arrived for merge_window seconds, or
+        the oldest has waited max_wait seconds, and answered as one question.
+
+        Returns:
+            dict: Claimed job (id, ids, sender, phone_number, body), or None if nothing is ready
+        """
+        self._ensure_writer()
+        conn = self._connection()
+        # Plain read first: idle workers must not take the database write lock on every poll
+        if conn.execute("SELECT 1 FROM jobs WHERE status = ? LIMIT 1", (PENDING,)).fetchone() is None:
+            return None
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if merge_window > 0:
+                row = conn.execute(
+                    """
+                    SELECT id, sender, phone_number FROM jobs AS j
+                    WHERE status = ? AND NOT EXISTS (
+                        SELECT 1 FROM jobs AS r WHERE r.phone_number = j.phone_number AND r.status = ?
+                    ) AND (
+                        created_at <= ? OR NOT EXISTS (
+                            SELECT 1 FROM jobs AS n
+                            WHERE n.phone_number = j.phone_number AND n.status = ? AND n.created_at > ?
+                        ) OR (
+                            SELECT COUNT(*) FROM jobs AS c WHERE c.phone_number = j.phone_number AND c.status = ?
+                        ) >= ?
+                    )
+                    ORDER BY id LIMIT 1
+                    """,
+                    (PENDING, RUNNING, now - max(merge_window, max_wait), PENDING, now - merge_window,
+                     PENDING, max_messages)
+                ).fetchone()
+                jobs = [] if row is None else conn.execute(
+                    "SELECT id, body FROM jobs WHERE phone_number = ? AND status = ? ORDER BY id LIMIT ?",
+                    (row[2], PENDING, max(1, max_messages))
+                ).fetchall()
+            else:
+                row = conn.execute(
+                    """
+                    SELECT id, sender, phone_number, body FROM jobs AS j
+                    WHERE status = ? AND NOT EXISTS (
+                        SELECT 1 FROM jobs AS r WHERE r.phone_number = j.phone_number AND r.status = ?
+                    )
+                    ORDER BY id LIMIT 1
+                    """,
+                    (PENDING, RUNNING)
+                ).fetchone()
+                jobs = [] if row is None else [(row[0], row[3])]
+            for job_id, _ in jobs:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (RUNNING, self.owner, now, job_id)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if row is None:
+            return None
+        return {
+            "id": jobs[0][0],
+            "ids": [job_id for job_id, _ in jobs],
+            "sender": row[1],
+            "phone_number": row[2],
+            "body": "\n".join(body for _, body in jobs if body),
+        }
+
+    def requeue_process(self, pid: int) -> int:
+        """
+        Put the running jobs of a dead worker process on this host back to
+        pending, or mark them failed once they were attempted max_attempts times.
+
+        Returns:
+            int: Number of requeued jobs
+        """
+        prefix = f"{socket.gethostname()}:{pid}:"
+        return self._requeue("substr(owner, 1, ?) = ?", (len(prefix), prefix))
+
+    def _requeue(self, where: str, params: tuple) -> int:
+        """
+        Put running jobs matching `where` back to pending, or mark them failed
+        once they were attempted max_attempts times.
+
+        Returns:
+            int: Number of requeued jobs
+        """
+        conn = self._connection()
+        now = time.time()
+        failed = conn.execute(
+            f"UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND attempts >= ? AND {where}",
+            (FAILED, now, RUNNING, self.max_attempts) + params
+        ).rowcount
+        if failed:
+            logger.warning("☠️ Gave up on %s jobs after %s attempts", failed, self.max_attempts)
+        return conn.execute(
+            f"UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND {where}",
+            (PENDING, now, RUNNING) + params
+        ).rowcount
+
+    def requeue_dead_owners(self) -> int:
+        """
+        Put running jobs whose lease expired (their process is gone) back to pending.
+
+        Returns:
+            int: Number of requeued jobs
+        """
+        return self._requeue("updated_at < ?", (time.time() - self.lease,))
+
+    def pending_count(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ?", (PENDING,)
+        ).fetchone()[0]
+
+    def open_batch_size(self, phone_number: str, merge_window: float = Config.MERGE_WINDOW,
+                        max_wait: float = Config.MERGE_MAX_WAIT) -> int:
+        """
+        Pending messages of a user that a new message would still be merged
+        with by claim_next(): the newest is less than merge_window seconds old
+        and the oldest less than max_wait.
+
+        Returns:
+            int: Number of such pending messages, 0 if there is no open batch
+        """
+        count, oldest, newest = self._connection().execute(
+            "SELECT COUNT(*), MIN(created_at), MAX(created_at) FROM jobs WHERE phone_number = ? AND status = ?",
+            (phone_number, PENDING)
+        ).fetchone()
+        now = time.time()
+        if count and newest > now - merge_window and oldest > now - max(merge_window, max_wait):
+            return count
+        return 0
+
+    def claim_orphans(self) -> List[dict]:
+        """
+        Take over unfinished jobs whose lease expired (their process is gone).
+        Jobs already attempted max_attempts times are marked failed instead.
+
+        Claiming is a compare-and-set on the owner and lease, so when several
+        workers look at once each orphaned job is replayed by exactly one of them.
+
+        Returns:
+            list: Claimed jobs (id, sender, phone_number, body), oldest first
+        """
+        self._ensure_writer()
+        conn = self._connection()
+        rows = conn.execute(
+            "SELECT id, sender, phone_number, body, owner, attempts, updated_at FROM jobs "
+            "WHERE status IN (?, ?) AND updated_at < ? ORDER BY id",
+            (PENDING, RUNNING, time.time() - self.lease)
+        ).fetchall()
+
+        claimed = []
+        for job_id, sender, phone_number, body, owner, attempts, updated_at in rows:
+            if attempts >= self.max_attempts:
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND owner = ? AND updated_at = ?",
+                    (FAILED, time.time(), job_id, owner, updated_at)
+                )
+                if cursor.rowcount:
+                    logger.warning("☠️ Gave up on job %s from %s after %s attempts", job_id, phone_number, attempts)
+                continue
+            cursor = conn.execute(
+                "UPDATE jobs SET owner = ?, status = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND updated_at = ?",
+                (self.owner, PENDING, time.time(), job_id, owner, updated_at)
+            )
+            if cursor.rowcount:
+                claimed.append({"id": job_id, "sender": sender, "phone_number": phone_number, "body": body})
+        return claimed
+
+    def purge(self, older_than: float = Config.JOB_JOURNAL_RETENTION):
+        """Delete finished jobs older than the given number of seconds."""
+        self._connection().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?, ?) AND updated_at < ?",
+            (DONE, REJECTED, FAILED, time.time() - older_than)
+        )
+
+    def get_stats(self) -> dict:
+        """
+        Snapshot of group-commit metrics.
+
+        Returns:
+            dict: Commits, committed writes, average writes per commit and queued writes
+        """
+        return {
+            "commits": self.commits,
+            "committed_writes": self.committed_writes,
+            "writes_per_commit": self.committed_writes / self.commits if self.commits else 0.0,
+            "queued_writes": self._writes.qsize(),
+        }
+
+# Global job journal instance (None unless JOB_JOURNAL_ENABLED; external workers always need it)
+job_journal = JobJournal() if Config.JOB_JOURNAL_ENABLED or Config.WORKER_MODE == "external" else None
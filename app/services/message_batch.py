@@ -0,0 +1,81 @@
+import threading
+import time
+from typing import List, Optional
+from app.settings.config import Config
+
+class MessageBatch:
+    """
+    Messages from one user that are answered as a single AYD question.
+
+    A batch stays open while messages keep arriving less than `window`
+    seconds apart, but never longer than `max_wait` seconds after its first
+    message or beyond `max_messages` messages. add() is called by whoever
+    owns the batch's queue entry (under the dispatcher's lock, or on the event
+    loop); the journal job id of a merged message may be attached after the
+    batch was answered, in which case attach_job() tells the caller to mark
+    the job done itself.
+    """
+
+    __slots__ = ("sender", "phone_number", "window", "max_wait", "max_messages",
+                 "bodies", "job_ids", "first_at", "last_at", "finished", "lock")
+
+    def __init__(self, sender: str, phone_number: str, body: str, job_id: Optional[int] = None,
+                 window: float = Config.MERGE_WINDOW, max_wait: float = Config.MERGE_MAX_WAIT,
+                 max_messages: int = Config.MERGE_MAX_MESSAGES):
+        self.sender = sender
+        self.phone_number = phone_number
+        self.window = window
+        self.max_wait = max(window, max_wait)
+        self.max_messages = max(1, max_messages)
+        self.bodies = [body]
+        self.job_ids = [job_id]
+        self.first_at = self.last_at = time.monotonic()
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def deadline(self) -> float:
+        """Monotonic time at which the batch closes, unless another message extends it."""
+        return min(self.last_at + self.window, self.first_at + self.max_wait)
+
+    def add(self, body: str) -> Optional[int]:
+        """
+        Merge a message into the batch if it is still open.
+
+        Returns:
+            int: Index of the message (for attach_job), or None if the batch is closed or full
+        """
+        now = time.monotonic()
+        if now >= self.deadline() or len(self.bodies) >= self.max_messages:
+            return None
+        self.bodies.append(body)
+        self.job_ids.append(None)
+        self.last_at = now
+        return len(self.bodies) - 1
+
+    def attach_job(self, index: int, job_id: int) -> bool:
+        """
+        Record the journal job of a merged message.
+
+        Returns:
+            bool: False if the batch was already answered (the caller marks the job done)
+        """
+        with self.lock:
+            if self.finished:
+                return False
+            self.job_ids[index] = job_id
+            return True
+
+    def text(self) -> str:
+        """The merged question: the messages in arrival order, one per line."""
+        return "\n".join(body for body in self.bodies if body)
+
+    def finish(self) -> List[int]:
+        """
+        Mark the batch answered.
+
+        Returns:
+            list: Journal job ids of its messages known so far
+        """
+        with self.lock:
+            self.finished = True
+            return [job_id for job_id in self.job_ids if job_id is not None]
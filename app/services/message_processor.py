@@ -1,23 +1,364 @@
+import threading
 import time
+from typing import Callable, Optional
+from app.settings.config import Config
 from app.services.simple_ayd_client import SessionBasedAYDClient
-from app.utils.logger import get_logger
+from app.services.answer_cache import answer_cache, normalize_question
+from app.services.twilio_client import send_whatsapp_message, send_whatsapp_media, twilio_sender, WhatsAppStream
+from app.services.attachments import attachment_store
+from app.services.job_journal import job_journal, REJECTED
+from app.services.dispatcher import dispatcher
+from app.services.message_batch import MessageBatch
+from app.services.session_renewer import SessionRenewer
+from app.utils.single_flight import SingleFlight
+from app.utils.idempotency import idempotency_store
+from app.utils.upstream_guard import ayd_guard
+from app.utils.metrics import metrics
+from app.utils.logger import get_logger, get_logging_stats
 
 # Initialize session-based AYD client
 session_ayd = SessionBasedAYDClient()
+# Renews sessions ahead of expiry (None unless enabled, started by the app factory)
+session_renewer = SessionRenewer(session_ayd) if Config.SESSION_RENEWER_ENABLED else None
+# Shares one AYD call between concurrent identical questions (None unless enabled)
+request_coalescer = SingleFlight() if Config.REQUEST_COALESCING_ENABLED else None
+# Thread replaying journal jobs of processes that died while this one runs
+_reclaimer = None
 logger = get_logger(__name__)
 
-def process_incoming(phone_number: str, text: str) -> dict:
+def _ask(phone_number: str, text: str, on_text: Optional[Callable[[str], None]]) -> dict:
+    """
+    Ask AYD, joining an identical question that is already in flight when
+    request coalescing is enabled. The leader streams through its own on_text;
+    callers that joined receive the complete answer once it is ready.
+
+    Calls are shared within the answer cache's scope: with ANSWER_CACHE_SCOPE=user
+    only between messages of the same user; with the chatbot scope across users,
+    in which case the answer comes from the leader's conversation session.
+    """
+    if request_coalescer is None:
+        return session_ayd.ask_with_session(phone_number, text, on_text=on_text)
+
+    scope_id = phone_number if Config.ANSWER_CACHE_SCOPE == "user" else Config.AYD_CHAT_ID
+    key = (scope_id, normalize_question(text))
+    result, shared = request_coalescer.do(
+        key, session_ayd.ask_with_session, phone_number, text, on_text,
+        max_age=Config.REQUEST_COALESCING_WINDOW
+    )
+    if not shared:
+        return result
+
+    logger.info("🔗 Coalesced question from %s with an in-flight AYD call", phone_number)
+    if on_text and result.get("success"):
+        on_text(result["aiResponse"])
+    return {**result, "coalesced": True}
+
+def process_incoming(phone_number: str, text: str, on_text: Optional[Callable[[str], None]] = None) -> dict:
     """
     Process incoming WhatsApp message with session-based conversation support.
     Simple approach: just get the response and return it.
+    Pass on_text to receive the answer's text chunks while they stream in.
+    Repeated questions are answered from the answer cache when it is enabled.
     """
-    logger.info(f"📱 Processing message from {phone_number}: {text[:50]}{'...' if len(text) > 50 else ''}")
+    logger.info("📱 Processing message from %s: %s%s", phone_number, text[:50], '...' if len(text) > 50 else '')
+    
+    bypass_cache = False
+    if answer_cache is not None:
+        text, bypass_cache = answer_cache.strip_bypass(text)
+        if bypass_cache and not text:
+            # Only the keyword, nothing to ask
+            return {
+                "success": False,
+                "error": "EmptyQuestion",
+                "aiResponse": f"Please add your question, e.g. \"{Config.ANSWER_CACHE_BYPASS_KEYWORD} how many orders today?\""
+            }
+        if not bypass_cache:
+            cached = answer_cache.get(phone_number, text)
+            if cached is not None:
+                logger.info("⚡ Answer cache hit for %s: %s chars", phone_number, len(cached))
+                if on_text:
+                    on_text(cached)
+                return {
+                    "success": True,
+                    "aiResponse": cached,
+                    "cached": True
+                }
     
     # Call AYD with session context
     start = time.time()
-    result = session_ayd.ask_with_session(phone_number, text)
+    result = _ask(phone_number, text, on_text)
     duration = time.time() - start
     
-    logger.info(f"🔍 AYD call took {duration:.2f}s, success={result.get('success')}")
+    logger.info("🔍 AYD call took %.2fs, success=%s", duration, result.get('success'))
+    
+    if answer_cache is not None and result.get("success"):
+        answer_cache.put(phone_number, text, result["aiResponse"])
     
     return result
+
+def handle_incoming(sender: str, phone_number: str, body: str):
+    """
+    Full processing of one incoming message: ask AYD and send the reply back.
+    Runs on a dispatcher worker thread; errors are reported to the user.
+
+    Args:
+        sender (str): Original Twilio sender ("whatsapp:+15551234567"), used to reply
+        phone_number (str): Sender without the "whatsapp:" prefix, used for sessions
+        body (str): Message text
+    """
+    start = time.perf_counter()
+    try:
+        if Config.STREAMING_DELIVERY:
+            _handle_incoming_streaming(sender, phone_number, body)
+            return
+
+        result = process_incoming(phone_number, body)
+        
+        if result.get("success"):
+            reply = result.get("aiResponse", "Sorry, I couldn't process your message.")
+            if _send_as_attachment(sender, phone_number, reply):
+                return
+        else:
+            reply = result.get("aiResponse", "Sorry, something went wrong. Please try again.")
+        
+        # Send reply back to user
+        send_whatsapp_message(to=sender, body=reply)  # Use original sender format for Twilio
+        logger.info("✅ Sent reply to %s: %s chars", phone_number, len(reply))
+        
+    except Exception as e:
+        logger.error("❌ Error in background task for %s: %s", phone_number, e)
+        # Send error message to user
+        error_reply = "Sorry, I encountered an error processing your message. Please try again."
+        try:
+            send_whatsapp_message(to=sender, body=error_reply)
+        except Exception as send_error:
+            logger.error("❌ Failed to send error message: %s", send_error)
+    finally:
+        metrics.observe("processing", time.perf_counter() - start)
+
+def _send_as_attachment(sender: str, phone_number: str, reply: str) -> bool:
+    """
+    Send a large table or very long answer as one file plus a summary message
+    instead of many text parts (when attachments are enabled).
+
+    Returns:
+        bool: True if the reply was sent this way, False to send it as text
+    """
+    if attachment_store is None:
+        return False
+    try:
+        attachment = attachment_store.prepare(reply)
+    except Exception as e:
+        logger.error("❌ Failed to write attachment for %s, sending text instead: %s", phone_number, e)
+        return False
+    if attachment is None:
+        return False
+
+    send_whatsapp_media(to=sender, body=attachment.summary, media_url=attachment.url)
+    logger.info("✅ Sent reply to %s as %s (%s chars, %s bytes) with a %s-char summary", phone_number,
+                attachment.filename, len(reply), attachment.size, len(attachment.summary))
+    return True
+
+def _handle_incoming_streaming(sender: str, phone_number: str, body: str):
+    """
+    Streaming variant of handle_incoming: WhatsApp parts are sent while the AYD
+    answer is still being generated. Errors propagate to handle_incoming.
+    """
+    stream = WhatsAppStream(to=sender)
+    result = process_incoming(phone_number, body, on_text=stream.feed)
+
+    if result.get("success"):
+        parts = stream.close()
+        if parts:
+            logger.info("✅ Streamed reply to %s in %s parts", phone_number, parts)
+            return
+        # Nothing was streamed (empty answer), fall back to the regular reply
+        reply = result.get("aiResponse", "Sorry, I couldn't process your message.")
+    elif stream.parts_sent:
+        # The answer broke off after some parts were already delivered
+        reply = "Sorry, I couldn't finish this answer. Please try again."
+    else:
+        reply = result.get("aiResponse", "Sorry, something went wrong. Please try again.")
+
+    send_whatsapp_message(to=sender, body=reply)
+    logger.info("✅ Sent reply to %s: %s chars", phone_number, len(reply))
+
+def handle_job(job_id: int, sender: str, phone_number: str, body: str):
+    """
+    Process a journaled message and mark its job done afterwards, so it is not
+    replayed after a restart. handle_incoming reports its own errors to the user.
+    """
+    handle_incoming(sender, phone_number, body)
+    job_journal.mark_done(job_id)
+
+def handle_batch(batch: MessageBatch):
+    """
+    Answer the messages a user sent within the merge window as one question,
+    then mark their journaled jobs done.
+    """
+    if len(batch.bodies) > 1:
+        logger.info("🧩 Answering %s merged messages from %s as one question", len(batch.bodies), batch.phone_number)
+    try:
+        handle_incoming(batch.sender, batch.phone_number, batch.text())
+    finally:
+        job_ids = batch.finish()
+        if job_journal is not None and job_ids:
+            job_journal.mark_done(*job_ids)
+
+def merge_message(sender: str, phone_number: str, body: str) -> bool:
+    """
+    Add a message to the user's previous one if that is still waiting in its
+    merge window (MERGE_WINDOW > 0), so both are asked as one question.
+    Merged messages skip the rate limit and the queue-size check: they cost
+    no extra AYD call.
+
+    Returns:
+        bool: True if merged (nothing left to do), False to enqueue the message normally
+    """
+    if Config.MERGE_WINDOW <= 0:
+        return False
+
+    if Config.WORKER_MODE == "external":
+        try:
+            if not 0 < job_journal.open_batch_size(phone_number) < Config.MERGE_MAX_MESSAGES:
+                return False
+            # claim_next() merges it with the user's other pending jobs
+            job_journal.append(sender, phone_number, body)
+            return True
+        except Exception as e:
+            logger.error("❌ Failed to merge message from %s: %s", phone_number, e)
+            return False
+
+    merged = []
+    def add(batch: MessageBatch) -> Optional[float]:
+        index = batch.add(body)
+        if index is None:
+            return None
+        merged.append((batch, index))
+        return batch.deadline()
+
+    if not dispatcher.merge(phone_number, add):
+        return False
+
+    if job_journal is not None:
+        batch, index = merged[0]
+        try:
+            job_id = job_journal.append(sender, phone_number, body)
+        except Exception as e:
+            logger.error("❌ Failed to journal message from %s: %s", phone_number, e)
+            return True
+        if not batch.attach_job(index, job_id):
+            job_journal.mark_done(job_id)  # The batch was answered while the job was written
+    return True
+
+def enqueue_message(sender: str, phone_number: str, body: str) -> bool:
+    """
+    Record an accepted message in the job journal (when enabled) and queue it
+    on the dispatcher. Returns once the message is durable on disk. With
+    WORKER_MODE=external the journal is the queue: worker processes pick the
+    message up from there. With a merge window the message is held back for
+    MERGE_WINDOW seconds so merge_message() can add follow-ups to it.
+
+    Returns:
+        bool: True if queued, False if the queue is full
+    """
+    if Config.WORKER_MODE == "external":
+        try:
+            if job_journal.pending_count() >= Config.WORKER_MAX_PENDING:
+                return False
+            job_journal.append(sender, phone_number, body)
+            return True
+        except Exception as e:
+            logger.error("❌ Failed to enqueue message from %s: %s", phone_number, e)
+            return False
+
+    job_id = None
+    if job_journal is not None:
+        try:
+            job_id = job_journal.append(sender, phone_number, body)
+        except Exception as e:
+            # Better to answer without the durability guarantee than not at all
+            logger.error("❌ Failed to journal message from %s: %s", phone_number, e)
+
+    if Config.MERGE_WINDOW > 0:
+        queued = dispatcher.submit(phone_number, handle_batch, MessageBatch(sender, phone_number, body, job_id),
+                                   delay=Config.MERGE_WINDOW)
+    elif job_id is None:
+        queued = dispatcher.submit(phone_number, handle_incoming, sender, phone_number, body)
+    else:
+        queued = dispatcher.submit(phone_number, handle_job, job_id, sender, phone_number, body)
+
+    if queued or job_id is None:
+        return queued
+    job_journal.set_status(job_id, REJECTED)  # The user gets a "busy" reply instead
+    return False
+
+def replay_pending_jobs() -> int:
+    """
+    Re-queue journaled messages left unfinished by processes that are gone
+    (crash, deploy, restart), i.e. whose lease expired. Called at startup,
+    then every JOB_JOURNAL_LEASE seconds by the reclaimer thread.
+
+    Returns:
+        int: Number of replayed messages
+    """
+    if job_journal is None or Config.WORKER_MODE == "external":
+        return 0  # External workers recover their own jobs
+
+    job_journal.purge()
+    jobs = job_journal.claim_orphans()
+    for job in jobs:
+        # Blocks rather than drops when more jobs are waiting than the queue holds
+        while not dispatcher.submit(job["phone_number"], handle_job, job["id"],
+                                    job["sender"], job["phone_number"], job["body"]):
+            time.sleep(0.1)
+    if jobs:
+        logger.info("♻️ Replayed %s unfinished messages from the job journal", len(jobs))
+    return len(jobs)
+
+def _reclaim_forever():
+    """Reclaimer thread: replay jobs whose process died after this one started."""
+    while True:
+        time.sleep(job_journal.lease)
+        try:
+            replay_pending_jobs()
+        except Exception as e:
+            logger.error("❌ Failed to replay unfinished jobs: %s", e)
+
+def start_job_reclaimer():
+    """Start the background thread replaying orphaned journal jobs (if the journal is used in-process)."""
+    global _reclaimer
+    if job_journal is None or Config.WORKER_MODE == "external" or _reclaimer is not None:
+        return
+    _reclaimer = threading.Thread(target=_reclaim_forever, name="job-reclaimer", daemon=True)
+    _reclaimer.start()
+
+def stats_collectors() -> dict:
+    """
+    The get_stats() sources of this process for the /metrics endpoint;
+    components that are disabled are left out.
+
+    Returns:
+        dict: Name -> callable returning a stats dict
+    """
+    collectors = {
+        "dispatcher": dispatcher.get_stats,
+        "twilio_sender": twilio_sender.get_stats,
+        "session_flight": session_ayd._session_flight.get_stats,
+    }
+    if answer_cache is not None:
+        collectors["answer_cache"] = answer_cache.get_stats
+    if request_coalescer is not None:
+        collectors["request_coalescer"] = request_coalescer.get_stats
+    if job_journal is not None:
+        collectors["job_journal"] = lambda: {**job_journal.get_stats(), "pending": job_journal.pending_count()}
+    if session_renewer is not None:
+        collectors["session_renewer"] = session_renewer.get_stats
+    if attachment_store is not None:
+        collectors["attachments"] = attachment_store.get_stats
+    if idempotency_store is not None:
+        collectors["idempotency"] = idempotency_store.get_stats
+    if ayd_guard is not None:
+        collectors["ayd_guard"] = ayd_guard.get_stats
+    collectors["logging"] = get_logging_stats
+    return collectors
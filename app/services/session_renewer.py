@@ -0,0 +1,197 @@
+import argparse
+import fcntl
+import threading
+import time
+from typing import Iterable, List, Optional
+from app.settings.config import Config
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class SessionRenewer:
+    """
+    Background renewal of AYD sessions before they expire.
+
+    Every `interval` seconds the session storage is scanned for sessions
+    expiring within `window` seconds that were used within the last
+    `active_within` seconds (0 = all), and fresh sessions are created for
+    them, so an active user's question never waits on session creation while
+    users who went quiet are left to expire. The same paced creation is used
+    to pre-warm sessions for a list of known numbers.
+
+    Renewals are spaced evenly at `rate_per_minute`, so a large batch of
+    sessions that were created together never bursts against AYD. Only the
+    process holding the lock file runs the scans, so several workers on one
+    host do not renew the same sessions.
+    """
+
+    def __init__(self, client, window: float = Config.SESSION_RENEW_WINDOW,
+                 interval: float = Config.SESSION_RENEW_INTERVAL,
+                 rate_per_minute: float = Config.SESSION_RENEW_RATE_PER_MINUTE,
+                 lock_path: Optional[str] = Config.SESSION_RENEW_LOCK_PATH,
+                 active_within: float = Config.SESSION_RENEW_ACTIVE_WITHIN):
+        self.client = client
+        self.window = window
+        self.active_within = active_within
+        self.interval = interval
+        self.spacing = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._next_slot = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Metrics
+        self.renewed = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def _pace(self) -> bool:
+        """Wait for the next renewal slot. Returns False if stopped meanwhile."""
+        now = time.monotonic()
+        delay = self._next_slot - now
+        self._next_slot = max(now, self._next_slot) + self.spacing
+        if delay > 0:
+            return not self._stop.wait(delay)
+        return not self._stop.is_set()
+
+    def _renew(self, phone_number: str, renew_before: float) -> bool:
+        """Renew one session, unless it was renewed meanwhile (by a question or another process)."""
+        session = self.client.session_storage.get_session(phone_number)
+        if session and session['expires_at'] >= renew_before:
+            self.skipped += 1
+            return False
+
+        if not self._pace():
+            return False
+        if self.client.renew_session(phone_number):
+            self.renewed += 1
+            return True
+        self.failed += 1
+        return False
+
+    def run_once(self, limit: int = 1000) -> int:
+        """
+        Renew sessions expiring within the window that were used recently.
+
+        Returns:
+            int: Number of renewed sessions
+        """
+        now = time.time()
+        renew_before = now + self.window
+        used_since = now - self.active_within if self.active_within > 0 else 0.0
+        renewed = 0
+        for session in self.client.session_storage.list_expiring(renew_before, limit=limit, used_since=used_since):
+            if self._stop.is_set():
+                break
+            renewed += self._renew(session['phone_number'], renew_before)
+        if renewed:
+            logger.info("🔄 Renewed %s AYD sessions ahead of expiry", renewed)
+        return renewed
+
+    def prewarm(self, phone_numbers: Iterable[str]) -> int:
+        """
+        Create sessions for known numbers that have none (or one expiring within the window).
+
+        Returns:
+            int: Number of created sessions
+        """
+        renew_before = time.time() + self.window
+        created = 0
+        for phone_number in phone_numbers:
+            if self._stop.is_set():
+                break
+            created += self._renew(phone_number, renew_before)
+        logger.info("🔥 Pre-warmed %s AYD sessions", created)
+        return created
+
+    def _acquire_lock(self) -> bool:
+        """Try to become the renewing process on this host (the lock dies with the process)."""
+        if self.lock_path is None or self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def run_forever(self):
+        """Scan and renew every `interval` seconds until stopped."""
+        while not self._stop.is_set():
+            try:
+                if self._acquire_lock():
+                    self.run_once()
+            except Exception as e:
+                logger.error("❌ Session renewal scan failed: %s", e)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Start the background renewal thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run_forever, name="session-renewer", daemon=True)
+            self._thread.start()
+            logger.info("🔄 Session renewer started: window %.0fs, every %.0fs", self.window, self.interval)
+
+    def stop(self):
+        """Stop the background renewal thread after the current renewal."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get_stats(self) -> dict:
+        """
+        Snapshot of renewal metrics.
+
+        Returns:
+            dict: Renewed, failed and skipped session counts
+        """
+        return {
+            "renewed": self.renewed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+        }
+
+def read_phone_numbers(path: str) -> List[str]:
+    """
+    Read phone numbers from a file: one per line, or the first column of a CSV.
+    Blank lines, "#" comments, a header row and "whatsapp:" prefixes are ignored.
+    """
+    numbers = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            number = line.split(",")[0].strip().replace("whatsapp:", "")
+            if number and not number.startswith("#") and any(c.isdigit() for c in number):
+                numbers.append(number)
+    return numbers
+
+def main():
+    parser = argparse.ArgumentParser(description="Renew and pre-warm AYD sessions")
+    parser.add_argument("--prewarm", metavar="FILE", help="Create sessions for the numbers in FILE")
+    parser.add_argument("--once", action="store_true", help="Run one renewal scan and exit")
+    args = parser.parse_args()
+    if Config.SESSION_STORAGE_BACKEND != "sqlite":
+        # Other backends keep sessions and their last use inside the process that answers
+        # questions, and a second writer of the same CSV/journal files would corrupt them
+        parser.error("managing sessions from a separate process needs SESSION_STORAGE_BACKEND=sqlite")
+
+    from app.utils.logger import setup_logging
+    from app.services.simple_ayd_client import SessionBasedAYDClient
+
+    setup_logging()
+    # The command runs on demand, so it does not compete for the background renewer's lock
+    renewer = SessionRenewer(SessionBasedAYDClient(), lock_path=None)
+
+    if args.prewarm:
+        renewer.prewarm(read_phone_numbers(args.prewarm))
+    if args.once:
+        renewer.run_once()
+    if not (args.prewarm or args.once):
+        renewer.lock_path = Config.SESSION_RENEW_LOCK_PATH
+        renewer.run_forever()
+
+if __name__ == "__main__":
+    main()
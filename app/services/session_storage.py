@@ -1,21 +1,69 @@
 import csv
 import os
+import sqlite3
 import time
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 import threading
+from app.settings.config import Config
 from app.utils.logger import get_logger
 
-class CSVSessionStorage:
+class SessionStorage:
+    """
+    Interface shared by all session storage backends.
+    SessionBasedAYDClient only relies on these methods, so backends can be
+    swapped through Config.SESSION_STORAGE_BACKEND without touching the client.
+    """
+
+    def get_session(self, phone_number: str) -> Optional[Dict[str, str]]:
+        """
+        Retrieve session for a phone number if it exists and hasn't expired.
+        Returns None if no valid session found.
+        """
+        raise NotImplementedError
+
+    def save_session(self, phone_number: str, session_id: str, expires_at: float) -> bool:
+        """
+        Save or update session for a phone number.
+        Returns True if successful, False otherwise.
+        """
+        raise NotImplementedError
+
+    def remove_session(self, phone_number: str) -> bool:
+        """
+        Remove session for a phone number.
+        Returns True if successful, False otherwise.
+        """
+        raise NotImplementedError
+
+    def mark_used(self, phone_number: str):
+        """
+        Record that a question was asked with the session. A new session counts
+        as used when it is saved; renewing it does not.
+        """
+        raise NotImplementedError
+
+    def list_expiring(self, before: float, limit: int = 100, used_since: float = 0.0) -> List[Dict[str, str]]:
+        """
+        List sessions that are still valid but expire before the given timestamp
+        and were used at or after `used_since`, soonest first. Used by the
+        background session renewer.
+        """
+        raise NotImplementedError
+
+
+class CSVSessionStorage(SessionStorage):
     """
     CSV-based session storage for WhatsApp phone number to AYD access token mapping.
     Thread-safe implementation with file locking for concurrent WhatsApp messages.
+    When a session was last used is only kept in memory (single process only).
     """
     
     def __init__(self, csv_file_path: str = "sessions.csv"):
         self.csv_file_path = csv_file_path
         self.lock = threading.Lock()
         self.logger = get_logger(__name__)
+        self._last_used: Dict[str, float] = {}
         self._ensure_csv_exists()
     
     def _ensure_csv_exists(self):
@@ -74,6 +122,7 @@ class CSVSessionStorage:
             try:
                 # Remove existing session if any
                 self._remove_session_unsafe(phone_number)
+                self._last_used.setdefault(phone_number, time.time())
                 
                 # Add new session
                 with open(self.csv_file_path, 'a', newline='', encoding='utf-8') as file:
@@ -84,10 +133,10 @@ class CSVSessionStorage:
                         str(expires_at),
                         datetime.now().isoformat()
                     ])
-                self.logger.debug(f"💾 Saved session for {phone_number}")
+                self.logger.debug("💾 Saved session for %s", phone_number)
                 return True
             except Exception as e:
-                self.logger.error(f"❌ Error saving session for {phone_number}: {e}")
+                self.logger.error("❌ Error saving session for %s: %s", phone_number, e)
                 return False
     
     def _remove_session_unsafe(self, phone_number: str):
@@ -111,7 +160,7 @@ class CSVSessionStorage:
                 writer = csv.writer(file)
                 writer.writerows(rows_to_keep)
         except Exception as e:
-            self.logger.error(f"❌ Error removing session for {phone_number}: {e}")
+            self.logger.error("❌ Error removing session for %s: %s", phone_number, e)
     
     def remove_session(self, phone_number: str) -> bool:
         """
@@ -121,8 +170,528 @@ class CSVSessionStorage:
         with self.lock:
             try:
                 self._remove_session_unsafe(phone_number)
-                self.logger.debug(f"🗑️ Removed session for {phone_number}")
+                self.logger.debug("🗑️ Removed session for %s", phone_number)
                 return True
             except Exception as e:
-                self.logger.error(f"❌ Error removing session for {phone_number}: {e}")
+                self.logger.error("❌ Error removing session for %s: %s", phone_number, e)
                 return False
+
+    def mark_used(self, phone_number: str):
+        """Record that a question was asked with the session (in memory)."""
+        with self.lock:
+            self._last_used[phone_number] = time.time()
+
+    def list_expiring(self, before: float, limit: int = 100, used_since: float = 0.0) -> List[Dict[str, str]]:
+        """
+        List sessions that are still valid but expire before the given timestamp
+        and were used since `used_since`, soonest first. Reads the whole file.
+        """
+        now = time.time()
+        sessions = []
+        with self.lock:
+            try:
+                with open(self.csv_file_path, 'r', newline='', encoding='utf-8') as file:
+                    for row in csv.DictReader(file):
+                        try:
+                            expires_at = float(row['expires_at'])
+                        except (ValueError, KeyError, TypeError):
+                            continue  # Malformed row, skip
+                        if (now < expires_at < before
+                                and self._last_used.get(row['phone_number'], 0.0) >= used_since):
+                            sessions.append({
+                                'phone_number': row['phone_number'],
+                                'session_id': row['session_id'],
+                                'expires_at': expires_at,
+                                'created_at': row['created_at']
+                            })
+            except Exception as e:
+                self.logger.error("❌ Error listing expiring sessions: %s", e)
+                return []
+
+        sessions.sort(key=lambda session: session['expires_at'])
+        return sessions[:limit]
+
+
+class JournalSessionStorage(SessionStorage):
+    """
+    Indexed session storage for WhatsApp phone number to AYD access token mapping.
+    Keeps every session in an in-memory dict for O(1) lookups and persists changes
+    to an append-only journal next to a CSV snapshot. The journal is folded back
+    into the snapshot (compacted) every `compact_every` writes.
+
+    The snapshot uses the same format as CSVSessionStorage, so an existing
+    sessions CSV is picked up as-is. When a session was last used is only kept
+    in memory.
+    """
+
+    def __init__(self, csv_file_path: str = "sessions.csv", compact_every: int = 1000):
+        self.csv_file_path = csv_file_path
+        self.journal_path = f"{csv_file_path}.journal"
+        self.compact_every = max(1, compact_every)
+        self.lock = threading.Lock()
+        self.logger = get_logger(__name__)
+        self._sessions: Dict[str, Dict] = {}
+        self._last_used: Dict[str, float] = {}
+        self._journal_writes = 0
+        self._journal = None
+        self._load()
+
+    def _load(self):
+        """Rebuild the in-memory index from the snapshot and replay the journal."""
+        try:
+            with open(self.csv_file_path, 'r', newline='', encoding='utf-8') as file:
+                for row in csv.DictReader(file):
+                    try:
+                        self._sessions[row['phone_number']] = {
+                            'session_id': row['session_id'],
+                            'expires_at': float(row['expires_at']),
+                            'created_at': row['created_at']
+                        }
+                    except (ValueError, KeyError, TypeError):
+                        continue  # Malformed row, skip
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.error("❌ Error loading session snapshot %s: %s", self.csv_file_path, e)
+
+        try:
+            self._truncate_torn_tail()
+            with open(self.journal_path, 'r', newline='', encoding='utf-8') as file:
+                for row in csv.reader(file):
+                    self._apply_journal_row(row)
+                    self._journal_writes += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.error("❌ Error replaying session journal %s: %s", self.journal_path, e)
+
+        self._open_journal_unsafe()
+
+        self.logger.info("💾 Loaded %s sessions (%s journal entries)", len(self._sessions), self._journal_writes)
+
+    def _truncate_torn_tail(self):
+        """
+        Cut off a last journal line left incomplete by a crash, so the next
+        append starts on a fresh line instead of merging into it.
+        """
+        with open(self.journal_path, 'rb+') as file:
+            size = file.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            file.seek(size - 1)
+            if file.read(1) == b'\n':
+                return
+            # Scan back to the end of the last complete line
+            end = size
+            while end > 0:
+                start = max(0, end - 65536)
+                file.seek(start)
+                newline = file.read(end - start).rfind(b'\n')
+                if newline != -1:
+                    end = start + newline + 1
+                    break
+                end = start
+            file.truncate(end)
+            self.logger.warning("⚠️ Dropped %s bytes of a torn entry from %s", size - end, self.journal_path)
+
+    def _open_journal_unsafe(self, mode: str = 'a') -> bool:
+        """
+        (Re)open the journal for appending. NOT thread-safe - must be called within lock (or from __init__).
+
+        Returns:
+            bool: True if the journal is open
+        """
+        try:
+            self._journal = open(self.journal_path, mode, newline='', encoding='utf-8')
+            return True
+        except Exception as e:
+            self._journal = None
+            self.logger.error("❌ Error opening session journal %s: %s", self.journal_path, e)
+            return False
+
+    def _apply_journal_row(self, row: list):
+        """Apply a single journal entry to the index. Truncated or malformed entries are ignored."""
+        try:
+            if row[0] == 'S' and len(row) >= 5:
+                self._sessions[row[1]] = {
+                    'session_id': row[2],
+                    'expires_at': float(row[3]),
+                    'created_at': row[4]
+                }
+            elif row[0] == 'D' and len(row) >= 2:
+                self._sessions.pop(row[1], None)
+        except (ValueError, IndexError):
+            pass
+
+    def _append_unsafe(self, row: list):
+        """
+        Append an entry to the journal. NOT thread-safe - must be called within lock.
+        The index must already reflect the entry, since this may trigger a compaction.
+        """
+        if self._journal is None and not self._open_journal_unsafe():
+            raise RuntimeError("session journal is not open")
+        csv.writer(self._journal).writerow(row)
+        self._journal.flush()
+        self._journal_writes += 1
+        if self._journal_writes >= self.compact_every:
+            self._compact_unsafe()
+
+    def _compact_unsafe(self):
+        """
+        Write the live sessions to a fresh snapshot and truncate the journal.
+        NOT thread-safe - must be called within lock.
+
+        The snapshot is swapped in atomically before the journal is truncated, so a
+        crash in between only means the (idempotent) journal is replayed again.
+        """
+        try:
+            now = time.time()
+            tmp_path = f"{self.csv_file_path}.tmp"
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(['phone_number', 'session_id', 'expires_at', 'created_at'])
+                for phone_number, session in list(self._sessions.items()):
+                    if session['expires_at'] <= now:
+                        del self._sessions[phone_number]
+                        continue
+                    writer.writerow([
+                        phone_number,
+                        session['session_id'],
+                        str(session['expires_at']),
+                        session['created_at']
+                    ])
+            os.replace(tmp_path, self.csv_file_path)
+
+            self._journal.close()
+            self._journal = None
+            if self._open_journal_unsafe('w'):
+                self._journal_writes = 0
+                self.logger.info("🗜️ Compacted session journal: %s live sessions", len(self._sessions))
+        except Exception as e:
+            self.logger.error("❌ Error compacting session journal: %s", e)
+            if self._journal is None or self._journal.closed:
+                # Keep appending to the old journal; if even that fails the next write retries the open
+                self._open_journal_unsafe()
+
+    def get_session(self, phone_number: str) -> Optional[Dict[str, str]]:
+        """
+        Retrieve session for a phone number if it exists and hasn't expired.
+        Returns None if no valid session found.
+        """
+        if not phone_number:
+            return None
+
+        with self.lock:
+            session = self._sessions.get(phone_number)
+            if session is None:
+                return None
+
+            if time.time() < session['expires_at']:
+                return {
+                    'phone_number': phone_number,
+                    'session_id': session['session_id'],  # Actually access_token
+                    'expires_at': session['expires_at'],
+                    'created_at': session['created_at']
+                }
+
+            # Session expired, clean it up
+            try:
+                del self._sessions[phone_number]
+                self._append_unsafe(['D', phone_number])
+            except Exception as e:
+                self.logger.error("❌ Error removing expired session for %s: %s", phone_number, e)
+            return None
+
+    def save_session(self, phone_number: str, session_id: str, expires_at: float) -> bool:
+        """
+        Save or update session for a phone number.
+        Returns True if successful, False otherwise.
+        """
+        with self.lock:
+            previous = self._sessions.get(phone_number)
+            try:
+                created_at = datetime.now().isoformat()
+                self._sessions[phone_number] = {
+                    'session_id': session_id,
+                    'expires_at': float(expires_at),
+                    'created_at': created_at
+                }
+                self._append_unsafe(['S', phone_number, session_id, str(expires_at), created_at])
+                self._last_used.setdefault(phone_number, time.time())
+                self.logger.debug("💾 Saved session for %s", phone_number)
+                return True
+            except Exception as e:
+                # Keep the index consistent with what actually reached the journal
+                if previous is None:
+                    self._sessions.pop(phone_number, None)
+                else:
+                    self._sessions[phone_number] = previous
+                self.logger.error("❌ Error saving session for %s: %s", phone_number, e)
+                return False
+
+    def remove_session(self, phone_number: str) -> bool:
+        """
+        Remove session for a phone number.
+        Returns True if successful, False otherwise.
+        """
+        with self.lock:
+            try:
+                if self._sessions.pop(phone_number, None) is not None:
+                    self._append_unsafe(['D', phone_number])
+                self.logger.debug("🗑️ Removed session for %s", phone_number)
+                return True
+            except Exception as e:
+                self.logger.error("❌ Error removing session for %s: %s", phone_number, e)
+                return False
+
+    def mark_used(self, phone_number: str):
+        """Record that a question was asked with the session (in memory)."""
+        with self.lock:
+            self._last_used[phone_number] = time.time()
+
+    def list_expiring(self, before: float, limit: int = 100, used_since: float = 0.0) -> List[Dict[str, str]]:
+        """
+        List sessions that are still valid but expire before the given timestamp
+        and were used since `used_since`, soonest first. Scans the in-memory index.
+        """
+        now = time.time()
+        with self.lock:
+            sessions = [
+                {
+                    'phone_number': phone_number,
+                    'session_id': session['session_id'],
+                    'expires_at': session['expires_at'],
+                    'created_at': session['created_at']
+                }
+                for phone_number, session in self._sessions.items()
+                if now < session['expires_at'] < before and self._last_used.get(phone_number, 0.0) >= used_since
+            ]
+
+        sessions.sort(key=lambda session: session['expires_at'])
+        return sessions[:limit]
+
+    def compact(self):
+        """Force a compaction of the journal into the snapshot."""
+        with self.lock:
+            self._compact_unsafe()
+
+
+class SQLiteSessionStorage(SessionStorage):
+    """
+    SQLite-based session storage for WhatsApp phone number to AYD access token mapping.
+    Runs the database in WAL mode with one connection per thread, so several
+    gunicorn workers (processes) can share the same session store safely.
+    """
+
+    def __init__(self, db_path: str = "sessions.db", migrate_from_csv: Optional[str] = None):
+        self.db_path = db_path
+        self._local = threading.local()
+        self.logger = get_logger(__name__)
+        self._ensure_schema()
+        if migrate_from_csv:
+            self._migrate_from_csv(migrate_from_csv)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: autocommit, explicit BEGIN for multi-statement writes
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _ensure_schema(self):
+        """Create the sessions table and its expiry index if they don't exist (adding last_used_at to old ones)."""
+        conn = self._connection()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                phone_number TEXT PRIMARY KEY,
+                session_id   TEXT NOT NULL,
+                expires_at   REAL NOT NULL,
+                created_at   TEXT NOT NULL,
+                last_used_at REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if "last_used_at" not in columns:
+            try:
+                conn.execute("ALTER TABLE sessions ADD COLUMN last_used_at REAL NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                pass  # Another worker added it first
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)")
+
+    def _migrate_from_csv(self, csv_file_path: str):
+        """
+        One-shot import of a CSVSessionStorage file.
+        Rows already present in the database win, and the CSV is renamed to
+        `<file>.migrated` afterwards so the import never runs twice.
+        """
+        if not os.path.exists(csv_file_path):
+            return
+
+        conn = self._connection()
+        imported = 0
+        try:
+            rows = []
+            with open(csv_file_path, 'r', newline='', encoding='utf-8') as file:
+                for row in csv.DictReader(file):
+                    try:
+                        rows.append((
+                            row['phone_number'],
+                            row['session_id'],
+                            float(row['expires_at']),
+                            row['created_at']
+                        ))
+                    except (ValueError, KeyError, TypeError):
+                        continue  # Malformed row, skip
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conn.executemany(
+                    "INSERT OR IGNORE INTO sessions (phone_number, session_id, expires_at, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                imported = cursor.rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+            os.replace(csv_file_path, f"{csv_file_path}.migrated")
+            self.logger.info("📦 Migrated %s sessions from %s to %s", imported, csv_file_path, self.db_path)
+        except FileNotFoundError:
+            pass  # Another worker finished the migration first
+        except Exception as e:
+            self.logger.error("❌ Error migrating sessions from %s: %s", csv_file_path, e)
+
+    def get_session(self, phone_number: str) -> Optional[Dict[str, str]]:
+        """
+        Retrieve session for a phone number if it exists and hasn't expired.
+        Returns None if no valid session found.
+        """
+        if not phone_number:
+            return None
+
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT session_id, expires_at, created_at FROM sessions WHERE phone_number = ?",
+                (phone_number,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            session_id, expires_at, created_at = row
+            now = time.time()
+            if now < expires_at:
+                return {
+                    'phone_number': phone_number,
+                    'session_id': session_id,  # Actually access_token
+                    'expires_at': expires_at,
+                    'created_at': created_at
+                }
+
+            # Session expired, clean it up (unless another worker just renewed it)
+            conn.execute(
+                "DELETE FROM sessions WHERE phone_number = ? AND expires_at <= ?",
+                (phone_number, now)
+            )
+            return None
+        except Exception as e:
+            self.logger.error("❌ Error reading session for %s: %s", phone_number, e)
+            return None
+
+    def save_session(self, phone_number: str, session_id: str, expires_at: float) -> bool:
+        """
+        Save or update session for a phone number.
+        Returns True if successful, False otherwise.
+        """
+        try:
+            # A renewal keeps last_used_at, so only sessions that are asked with stay renewed
+            self._connection().execute(
+                "INSERT INTO sessions (phone_number, session_id, expires_at, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (phone_number) DO UPDATE SET "
+                "session_id = excluded.session_id, expires_at = excluded.expires_at, created_at = excluded.created_at",
+                (phone_number, session_id, float(expires_at), datetime.now().isoformat(), time.time())
+            )
+            self.logger.debug("💾 Saved session for %s", phone_number)
+            return True
+        except Exception as e:
+            self.logger.error("❌ Error saving session for %s: %s", phone_number, e)
+            return False
+
+    def remove_session(self, phone_number: str) -> bool:
+        """
+        Remove session for a phone number.
+        Returns True if successful, False otherwise.
+        """
+        try:
+            self._connection().execute("DELETE FROM sessions WHERE phone_number = ?", (phone_number,))
+            self.logger.debug("🗑️ Removed session for %s", phone_number)
+            return True
+        except Exception as e:
+            self.logger.error("❌ Error removing session for %s: %s", phone_number, e)
+            return False
+
+    def mark_used(self, phone_number: str):
+        """Record that a question was asked with the session (shared by all processes)."""
+        try:
+            self._connection().execute(
+                "UPDATE sessions SET last_used_at = ? WHERE phone_number = ?",
+                (time.time(), phone_number)
+            )
+        except Exception as e:
+            self.logger.error("❌ Error marking session used for %s: %s", phone_number, e)
+
+    def list_expiring(self, before: float, limit: int = 100, used_since: float = 0.0) -> List[Dict[str, str]]:
+        """
+        List sessions that are still valid but expire before the given timestamp
+        and were used since `used_since`, soonest first. Served by the expires_at index.
+        """
+        try:
+            rows = self._connection().execute(
+                "SELECT phone_number, session_id, expires_at, created_at FROM sessions "
+                "WHERE expires_at > ? AND expires_at < ? AND last_used_at >= ? ORDER BY expires_at LIMIT ?",
+                (time.time(), before, used_since, limit)
+            ).fetchall()
+        except Exception as e:
+            self.logger.error("❌ Error listing expiring sessions: %s", e)
+            return []
+
+        return [
+            {
+                'phone_number': phone_number,
+                'session_id': session_id,
+                'expires_at': expires_at,
+                'created_at': created_at
+            }
+            for phone_number, session_id, expires_at, created_at in rows
+        ]
+
+
+def create_session_storage(backend: Optional[str] = None) -> SessionStorage:
+    """
+    Build the session storage backend selected by Config.SESSION_STORAGE_BACKEND.
+
+    Backends:
+      csv     - single CSV file, rewritten on every change (single process only)
+      journal - in-memory index + append-only journal (single process only)
+      sqlite  - SQLite in WAL mode, safe to share between worker processes;
+                imports an existing CSV file once on first start
+    """
+    backend = (backend or Config.SESSION_STORAGE_BACKEND).lower()
+
+    if backend == "csv":
+        return CSVSessionStorage(Config.SESSION_CSV_PATH)
+    if backend == "journal":
+        return JournalSessionStorage(Config.SESSION_CSV_PATH, compact_every=Config.SESSION_JOURNAL_COMPACT_EVERY)
+    if backend == "sqlite":
+        return SQLiteSessionStorage(Config.SESSION_SQLITE_PATH, migrate_from_csv=Config.SESSION_CSV_PATH)
+
+    raise ValueError(f"Unknown session storage backend: {backend}")
@@ -1,16 +1,23 @@
 import requests
-import json
 import time
-from sseclient import SSEClient
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
 from app.settings.config import Config
-from app.services.session_storage import CSVSessionStorage
+from app.services.session_storage import create_session_storage
+from app.utils.http_pool import pooled_session, http_timeout
+from app.utils.single_flight import SingleFlight
+from app.utils.upstream_guard import ayd_guard, Permit, UpstreamRejected
+from app.utils.sse import iter_sse_data, iter_response_chunks, text_content
+from app.utils.metrics import metrics
 from app.utils.logger import get_logger
 
 class SessionBasedAYDClient:
     """
     Session-based AskYourDatabase client using streaming API with access tokens.
-    Sessions last 7 days and are renewed on 401 errors.
+    Sessions last 7 days and are renewed on 401 errors. At most one session
+    creation per phone number is in flight; concurrent messages from the same
+    user wait for its token instead of creating sessions of their own.
+    Questions go through the AYD upstream guard (when enabled), which limits
+    how many run at once and fails fast while AYD is down.
     """
     
     def __init__(self):
@@ -21,8 +28,12 @@ class SessionBasedAYDClient:
         self.api_key = Config.AYD_API_KEY
         self.bot_id = Config.AYD_CHAT_ID
         
-        # CSV-based session storage (stores access tokens with expiry)
-        self.session_storage = CSVSessionStorage("ayd_sessions.csv")
+        # Session storage (stores access tokens with expiry), backend picked by config
+        self.session_storage = create_session_storage()
+        # Per phone number: one session creation at a time, shared by everyone waiting
+        self._session_flight = SingleFlight()
+        # Adaptive concurrency limit + circuit breaker (None if disabled)
+        self.guard = ayd_guard
         self.logger = get_logger(__name__)
         self.logger.info("🔧 SessionBasedAYDClient initialized")
     
@@ -30,12 +41,14 @@ class SessionBasedAYDClient:
         """
         Create a new AYD session and return access token.
         Returns access_token if successful, None otherwise.
+        Callers go through _session_flight so creations per phone number never overlap.
         """
+        start = time.perf_counter()
         try:
-            self.logger.info(f"🆕 Creating new AYD session for {phone_number}")
+            self.logger.info("🆕 Creating new AYD session for %s", phone_number)
             
-            # Create session
-            sess = requests.Session()
+            # Create session (own cookie jar, pooled connections)
+            sess = pooled_session()
             resp = sess.post(
                 f"{self.base_url}/api/chatbot/v2/session",
                 headers={
@@ -46,20 +59,21 @@ class SessionBasedAYDClient:
                     "chatbotid": self.bot_id,
                     "name": f"WhatsApp User {phone_number}",
                     "email": f"wa{phone_number.replace('+', '')}@example.com"
-                }
+                },
+                timeout=http_timeout()
             )
             resp.raise_for_status()
             
             callback_url = resp.json()["url"]
-            self.logger.debug(f"✅ Got callback URL for {phone_number}")
+            self.logger.debug("✅ Got callback URL for %s", phone_number)
             
             # Login to get access token
-            login_resp = sess.get(callback_url, allow_redirects=True)
+            login_resp = sess.get(callback_url, allow_redirects=True, timeout=http_timeout())
             login_resp.raise_for_status()
             
             access_token = sess.cookies.get("accessToken")
             if not access_token:
-                self.logger.error(f"❌ No accessToken cookie found for {phone_number}")
+                self.logger.error("❌ No accessToken cookie found for %s", phone_number)
                 return None
             
             # Get expiry (7 days from creation) 
@@ -69,35 +83,113 @@ class SessionBasedAYDClient:
             success = self.session_storage.save_session(phone_number, access_token, expires_at)
             
             if success:
-                self.logger.info(f"✅ Created and stored session for {phone_number}")
+                self.logger.info("✅ Created and stored session for %s", phone_number)
                 return access_token
             else:
-                self.logger.error(f"❌ Failed to store session for {phone_number}")
+                self.logger.error("❌ Failed to store session for %s", phone_number)
                 return None
                 
         except Exception as e:
-            self.logger.error(f"❌ Error creating session for {phone_number}: {e}")
+            self.logger.error("❌ Error creating session for %s: %s", phone_number, e)
             return None
+        finally:
+            metrics.observe("session_create", time.perf_counter() - start)
     
+    def renew_session(self, phone_number: str) -> bool:
+        """
+        Create a fresh session for a phone number ahead of time, replacing any
+        stored one, so the user's next question skips session creation.
+        Returns True if a new session was stored.
+        """
+        token, _ = self._session_flight.do(phone_number, self._create_session, phone_number)
+        return token is not None
+
     def _get_or_create_session(self, phone_number: str) -> Optional[str]:
         """
         Get existing access token or create a new session.
         Returns access_token if successful, None otherwise.
         """
         # Try to get existing session
+        start = time.perf_counter()
         session = self.session_storage.get_session(phone_number)
+        metrics.observe("session_lookup", time.perf_counter() - start)
         if session:
-            self.logger.info(f"📱 Using existing session for {phone_number}")
+            self.session_storage.mark_used(phone_number)  # keeps it on the renewer's list
+            self.logger.info("📱 Using existing session for %s", phone_number)
             return session['session_id']  # This is actually the access_token
         
-        # Create new session if none exists or expired
+        # Create new session if none exists or expired, joining a creation already in flight
+        token, shared = self._session_flight.do(phone_number, self._create_session_if_missing, phone_number)
+        if shared:
+            self.logger.info("🔗 Reused session created concurrently for %s", phone_number)
+        return token
+
+    def _create_session_if_missing(self, phone_number: str) -> Optional[str]:
+        """Create a session unless a creation that just finished already stored one."""
+        session = self.session_storage.get_session(phone_number)
+        if session:
+            return session['session_id']
         return self._create_session(phone_number)
+
+    def _replace_session(self, phone_number: str, rejected_token: str) -> Optional[str]:
+        """
+        Replace a token AYD rejected with 401. If another request already
+        replaced it, that newer token is returned instead of creating yet another session.
+        """
+        def replace():
+            session = self.session_storage.get_session(phone_number)
+            if session and session['session_id'] != rejected_token:
+                return session['session_id']
+            self.session_storage.remove_session(phone_number)
+            return self._create_session(phone_number)
+
+        token, _ = self._session_flight.do(phone_number, replace)
+        return token
     
-    def ask_with_session(self, phone_number: str, question: str) -> Dict:
+    def ask_with_session(self, phone_number: str, question: str,
+                         on_text: Optional[Callable[[str], None]] = None) -> Dict:
         """
         Send a question to AYD using session-based conversation with streaming response.
         Concatenates all text chunks and returns the complete response.
+
+        If on_text is given, it is called with every text chunk as soon as it
+        arrives, so callers can deliver the answer progressively.
+
+        With the upstream guard the question may wait for a free slot, or be
+        answered right away with a friendly error while the circuit is open.
         """
+        if self.guard is None:
+            return self._ask(phone_number, question, on_text)
+
+        start = time.perf_counter()
+        try:
+            permit = self.guard.acquire()
+        except UpstreamRejected as e:
+            self.logger.warning("🛑 AYD guard turned away question from %s: %s", phone_number, e.reason)
+            return rejected_result(e.reason)
+        finally:
+            metrics.observe("ayd_guard", time.perf_counter() - start)
+
+        # Errors raised by on_text (e.g. a failed WhatsApp send) are not AYD's fault
+        callback_failed = False
+        def forward(text: str):
+            nonlocal callback_failed
+            try:
+                on_text(text)
+            except Exception:
+                callback_failed = True
+                raise
+
+        result = {}
+        try:
+            result = self._ask(phone_number, question, forward if on_text else None, permit)
+            return result
+        finally:
+            self.guard.release(permit, success=callback_failed or not upstream_failed(result))
+
+    def _ask(self, phone_number: str, question: str, on_text: Optional[Callable[[str], None]],
+             permit: Optional[Permit] = None) -> Dict:
+        """ask_with_session without the upstream guard; records time to first event on permit."""
         # Get or create access token
         access_token = self._get_or_create_session(phone_number)
         if not access_token:
@@ -108,8 +200,10 @@ class SessionBasedAYDClient:
             }
         
         # Send question with streaming
+        resp = None
         try:
-            sess = requests.Session()
+            sess = pooled_session()
+            asked_at = time.perf_counter()
             resp = sess.post(
                 f"{self.base_url}/api/ask?debug=false",
                 headers={
@@ -123,16 +217,16 @@ class SessionBasedAYDClient:
                     "debug": False
                 },
                 stream=True,
-                timeout=60
+                timeout=http_timeout()
             )
             
             # Handle 401 errors by recreating session
             if resp.status_code == 401:
-                self.logger.info(f"🔄 Access token expired, creating new session for {phone_number}")
-                self.session_storage.remove_session(phone_number)
+                resp.close()  # release the connection before retrying
+                self.logger.info("🔄 Access token expired, creating new session for %s", phone_number)
                 
                 # Retry with new session
-                access_token = self._create_session(phone_number)
+                access_token = self._replace_session(phone_number, access_token)
                 if not access_token:
                     return {
                         "success": False,
@@ -141,6 +235,7 @@ class SessionBasedAYDClient:
                     }
                 
                 # Retry the request
+                asked_at = time.perf_counter()
                 resp = sess.post(
                     f"{self.base_url}/api/ask?debug=false",
                     headers={
@@ -154,24 +249,34 @@ class SessionBasedAYDClient:
                         "debug": False
                     },
                     stream=True,
-                    timeout=60
+                    timeout=http_timeout()
                 )
             
             resp.raise_for_status()
             
-            # Process streaming response
-            client = SSEClient(resp.iter_content(decode_unicode=False))
+            # Process streaming response (non-text events are skipped without JSON decoding)
             text_parts = []
+            malformed = 0
             
-            for event in client.events():
+            chunks = metrics.time_first("ayd_first_byte", asked_at, iter_response_chunks(resp, Config.SSE_READ_SIZE))
+            for data in iter_sse_data(chunks):
+                if permit is not None and permit.first_event is None:
+                    permit.first_event = time.perf_counter() - asked_at
                 try:
-                    data = json.loads(event.data)
-                    
-                    if data.get("isText"):
-                        text_parts.append(data.get("content", ""))
-                        
-                except (ValueError, TypeError):
+                    content = text_content(data)
+                except ValueError:
+                    malformed += 1
                     continue
+                
+                if content:
+                    text_parts.append(content)
+                    if on_text:
+                        on_text(content)
+            
+            metrics.observe("ayd_last_event", time.perf_counter() - asked_at)
+            
+            if malformed:
+                self.logger.warning("⚠️ Skipped %s malformed text events for %s", malformed, phone_number)
             
             # Concatenate all text chunks
             full_response = "".join(text_parts).strip()
@@ -179,7 +284,7 @@ class SessionBasedAYDClient:
             if not full_response:
                 full_response = "I processed your request but have no specific response to share."
             
-            self.logger.info(f"✅ Got response for {phone_number}: {len(full_response)} chars")
+            self.logger.info("✅ Got response for %s: %s chars", phone_number, len(full_response))
             
             return {
                 "success": True,
@@ -187,16 +292,52 @@ class SessionBasedAYDClient:
             }
             
         except requests.Timeout:
-            self.logger.warning(f"⏰ Timeout for {phone_number}")
+            self.logger.warning("⏰ Timeout for %s", phone_number)
             return {
                 "success": False,
                 "error": "Timeout",
                 "aiResponse": "Sorry, the request took too long. Please try again."
             }
         except Exception as e:
-            self.logger.error(f"❌ Error for {phone_number}: {e}")
+            self.logger.error("❌ Error for %s: %s", phone_number, e)
+            if isinstance(e, (requests.ConnectionError, requests.exceptions.ChunkedEncodingError)):
+                error = "ConnectionFailed"
+            elif isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code >= 500:
+                error = "UpstreamError"
+            else:
+                error = "RequestFailed"  # 4xx, or an error on our side
             return {
                 "success": False,
-                "error": "RequestFailed",
+                "error": error,
                 "aiResponse": "Sorry, something went wrong. Please try again."
-            }
\ No newline at end of file
+            }
+        finally:
+            if resp is not None:
+                resp.close()
+
+# ask_with_session errors that mean AYD itself is failing; only these count against the upstream guard
+UPSTREAM_ERRORS = frozenset({"Timeout", "ConnectionFailed", "UpstreamError", "SessionCreationFailed",
+                             "SessionRetryFailed"})
+
+def upstream_failed(result: Dict) -> bool:
+    """True if an ask_with_session result failed because of AYD (timeout, connection, 5xx, sessions)."""
+    return not result.get("success") and result.get("error") in UPSTREAM_ERRORS
+
+def rejected_result(reason: str) -> Dict:
+    """
+    Result for a question the upstream guard turned away, in ask_with_session's format.
+
+    Args:
+        reason (str): "circuit_open" or "overloaded"
+    """
+    if reason == "circuit_open":
+        return {
+            "success": False,
+            "error": "UpstreamUnavailable",
+            "aiResponse": "Sorry, our data service is having trouble right now. Please try again in a few minutes."
+        }
+    return {
+        "success": False,
+        "error": "UpstreamBusy",
+        "aiResponse": "We're handling a lot of questions right now. Please try again in a minute."
+    }
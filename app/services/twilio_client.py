@@ -1,20 +1,418 @@
-from twilio.rest import Client
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import requests
 from app.settings.config import Config
+from app.utils.http_pool import pooled_session
+from app.utils.metrics import metrics
 from app.utils.logger import get_logger
+from app.utils.text_splitter import find_split_point, part_header, split_message, utf16_len
 
-# Initialize the Twilio REST client with your Account SID and Auth Token
-_twilio = Client(
-    Config.TWILIO_ACCOUNT_SID,
-    Config.TWILIO_AUTH_TOKEN
-)
 logger = get_logger(__name__)
 
+class SendResult:
+    """Outcome of one WhatsApp message (or part) sent through TwilioSender."""
+
+    __slots__ = ("sid", "part", "attempts", "latency", "error")
+
+    def __init__(self, part: int = 1):
+        self.sid = None
+        self.part = part
+        self.attempts = 0
+        self.latency = 0.0  # seconds from the first attempt until Twilio accepted the message
+        self.error = None
+
+class TwilioSendError(Exception):
+    """A message Twilio rejected, or that still failed after all retries."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class _PartBatch:
+    """Shared state of one multi-part send: which parts are in flight, backing off or done."""
+
+    WAITING, IN_FLIGHT, BACKOFF, DONE = range(4)
+
+    def __init__(self, parts: int):
+        self.cond = threading.Condition()
+        self.state = [self.WAITING] * parts
+        self.started_at = [0.0] * parts
+        self.error = None
+
+class OutboundGovernor:
+    """
+    Process-wide outbound scheduler for one Twilio sender number.
+
+    Every send first asks for a slot. Slots are released by a token bucket
+    (`rate` messages per second, bursts of up to `burst`), and waiting sends
+    are served round-robin across recipients, FIFO per recipient: a user
+    receiving a ten-part answer gets one slot per round, so other users'
+    short replies are not stuck behind it. The time each send waited for its
+    slot is tracked as queue latency.
+    """
+
+    def __init__(self, rate: float = Config.TWILIO_SEND_RATE, burst: int = Config.TWILIO_SEND_BURST):
+        self.rate = rate
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.tolerance = (max(1, burst) - 1) * self.interval
+        self._cond = threading.Condition()
+        self._queues: Dict[str, deque] = {}  # recipient -> waiting sends (enqueued_at, release)
+        self._ready = deque()               # recipients with waiting tickets, in round-robin order
+        self._tat = 0.0                     # theoretical arrival time of the next send (GCRA)
+        self._thread = None
+        self._thread_pid = None
+
+        # Metrics
+        self.granted = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._recent_waits = deque(maxlen=1024)
+
+    def acquire(self, to: str):
+        """Block until the next message to `to` may be sent."""
+        if self.rate <= 0:
+            return
+        event = threading.Event()
+        self._enqueue(to, event.set)
+        event.wait()
+
+    async def acquire_async(self, to: str):
+        """asyncio version of acquire: waits for the slot without blocking a thread."""
+        if self.rate <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def release():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        self._enqueue(to, release)
+        await granted
+
+    def _enqueue(self, to: str, release):
+        """Queue a send to `to`; `release` is called from the scheduler thread when its slot comes up."""
+        with self._cond:
+            self._ensure_started_unsafe()
+            queue = self._queues.get(to)
+            if queue is None:
+                queue = deque()
+                self._queues[to] = queue
+                self._ready.append(to)
+            queue.append((time.monotonic(), release))
+            self._cond.notify()
+
+    def _ensure_started_unsafe(self):
+        """Start the scheduler thread on first use in each process. Must be called within the condition."""
+        if self._thread_pid != os.getpid():
+            self._queues.clear()
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._run, name="twilio-governor", daemon=True)
+            self._thread.start()
+            self._thread_pid = os.getpid()
+
+    def _run(self):
+        """Scheduler thread: wait for a token, then release the next recipient's oldest send."""
+        while True:
+            with self._cond:
+                while not self._ready:
+                    self._cond.wait()
+
+            now = time.monotonic()
+            tat = max(self._tat, now)
+            delay = tat - now - self.tolerance
+            if delay > 0:
+                time.sleep(delay)
+                now = time.monotonic()
+            self._tat = max(tat, now) + self.interval
+
+            with self._cond:
+                to = self._ready.popleft()
+                queue = self._queues[to]
+                enqueued_at, release = queue.popleft()
+                if queue:
+                    self._ready.append(to)
+                else:
+                    del self._queues[to]
+
+                waited = now - enqueued_at
+                self.granted += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+                self._recent_waits.append(waited)
+            release()
+
+    def get_stats(self) -> dict:
+        """
+        Snapshot of queue depth and queue latency (seconds a send waited for its slot).
+
+        Returns:
+            dict: Waiting sends and recipients, granted sends, average/p95/max wait
+        """
+        with self._cond:
+            recent = sorted(self._recent_waits)
+            return {
+                "rate": self.rate,
+                "waiting": sum(len(queue) for queue in self._queues.values()),
+                "recipients_waiting": len(self._queues),
+                "granted": self.granted,
+                "wait_avg": self.wait_total / self.granted if self.granted else 0.0,
+                "wait_p95": recent[int(0.95 * (len(recent) - 1))] if recent else 0.0,
+                "wait_max": self.wait_max,
+            }
+
+_governors: Dict[str, OutboundGovernor] = {}
+_governors_lock = threading.Lock()
+
+def governor_for(from_number: str) -> OutboundGovernor:
+    """Return the shared governor of a sender number, creating it on first use."""
+    with _governors_lock:
+        governor = _governors.get(from_number)
+        if governor is None:
+            governor = OutboundGovernor()
+            _governors[from_number] = governor
+        return governor
+
+class TwilioSender:
+    """
+    Sends WhatsApp messages through Twilio's REST API over the shared
+    keep-alive connection pool, instead of one blocking SDK call at a time.
+
+    Parts of a long answer are pipelined: up to `concurrency` parts are in
+    flight at once, and each part starts only once the previous one has been
+    in flight for `stagger` seconds (or finished), so Twilio receives them in
+    order. While a part backs off after a 429/5xx, later parts wait for it;
+    only parts already in flight can overtake it. Retries use exponential
+    backoff with jitter and honour Retry-After.
+
+    Every attempt waits for a slot from the sender number's OutboundGovernor,
+    which paces all sends of the process and shares them fairly between users.
+    """
+
+    def __init__(self, account_sid: str = Config.TWILIO_ACCOUNT_SID,
+                 auth_token: str = Config.TWILIO_AUTH_TOKEN,
+                 from_number: str = Config.TWILIO_FROM_NUMBER,
+                 base_url: str = Config.TWILIO_API_BASE_URL,
+                 concurrency: int = Config.TWILIO_SEND_CONCURRENCY,
+                 stagger: float = Config.TWILIO_PART_STAGGER_MS / 1000,
+                 retries: int = Config.TWILIO_SEND_RETRIES,
+                 backoff: float = Config.TWILIO_RETRY_BACKOFF,
+                 threads: int = Config.TWILIO_SENDER_THREADS,
+                 governor: Optional[OutboundGovernor] = None):
+        self.url = f"{base_url.rstrip('/')}/2010-04-01/Accounts/{account_sid}/Messages.json"
+        self.auth = (account_sid, auth_token)
+        self.from_ = f"whatsapp:{from_number}"
+        self.concurrency = max(1, concurrency)
+        self.stagger = stagger
+        self.retries = retries
+        self.backoff = backoff
+        self.threads = max(1, threads)
+        self.timeout = (Config.HTTP_CONNECT_TIMEOUT, Config.TWILIO_HTTP_TIMEOUT)
+        self.governor = governor or governor_for(self.from_)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        """Part-sending threads, created on first use in each process."""
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="twilio-send")
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _post(self, to: str, body: str, media_url: Optional[str] = None) -> requests.Response:
+        data = {"To": to, "From": self.from_, "Body": body}
+        if media_url:
+            data["MediaUrl"] = media_url
+        start = time.perf_counter()
+        try:
+            return pooled_session().post(
+                self.url,
+                data=data,
+                auth=self.auth,
+                timeout=self.timeout
+            )
+        finally:
+            metrics.observe("twilio_send", time.perf_counter() - start)
+
+    def _retry_delay(self, attempt: int, resp: Optional[requests.Response]) -> float:
+        """Exponential backoff with full jitter; Retry-After wins when Twilio sends one."""
+        if resp is not None:
+            try:
+                return float(resp.headers["Retry-After"])
+            except (KeyError, ValueError):
+                pass
+        return random.uniform(0.5, 1.5) * self.backoff * (2 ** attempt)
+
+    def _deliver(self, to: str, body: str, result: SendResult,
+                 batch: Optional[_PartBatch] = None, index: int = 0,
+                 media_url: Optional[str] = None) -> SendResult:
+        """Send one message with retries, keeping the part batch state up to date."""
+        first_attempt = None
+        while True:
+            queued_at = time.perf_counter()
+            self.governor.acquire(to)
+            metrics.observe("twilio_queue", time.perf_counter() - queued_at)
+            if batch is not None:
+                with batch.cond:
+                    batch.state[index] = _PartBatch.IN_FLIGHT
+                    batch.started_at[index] = time.monotonic()
+                    batch.cond.notify_all()
+
+            now = time.perf_counter()
+            first_attempt = first_attempt or now
+            result.attempts += 1
+            resp = None
+            try:
+                resp = self._post(to, body, media_url)
+                if resp.status_code in (200, 201):
+                    result.sid = resp.json().get("sid")
+                    result.latency = time.perf_counter() - first_attempt
+                    self._record(result)
+                    return result
+                retryable = resp.status_code == 429 or resp.status_code >= 500
+                error = TwilioSendError(f"Twilio returned {resp.status_code}: {resp.text[:200]}", resp.status_code)
+            except requests.ConnectionError as e:
+                # Connection refused/reset before Twilio took the request: safe to send again
+                retryable, error = True, e
+            except Exception as e:
+                # Includes read timeouts: the message may have been created, so never resend it
+                retryable, error = False, e
+
+            if not retryable or result.attempts > self.retries:
+                result.error = error
+                self.failed += 1
+                return result
+
+            delay = self._retry_delay(result.attempts - 1, resp)
+            self.retried += 1
+            logger.warning("🔁 Retrying part %s to %s in %.2fs: %s", result.part, to, delay, error)
+            if batch is not None:
+                with batch.cond:
+                    batch.state[index] = _PartBatch.BACKOFF
+            time.sleep(delay)
+
+    def _record(self, result: SendResult):
+        self.sent += 1
+        self.latency_total += result.latency
+        self.latency_max = max(self.latency_max, result.latency)
+
+    def _wait_for_turn(self, batch: _PartBatch, index: int) -> bool:
+        """
+        Block until part `index` may start (ordering and window).
+
+        Returns:
+            bool: False if an earlier part failed and nothing more should be sent
+        """
+        with batch.cond:
+            while batch.error is None:
+                window_free = index < self.concurrency or batch.state[index - self.concurrency] == _PartBatch.DONE
+                wait = 0.0 if index == 0 else self._predecessor_wait(batch, index - 1)
+                if window_free and wait == 0.0:
+                    return True
+                batch.cond.wait(wait or None)
+            return False
+
+    def _send_part(self, batch: _PartBatch, index: int, to: str, body: str) -> SendResult:
+        """Deliver a part whose turn has come and mark it done."""
+        result = SendResult(part=index + 1)
+        self._deliver(to, body, result, batch, index)
+        with batch.cond:
+            if result.error is not None:
+                batch.error = batch.error or result.error
+            batch.state[index] = _PartBatch.DONE
+            batch.cond.notify_all()
+        return result
+
+    def _predecessor_wait(self, batch: _PartBatch, previous: int) -> Optional[float]:
+        """
+        Seconds until the next part may start after `previous` (0.0: now), or
+        None to wait for a notification (previous part not started or backing off).
+        """
+        state = batch.state[previous]
+        if state == _PartBatch.DONE:
+            return 0.0
+        if state != _PartBatch.IN_FLIGHT:
+            return None
+        return max(0.0, batch.started_at[previous] + self.stagger - time.monotonic())
+
+    def send(self, to: str, body: str, media_url: Optional[str] = None) -> SendResult:
+        """
+        Send a single WhatsApp message, retrying 429/5xx responses.
+        With media_url, Twilio fetches that file and attaches it, with body as caption.
+
+        Raises:
+            Exception: The last error if the message could not be sent
+        """
+        result = self._deliver(to, body, SendResult(), media_url=media_url)
+        if result.error is not None:
+            raise result.error
+        return result
+
+    def send_parts(self, to: str, bodies: List[str]) -> List[SendResult]:
+        """
+        Send the parts of one answer, pipelined but in order.
+
+        Raises:
+            Exception: The first error; parts after a failed one are not sent
+        """
+        if len(bodies) == 1:
+            return [self.send(to, bodies[0])]
+
+        # The calling thread schedules the parts: each is handed to the pool only once
+        # it may start, so pool threads never sit waiting for their turn
+        batch = _PartBatch(len(bodies))
+        futures = []
+        for i, body in enumerate(bodies):
+            if not self._wait_for_turn(batch, i):
+                break  # An earlier part failed: don't send past the gap
+            futures.append(self._pool().submit(self._send_part, batch, i, to, body))
+        results = [future.result() for future in futures]
+        for result in results:
+            if result.error is not None:
+                raise result.error
+        return results
+
+    def get_stats(self) -> dict:
+        """
+        Snapshot of send metrics.
+
+        Returns:
+            dict: Sent, failed and retried counts, average and maximum per-part latency,
+                and the outbound governor's queue metrics
+        """
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "latency_avg": self.latency_total / self.sent if self.sent else 0.0,
+            "latency_max": self.latency_max,
+            "governor": self.governor.get_stats(),
+        }
+
+# Global sender instance shared by all worker threads
+twilio_sender = TwilioSender()
+
 def send_whatsapp_message(to: str, body: str):
     """
     Send a WhatsApp message via Twilio with automatic message splitting for long content.
     
-    WhatsApp has a 1600 character limit per message. If the message is longer,
-    it will be split into multiple messages with part indicators.
+    WhatsApp has a 1600 character limit per message, counted in UTF-16 units.
+    If the message is longer, it will be split into multiple messages with part indicators.
 
     Parameters:
       to (str): The recipient's WhatsApp number in E.164 format, 
@@ -22,98 +420,133 @@ def send_whatsapp_message(to: str, body: str):
       body (str): The text content of the message.
 
     Returns:
-      list: List of MessageInstance objects representing the sent messages.
+      list: List of SendResult objects (SID, attempts, latency) for the sent messages.
     """
     try:
-        max_chars = Config.MAX_MSG_CHARS
+        start = time.perf_counter()
+        chunks = split_message(body, Config.MAX_MSG_CHARS)
+        metrics.observe("split", time.perf_counter() - start)
         
         # If message fits in one message, send normally
-        if len(body) <= max_chars:
-            message = _twilio.messages.create(
-                from_=f"whatsapp:{Config.TWILIO_FROM_NUMBER}",
-                body=body,
-                to=to
-            )
-            logger.info(f"📤 Sent WhatsApp message to {to}: {len(body)} chars (SID: {message.sid})")
+        if len(chunks) == 1:
+            message = twilio_sender.send(to, body)
+            logger.info("📤 Sent WhatsApp message to %s: %s chars in %.0fms (SID: %s)", to, len(body),
+                        message.latency * 1000, message.sid)
             return [message]
         
-        # Split long message into chunks
-        logger.info(f"📤 Message too long ({len(body)} chars), splitting into parts...")
-        messages = []
-        chunks = _split_message(body, max_chars)
+        # Add part indicators for multiple messages
+        logger.info("📤 Message too long (%s chars), split into %s parts", len(body), len(chunks))
+        parts = [part_header(i, len(chunks)) + chunk for i, chunk in enumerate(chunks, 1)]
+        messages = twilio_sender.send_parts(to, parts)
         
-        for i, chunk in enumerate(chunks, 1):
-            # Add part indicator for multiple messages
-            part_header = f"[Part {i}/{len(chunks)}]\n"
-            chunk_with_header = part_header + chunk
-            
-            message = _twilio.messages.create(
-                from_=f"whatsapp:{Config.TWILIO_FROM_NUMBER}",
-                body=chunk_with_header,
-                to=to
-            )
-            messages.append(message)
-            logger.info(f"📤 Sent part {i}/{len(chunks)} to {to}: {len(chunk_with_header)} chars (SID: {message.sid})")
+        for message, part in zip(messages, parts):
+            logger.info("📤 Sent part %s/%s to %s: %s chars in %.0fms, %s attempts (SID: %s)",
+                        message.part, len(parts), to, len(part), message.latency * 1000, message.attempts, message.sid)
         
-        logger.info(f"📤 Completed sending {len(chunks)} parts to {to}: total {len(body)} chars")
+        logger.info("📤 Completed sending %s parts to %s: total %s chars", len(chunks), to, len(body))
         return messages
         
     except Exception as e:
-        logger.error(f"❌ Failed to send WhatsApp message to {to}: {e}")
+        logger.error("❌ Failed to send WhatsApp message to %s: %s", to, e)
         raise
 
-def _split_message(text: str, max_chars: int) -> list:
+def send_whatsapp_media(to: str, body: str, media_url: str) -> SendResult:
     """
-    Split a long message into chunks that respect WhatsApp's character limit.
-    Tries to split at natural breakpoints (paragraphs, sentences) when possible.
-    
-    Args:
-        text (str): The text to split
-        max_chars (int): Maximum characters per chunk (accounting for part headers)
-        
+    Send one WhatsApp message with an attached file (document, image...).
+
+    Parameters:
+      to (str): The recipient's WhatsApp number, prefixed by 'whatsapp:'.
+      body (str): Caption shown with the file; must fit in one message.
+      media_url (str): Public URL Twilio downloads the file from.
+
     Returns:
-        list: List of text chunks
+      SendResult: SID, attempts and latency of the sent message.
     """
-    # Reserve space for part headers like "[Part 1/3]\n"
-    header_space = 15
-    chunk_limit = max_chars - header_space
-    
-    if len(text) <= chunk_limit:
-        return [text]
-    
-    chunks = []
-    remaining = text
+    try:
+        message = twilio_sender.send(to, body, media_url=media_url)
+        logger.info("📎 Sent WhatsApp media to %s: %s with %s chars in %.0fms (SID: %s)", to, media_url, len(body),
+                    message.latency * 1000, message.sid)
+        return message
+    except Exception as e:
+        logger.error("❌ Failed to send WhatsApp media to %s: %s", to, e)
+        raise
+
+class WhatsAppStream:
+    """
+    Incremental WhatsApp sender for answers that are still streaming in.
+
+    Text is fed chunk by chunk; a part is sent as soon as it is full (using the
+    same breakpoint rules as split_message) or, once it holds at least
+    min_part_chars, as soon as a paragraph boundary arrives. Streamed parts
+    carry a "[Part N]" header because the total is not known up front; the
+    part sent by close() is marked "[Part N/N]".
     
-    while remaining:
-        if len(remaining) <= chunk_limit:
-            chunks.append(remaining)
-            break
-        
-        # Find the best split point within the limit
-        split_point = chunk_limit
-        
-        # Try to split at paragraph breaks first (double newlines)
-        paragraph_split = remaining.rfind('\n\n', 0, chunk_limit)
-        if paragraph_split > chunk_limit * 0.6:  # Don't split too early
-            split_point = paragraph_split + 2
-        else:
-            # Try to split at line breaks
-            line_split = remaining.rfind('\n', 0, chunk_limit)
-            if line_split > chunk_limit * 0.7:
-                split_point = line_split + 1
+    A failed send stops the stream; the error is re-raised by close().
+    """
+
+    def __init__(self, to: str, max_chars: int = Config.MAX_MSG_CHARS,
+                 min_part_chars: int = Config.STREAMING_MIN_PART_CHARS):
+        self.to = to
+        self.max_chars = max_chars
+        self.min_part_chars = min(max(1, min_part_chars), max_chars - len(part_header(1, 1)))
+        self.parts_sent = 0
+        self.messages = []
+        self.error = None
+        self._buffer = ""
+
+    def feed(self, text: str):
+        """Add streamed text and send every part that is complete."""
+        if self.error is not None:
+            return
+        self._buffer += text
+
+        while True:
+            # Leave room for the longest header this part can get: "[Part N/N]" if it ends up last
+            parts = self.parts_sent + 1
+            chunk_limit = self.max_chars - len(part_header(parts, parts))
+            if utf16_len(self._buffer) > chunk_limit:
+                split_point = find_split_point(self._buffer, chunk_limit)
             else:
-                # Try to split at sentence boundaries
-                sentence_split = remaining.rfind('. ', 0, chunk_limit)
-                if sentence_split > chunk_limit * 0.7:
-                    split_point = sentence_split + 2
-                else:
-                    # Try to split at word boundaries
-                    word_split = remaining.rfind(' ', 0, chunk_limit)
-                    if word_split > chunk_limit * 0.8:
-                        split_point = word_split + 1
+                paragraph_split = self._buffer.rfind('\n\n')
+                if paragraph_split < self.min_part_chars:
+                    break
+                split_point = paragraph_split + 2
+
+            part = self._buffer[:split_point].strip()
+            self._buffer = self._buffer[split_point:]
+            if part and not self._send(f"[Part {parts}]\n{part}"):
+                break
+
+    def close(self) -> int:
+        """
+        Send whatever is left as the final part.
         
-        chunk = remaining[:split_point].strip()
-        chunks.append(chunk)
-        remaining = remaining[split_point:].strip()
-    
-    return chunks
+        Returns:
+            int: Total number of parts sent
+        """
+        part = self._buffer.strip()
+        self._buffer = ""
+        if part and self.error is None:
+            if self.parts_sent:
+                total = self.parts_sent + 1
+                part = part_header(total, total) + part
+            self._send(part)
+
+        if self.error is not None:
+            raise self.error
+        logger.info("📤 Completed streaming %s parts to %s", self.parts_sent, self.to)
+        return self.parts_sent
+
+    def _send(self, body: str) -> bool:
+        try:
+            message = twilio_sender.send(self.to, body)
+        except Exception as e:
+            logger.error("❌ Failed to stream WhatsApp part to %s: %s", self.to, e)
+            self.error = e
+            return False
+
+        self.parts_sent += 1
+        self.messages.append(message)
+        logger.info("📤 Streamed part %s to %s: %s chars (SID: %s)", self.parts_sent, self.to, len(body),
+                    message.sid)
+        return True
@@ -0,0 +1,173 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from app.settings.config import Config
+from app.utils.logger import setup_logging, get_logger
+
+logger = get_logger(__name__)
+
+def _worker_thread(stop: threading.Event):
+    """Claim journaled jobs and process them until asked to stop."""
+    from app.services.job_journal import job_journal
+    from app.services.message_processor import handle_incoming
+
+    idle_wait = Config.WORKER_POLL_INTERVAL
+    while not stop.is_set():
+        try:
+            job = job_journal.claim_next()
+        except Exception as e:
+            logger.error("❌ Failed to claim a job: %s", e)
+            stop.wait(1)
+            continue
+
+        if job is None:
+            # Poll less often the longer the queue stays empty
+            stop.wait(idle_wait)
+            idle_wait = min(Config.WORKER_POLL_MAX_INTERVAL, idle_wait * 2)
+            continue
+        idle_wait = Config.WORKER_POLL_INTERVAL
+
+        if len(job["ids"]) > 1:
+            logger.info("🧩 Answering %s merged messages from %s as one question", len(job["ids"]), job["phone_number"])
+        try:
+            try:
+                # handle_incoming reports its own errors to the user
+                handle_incoming(job["sender"], job["phone_number"], job["body"])
+            finally:
+                # Heartbeats keep this process's jobs alive, so an unfinished one would never be retried
+                job_journal.mark_done(*job["ids"])
+        except Exception:
+            # Keep the thread serving; one bad job must not take a worker slot with it
+            logger.exception("❌ Worker job %s for %s failed", job["ids"], job["phone_number"])
+
+def run_worker_process(threads: int = Config.WORKER_THREADS):
+    """
+    Entry point of one worker process: runs `threads` job loops and returns
+    once SIGTERM/SIGINT was received and the jobs in progress finished.
+    """
+    setup_logging()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    workers = [threading.Thread(target=_worker_thread, args=(stop,), name=f"worker-{i}")
+               for i in range(max(1, threads))]
+    for worker in workers:
+        worker.start()
+    logger.info("👷 Worker process %s started with %s threads", os.getpid(), len(workers))
+
+    for worker in workers:
+        worker.join()
+    logger.info("👋 Worker process %s stopped", os.getpid())
+
+class WorkerSupervisor:
+    """
+    Runs a pool of worker processes that answer messages queued in the job
+    journal by the webhook (WORKER_MODE=external).
+
+    Crashed workers are restarted, with a growing delay if they keep dying
+    right after start, and the jobs they were running go back to the queue.
+    Running jobs whose lease expired (workers on another host or container
+    that died) are requeued every JOB_JOURNAL_LEASE seconds.
+    """
+
+    # A worker that dies sooner than this after starting counts as crash-looping
+    MIN_UPTIME = 10.0
+    MAX_RESTART_DELAY = 30.0
+
+    def __init__(self, processes: int = Config.WORKER_PROCESSES, threads: int = Config.WORKER_THREADS):
+        self.processes = processes or os.cpu_count() or 1
+        self.threads = threads
+        # Fresh interpreters: forking a process that already runs threads is unsafe
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = {}  # slot -> (process, started_at)
+        self._restart_delay = {}  # slot -> seconds to wait before the next restart
+        self._stopping = False
+
+        # Metrics
+        self.restarts = 0
+
+    def _start(self, slot: int):
+        process = self._context.Process(target=run_worker_process, args=(self.threads,),
+                                        name=f"ayd-worker-{slot}")
+        process.start()
+        self._workers[slot] = (process, time.monotonic())
+
+    def _reap(self, slot: int, process, started_at: float):
+        """Handle a worker that exited: requeue its jobs and schedule a restart."""
+        from app.services.job_journal import job_journal
+
+        requeued = job_journal.requeue_process(process.pid)
+        logger.error("💥 Worker %s exited with code %s, requeued %s jobs", process.pid, process.exitcode, requeued)
+
+        if time.monotonic() - started_at < self.MIN_UPTIME:
+            delay = min(self.MAX_RESTART_DELAY, max(1.0, self._restart_delay.get(slot, 0.5) * 2))
+        else:
+            delay = 0.0
+        self._restart_delay[slot] = delay
+        return delay
+
+    def _stop(self, *_):
+        self._stopping = True
+
+    def run(self, drain_timeout: float = Config.DISPATCHER_DRAIN_TIMEOUT):
+        """Start the workers and supervise them until SIGTERM/SIGINT."""
+        from app.services.job_journal import job_journal
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        requeued = job_journal.requeue_dead_owners()
+        if requeued:
+            logger.info("♻️ Requeued %s jobs left running by stopped workers", requeued)
+
+        for slot in range(self.processes):
+            self._start(slot)
+        logger.info("🚀 Supervising %s worker processes x %s threads", self.processes, self.threads)
+
+        restart_at = {}  # slot -> monotonic time of the pending restart
+        reclaim_at = time.monotonic() + job_journal.lease
+        while not self._stopping:
+            now = time.monotonic()
+            if now >= reclaim_at:
+                # Jobs of workers on other hosts, or of processes that vanished without being reaped
+                reclaim_at = now + job_journal.lease
+                try:
+                    requeued = job_journal.requeue_dead_owners()
+                    if requeued:
+                        logger.info("♻️ Requeued %s jobs whose lease expired", requeued)
+                except Exception as e:
+                    logger.error("❌ Failed to requeue expired jobs: %s", e)
+            for slot, (process, started_at) in list(self._workers.items()):
+                if slot in restart_at or process.is_alive():
+                    continue
+                process.join()
+                restart_at[slot] = now + self._reap(slot, process, started_at)
+
+            for slot, when in list(restart_at.items()):
+                if now >= when:
+                    del restart_at[slot]
+                    self._start(slot)
+                    self.restarts += 1
+            time.sleep(0.5)
+
+        self.shutdown(drain_timeout)
+
+    def shutdown(self, timeout: float):
+        """Ask workers to finish their current jobs, then kill whatever is left."""
+        logger.info("🛑 Stopping %s worker processes", len(self._workers))
+        processes = [process for process, _ in self._workers.values()]
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("⚠️ Worker %s did not stop in time, killing it", process.pid)
+                process.kill()
+                process.join()
+        logger.info("✅ All worker processes stopped")
@@ -20,7 +20,7 @@ class Config:
     HOST = os.getenv("HOST", "0.0.0.0")
     PORT = int(os.getenv("PORT", 5000))
 
-    # Maximum characters allowed per outgoing WhatsApp message
+    # Maximum characters allowed per outgoing WhatsApp message, counted in UTF-16 units
     MAX_MSG_CHARS = int(os.getenv("MAX_SMS_CHARS", 1600))
 
     # Twilio credentials
@@ -38,8 +38,224 @@ class Config:
     # Chatbot ID to route queries within AskYourDatabase
     AYD_CHAT_ID = os.getenv("ASKYOURDATABASE_CHAT_ID")
     # Base URL for the AskYourDatabase service
-    AYD_BASE_URL = "https://www.askyourdatabase.com"
+    AYD_BASE_URL = os.getenv("ASKYOURDATABASE_BASE_URL", "https://www.askyourdatabase.com")
 
     # Rate Limiter settings
     # Maximum requests per user per minute to prevent abuse
     RATE_LIMITER_MAX_REQUESTS_PER_MINUTE = int(os.getenv("RATE_LIMITER_MAX_REQUESTS_PER_MINUTE", 5))
+    # Limiter implementation: "token_bucket" (O(1), bounded memory), "simple" (timestamp log),
+    # "mmap" (shared by all workers on one host) or "redis" (shared through a Redis-protocol server)
+    RATE_LIMITER_BACKEND = os.getenv("RATE_LIMITER_BACKEND", "token_bucket").lower()
+    # Memory-mapped state file and its number of user slots (mmap backend, 16 bytes per slot)
+    RATE_LIMITER_MMAP_PATH = os.getenv("RATE_LIMITER_MMAP_PATH", "rate_limits.bin")
+    RATE_LIMITER_MMAP_SLOTS = int(os.getenv("RATE_LIMITER_MMAP_SLOTS", 262144))
+    # Server URL (redis://host:port/db or unix:///path.sock) and key prefix (redis backend)
+    RATE_LIMITER_REDIS_URL = os.getenv("RATE_LIMITER_REDIS_URL", "redis://127.0.0.1:6379/0")
+    RATE_LIMITER_REDIS_PREFIX = os.getenv("RATE_LIMITER_REDIS_PREFIX", "ayd:rl:")
+
+    # Idempotency settings
+    # Ignore webhook retries (same MessageSid) before rate limiting or any work
+    IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "True").lower() == "true"
+    # "memory" (per process) or "sqlite" (shared by all processes on the host)
+    IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory").lower()
+    # Seconds a MessageSid is remembered
+    IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 3600))
+    # MessageSids kept at most; the oldest are forgotten first
+    IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 100000))
+    # Database file (sqlite backend)
+    IDEMPOTENCY_SQLITE_PATH = os.getenv("IDEMPOTENCY_SQLITE_PATH", "idempotency.db")
+
+    # Session storage settings
+    # Backend for phone number -> access token mapping: "csv", "journal" or "sqlite"
+    SESSION_STORAGE_BACKEND = os.getenv("SESSION_STORAGE_BACKEND", "csv").lower()
+    # CSV file used by the csv/journal backends (and migrated once by the sqlite backend)
+    SESSION_CSV_PATH = os.getenv("SESSION_CSV_PATH", "ayd_sessions.csv")
+    # Number of journal writes between compactions (journal backend)
+    SESSION_JOURNAL_COMPACT_EVERY = int(os.getenv("SESSION_JOURNAL_COMPACT_EVERY", 1000))
+    # SQLite database file (sqlite backend); use this one for multi-worker deployments
+    SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "ayd_sessions.db")
+
+    # Dispatcher settings
+    # Worker threads processing incoming messages (AYD query + WhatsApp reply)
+    DISPATCHER_WORKERS = int(os.getenv("DISPATCHER_WORKERS", 8))
+    # Maximum queued messages before new ones get a "busy, try later" reply
+    DISPATCHER_MAX_QUEUE_SIZE = int(os.getenv("DISPATCHER_MAX_QUEUE_SIZE", 100))
+    # Seconds to wait for queued messages to finish on shutdown
+    DISPATCHER_DRAIN_TIMEOUT = float(os.getenv("DISPATCHER_DRAIN_TIMEOUT", 30))
+
+    # Message merging settings
+    # Seconds to wait for more messages from the same user before asking AYD (0 = off)
+    MERGE_WINDOW = float(os.getenv("MERGE_WINDOW", 0))
+    # A merged question waits at most this many seconds after its first message
+    MERGE_MAX_WAIT = float(os.getenv("MERGE_MAX_WAIT", 6))
+    # Messages merged into one question at most
+    MERGE_MAX_MESSAGES = int(os.getenv("MERGE_MAX_MESSAGES", 10))
+
+    # Outgoing HTTP connection pool settings (shared by all AYD requests)
+    # Number of hosts to keep connection pools for
+    HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 4))
+    # Keep-alive connections kept per host; match this to DISPATCHER_WORKERS
+    HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 16))
+    # Seconds to wait for a TCP/TLS connection to be established
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+    # Seconds to wait between bytes of a response (covers slow AYD streams)
+    HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 60))
+    # Maximum bytes read from the AYD answer stream at once
+    SSE_READ_SIZE = int(os.getenv("SSE_READ_SIZE", 65536))
+    # Retries for idempotent requests (GET/HEAD/...) on connection errors and 429/5xx
+    HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+    # Exponential backoff factor between retries, in seconds
+    HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", 0.5))
+
+    # AYD upstream guard settings (adaptive concurrency limit + circuit breaker, per process)
+    # Enable the guard around AYD questions
+    AYD_GUARD_ENABLED = os.getenv("AYD_GUARD_ENABLED", "True").lower() == "true"
+    # Concurrent AYD questions allowed at start, and the range the limit moves in
+    AYD_GUARD_INITIAL_LIMIT = float(os.getenv("AYD_GUARD_INITIAL_LIMIT", 8))
+    AYD_GUARD_MIN_LIMIT = float(os.getenv("AYD_GUARD_MIN_LIMIT", 1))
+    AYD_GUARD_MAX_LIMIT = float(os.getenv("AYD_GUARD_MAX_LIMIT", 64))
+    # Seconds until the first event of an answer before it counts as slow and lowers the limit
+    # (set it a little above the usual ayd_first_byte time on /metrics)
+    AYD_GUARD_LATENCY_TARGET = float(os.getenv("AYD_GUARD_LATENCY_TARGET", 20))
+    # Factor the limit is multiplied by after a failure or slow answer
+    AYD_GUARD_BACKOFF = float(os.getenv("AYD_GUARD_BACKOFF", 0.5))
+    # Seconds a question waits for a free slot before the user gets a "busy" reply
+    AYD_GUARD_QUEUE_TIMEOUT = float(os.getenv("AYD_GUARD_QUEUE_TIMEOUT", 10))
+    # Failures in a row that open the circuit
+    AYD_GUARD_FAILURE_THRESHOLD = int(os.getenv("AYD_GUARD_FAILURE_THRESHOLD", 5))
+    # Seconds the circuit stays open before probing AYD again
+    AYD_GUARD_OPEN_SECONDS = float(os.getenv("AYD_GUARD_OPEN_SECONDS", 30))
+    # Questions let through at once as probes while half-open
+    AYD_GUARD_HALF_OPEN_PROBES = int(os.getenv("AYD_GUARD_HALF_OPEN_PROBES", 1))
+
+    # Streaming delivery settings
+    # Send WhatsApp parts while the AYD answer is still streaming in
+    STREAMING_DELIVERY = os.getenv("STREAMING_DELIVERY", "False").lower() == "true"
+    # Minimum characters in a streamed part before a paragraph break flushes it
+    STREAMING_MIN_PART_CHARS = int(os.getenv("STREAMING_MIN_PART_CHARS", 300))
+
+    # Execution mode settings
+    # "threaded" (Flask + worker pool) or "async" (ASGI + asyncio, needs requirements-async.txt)
+    EXECUTION_MODE = os.getenv("EXECUTION_MODE", "threaded").lower()
+    # Maximum concurrently processed messages in async mode
+    ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", 1000))
+    # Maximum open connections in the async HTTP pool
+    ASYNC_HTTP_POOL_LIMIT = int(os.getenv("ASYNC_HTTP_POOL_LIMIT", 100))
+
+    # Answer cache settings
+    # Serve repeated questions from an in-memory cache instead of a full AYD round trip
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "False").lower() == "true"
+    # Who shares cached answers: "chatbot" (all users of this chatbot) or "user" (per phone number)
+    ANSWER_CACHE_SCOPE = os.getenv("ANSWER_CACHE_SCOPE", "chatbot").lower()
+    # Seconds a cached answer stays valid
+    ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 300))
+    # Maximum number of cached answers
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+    # Approximate memory budget for cached answers, in bytes
+    ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+    # Keyword at the start or end of a message that forces a fresh answer
+    ANSWER_CACHE_BYPASS_KEYWORD = os.getenv("ANSWER_CACHE_BYPASS_KEYWORD", "#fresh")
+
+    # Request coalescing settings
+    # Let concurrent identical questions share one upstream AYD call
+    REQUEST_COALESCING_ENABLED = os.getenv("REQUEST_COALESCING_ENABLED", "False").lower() == "true"
+    # Seconds after an AYD call started during which identical questions may join it
+    REQUEST_COALESCING_WINDOW = float(os.getenv("REQUEST_COALESCING_WINDOW", 30))
+
+    # Job journal settings
+    # Record every accepted message on disk before acknowledging it, and replay unfinished ones at startup
+    JOB_JOURNAL_ENABLED = os.getenv("JOB_JOURNAL_ENABLED", "False").lower() == "true"
+    # SQLite database file holding the journal (shared by all workers on this host)
+    JOB_JOURNAL_PATH = os.getenv("JOB_JOURNAL_PATH", "jobs.db")
+    # Milliseconds the journal writer waits to group concurrent writes into one commit
+    JOB_JOURNAL_COMMIT_INTERVAL_MS = float(os.getenv("JOB_JOURNAL_COMMIT_INTERVAL_MS", 2))
+    # Maximum writes grouped into one commit
+    JOB_JOURNAL_BATCH_SIZE = int(os.getenv("JOB_JOURNAL_BATCH_SIZE", 256))
+    # Seconds finished jobs are kept before being purged at startup
+    JOB_JOURNAL_RETENTION = float(os.getenv("JOB_JOURNAL_RETENTION", 7 * 24 * 3600))
+    # Seconds without a heartbeat after which an unfinished job's process counts as gone and the job is taken over
+    JOB_JOURNAL_LEASE = float(os.getenv("JOB_JOURNAL_LEASE", 60))
+    # Attempts (worker claims or replays) after which an unfinished job is marked failed instead of retried
+    JOB_JOURNAL_MAX_ATTEMPTS = int(os.getenv("JOB_JOURNAL_MAX_ATTEMPTS", 5))
+
+    # Worker settings
+    # "inprocess" (webhook process answers messages) or "external" (webhook only enqueues, run `python worker.py`)
+    WORKER_MODE = os.getenv("WORKER_MODE", "inprocess").lower()
+    # Worker processes started by worker.py (0 = one per CPU core)
+    WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 0))
+    # Messages processed concurrently by each worker process
+    WORKER_THREADS = int(os.getenv("WORKER_THREADS", 8))
+    # Seconds an idle worker waits before checking the journal again
+    WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", 0.05))
+    # Longest wait between polls; the wait doubles from WORKER_POLL_INTERVAL while the journal stays empty
+    WORKER_POLL_MAX_INTERVAL = float(os.getenv("WORKER_POLL_MAX_INTERVAL", 1.0))
+    # Pending journal jobs above which the webhook answers "busy" (external mode)
+    WORKER_MAX_PENDING = int(os.getenv("WORKER_MAX_PENDING", 1000))
+
+    # Session renewer settings
+    # Renew AYD sessions in the background before they expire, so users never wait on session creation
+    SESSION_RENEWER_ENABLED = os.getenv("SESSION_RENEWER_ENABLED", "False").lower() == "true"
+    # Renew sessions expiring within this many seconds
+    SESSION_RENEW_WINDOW = float(os.getenv("SESSION_RENEW_WINDOW", 12 * 3600))
+    # Seconds between scans of the session storage
+    SESSION_RENEW_INTERVAL = float(os.getenv("SESSION_RENEW_INTERVAL", 300))
+    # Maximum session renewals/pre-creations per minute, evenly paced
+    SESSION_RENEW_RATE_PER_MINUTE = float(os.getenv("SESSION_RENEW_RATE_PER_MINUTE", 30))
+    # Lock file electing the one process per host that runs the renewer
+    SESSION_RENEW_LOCK_PATH = os.getenv("SESSION_RENEW_LOCK_PATH", "ayd_sessions.renew.lock")
+    # Only renew sessions used within this many seconds (0 = renew every session)
+    SESSION_RENEW_ACTIVE_WITHIN = float(os.getenv("SESSION_RENEW_ACTIVE_WITHIN", 3 * 24 * 3600))
+
+    # Twilio sender settings
+    # Base URL of the Twilio REST API (point it at a fake endpoint for load tests)
+    TWILIO_API_BASE_URL = os.getenv("TWILIO_API_BASE_URL", "https://api.twilio.com")
+    # Parts of one answer in flight at the same time
+    TWILIO_SEND_CONCURRENCY = int(os.getenv("TWILIO_SEND_CONCURRENCY", 3))
+    # Milliseconds a part must be in flight before the next part starts (keeps parts in order)
+    TWILIO_PART_STAGGER_MS = float(os.getenv("TWILIO_PART_STAGGER_MS", 50))
+    # Retries for a part after 429/5xx responses or connection errors
+    TWILIO_SEND_RETRIES = int(os.getenv("TWILIO_SEND_RETRIES", 4))
+    # Base backoff in seconds between retries (doubled per attempt, with jitter)
+    TWILIO_RETRY_BACKOFF = float(os.getenv("TWILIO_RETRY_BACKOFF", 0.5))
+    # Threads sending message parts, shared by all answers in the process
+    TWILIO_SENDER_THREADS = int(os.getenv("TWILIO_SENDER_THREADS", 16))
+    # Seconds to wait for Twilio to answer a send request
+    TWILIO_HTTP_TIMEOUT = float(os.getenv("TWILIO_HTTP_TIMEOUT", 15))
+    # Messages per second allowed per sender number, for this process (0 = unlimited)
+    TWILIO_SEND_RATE = float(os.getenv("TWILIO_SEND_RATE", 80))
+    # Messages that may go out back to back before the rate applies
+    TWILIO_SEND_BURST = int(os.getenv("TWILIO_SEND_BURST", 10))
+
+    # Attachment settings
+    # Send large tables / very long answers as one file plus a short summary
+    ATTACHMENTS_ENABLED = os.getenv("ATTACHMENTS_ENABLED", "False").lower() == "true"
+    # Directory holding the generated (gzip-compressed) files
+    ATTACHMENTS_DIR = os.getenv("ATTACHMENTS_DIR", "attachments")
+    # Public base URL Twilio downloads files from (default: origin of TWILIO_WEBHOOK_URL)
+    ATTACHMENTS_BASE_URL = os.getenv("ATTACHMENTS_BASE_URL", "")
+    # Tables with at least this many rows are sent as a CSV file
+    ATTACHMENTS_MIN_TABLE_ROWS = int(os.getenv("ATTACHMENTS_MIN_TABLE_ROWS", 20))
+    # Answers needing more than this many messages are sent as a text file
+    ATTACHMENTS_MAX_PARTS = int(os.getenv("ATTACHMENTS_MAX_PARTS", 4))
+    # Table rows kept in the summary message as a preview
+    ATTACHMENTS_PREVIEW_ROWS = int(os.getenv("ATTACHMENTS_PREVIEW_ROWS", 5))
+    # Seconds files stay downloadable
+    ATTACHMENTS_TTL = int(os.getenv("ATTACHMENTS_TTL", 86400))
+
+    # Metrics settings
+    # Record per-stage latency histograms and serve them at /metrics
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+    # Bearer token required to read /metrics (empty: no authentication)
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+    # Logging settings
+    # "queue": log calls only enqueue, a background thread writes the files; "sync": write in the caller
+    LOG_MODE = os.getenv("LOG_MODE", "queue").lower()
+    # Records buffered in queue mode; when full, new records are dropped (and counted)
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    # "text" or "json" (one JSON object per line)
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+    # Minimum level written: DEBUG, INFO, WARNING or ERROR
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    # Directory holding app.log and its rotated backups
+    LOG_DIR = os.getenv("LOG_DIR", "logs")
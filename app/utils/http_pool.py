@@ -0,0 +1,73 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from app.settings.config import Config
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_lock = threading.Lock()
+_adapter = None
+_adapter_pid = None
+
+def _shared_adapter() -> HTTPAdapter:
+    """
+    Return the process-wide HTTP adapter, creating it on first use.
+
+    The adapter owns the urllib3 connection pools, so every session mounting it
+    reuses the same keep-alive connections. It is recreated after a fork so
+    worker processes never share sockets with their parent.
+    """
+    global _adapter, _adapter_pid
+
+    pid = os.getpid()
+    if _adapter is not None and _adapter_pid == pid:
+        return _adapter
+
+    with _lock:
+        if _adapter is None or _adapter_pid != pid:
+            # Retries only apply to idempotent methods (GET, HEAD, PUT, DELETE, OPTIONS, TRACE);
+            # POSTs such as /api/ask are never replayed.
+            retry = Retry(
+                total=Config.HTTP_RETRIES,
+                backoff_factor=Config.HTTP_RETRY_BACKOFF,
+                status_forcelist=(429, 502, 503, 504),
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                raise_on_status=False
+            )
+            _adapter = HTTPAdapter(
+                pool_connections=Config.HTTP_POOL_CONNECTIONS,
+                pool_maxsize=Config.HTTP_POOL_MAXSIZE,
+                max_retries=retry
+            )
+            _adapter_pid = pid
+            logger.info("🔌 Created HTTP connection pool (maxsize=%s, retries=%s)", Config.HTTP_POOL_MAXSIZE, Config.HTTP_RETRIES)
+    return _adapter
+
+def pooled_session() -> requests.Session:
+    """
+    Create a requests.Session backed by the shared connection pool.
+
+    Each session keeps its own cookie jar (AYD logins rely on per-user cookies)
+    while TCP/TLS connections are reused across all sessions in the process.
+    Do not call close() on the returned session: that would close the shared pool.
+
+    Returns:
+        requests.Session: Session with the pooled adapter mounted for http and https
+    """
+    sess = requests.Session()
+    adapter = _shared_adapter()
+    sess.mount("https://", adapter)
+    sess.mount("http://", adapter)
+    return sess
+
+def http_timeout() -> tuple:
+    """
+    Separate connect/read timeouts for outgoing requests.
+
+    Returns:
+        tuple: (connect_timeout, read_timeout) in seconds
+    """
+    return (Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT)
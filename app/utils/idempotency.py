@@ -0,0 +1,235 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from app.settings.config import Config
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class MemoryIdempotencyStore:
+    """
+    In-memory record of the webhook MessageSids seen recently (per process).
+
+    Twilio retries a webhook that timed out or failed with the same
+    MessageSid; claim() lets only the first delivery through. Entries expire
+    after `ttl` seconds and the oldest are evicted beyond `max_entries`, so
+    memory stays bounded during a retry storm.
+    """
+
+    # claim() is a dict operation, cheap enough to call on the event loop
+    blocking = False
+
+    def __init__(self, ttl: float = Config.IDEMPOTENCY_TTL, max_entries: int = Config.IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._entries = OrderedDict()  # MessageSid -> expires_at, oldest first
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.claimed = 0
+        self.duplicates = 0
+        self.evictions = 0
+
+    def claim(self, message_sid: str) -> bool:
+        """
+        Record a MessageSid.
+
+        Args:
+            message_sid (str): The webhook's MessageSid
+
+        Returns:
+            bool: True the first time the id is seen (process the message), False for a duplicate
+        """
+        now = time.monotonic()
+        with self.lock:
+            # All entries share one TTL, so the oldest are at the front
+            while self._entries:
+                oldest, expires_at = next(iter(self._entries.items()))
+                if expires_at > now:
+                    break
+                del self._entries[oldest]
+
+            if message_sid in self._entries:
+                self.duplicates += 1
+                return False
+
+            self._entries[message_sid] = now + self.ttl
+            self.claimed += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def get_stats(self) -> dict:
+        """
+        Snapshot of idempotency metrics.
+
+        Returns:
+            dict: MessageSids claimed, duplicates rejected, entries held and evictions
+        """
+        with self.lock:
+            return {
+                "claimed": self.claimed,
+                "duplicates": self.duplicates,
+                "entries": len(self._entries),
+                "evictions": self.evictions,
+            }
+
+class SQLiteIdempotencyStore:
+    """
+    MessageSid record in a SQLite file (WAL mode), shared by every process on
+    the host, so a retry reaching another gunicorn worker is still rejected.
+
+    A claim is one INSERT ... ON CONFLICT upsert, atomic across processes:
+    it succeeds if the id is new or its previous entry has expired. Expired
+    rows are deleted, and the oldest rows beyond `max_entries` evicted, every
+    `purge_every` claims. If the database is unavailable, messages are let
+    through (fail open).
+    """
+
+    # claim() writes to a file that other processes may have locked; run it off the event loop
+    blocking = True
+
+    def __init__(self, db_path: str = Config.IDEMPOTENCY_SQLITE_PATH, ttl: float = Config.IDEMPOTENCY_TTL,
+                 max_entries: int = Config.IDEMPOTENCY_MAX_ENTRIES, purge_every: int = 1000):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.purge_every = max(1, purge_every)
+        self._local = threading.local()
+        self.lock = threading.Lock()
+        self._ensure_schema()
+
+        # Metrics (this process)
+        self.claimed = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.evictions = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: autocommit, every claim is its own transaction
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def _ensure_schema(self):
+        """Create the message id table and its expiry index if they don't exist."""
+        conn = self._connection()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS message_ids (
+                message_sid TEXT PRIMARY KEY,
+                expires_at  REAL NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_message_ids_expires_at ON message_ids (expires_at)")
+
+    def claim(self, message_sid: str) -> bool:
+        """
+        Record a MessageSid.
+
+        Args:
+            message_sid (str): The webhook's MessageSid
+
+        Returns:
+            bool: True the first time the id is seen (process the message), False for a duplicate
+        """
+        now = time.time()
+        try:
+            cursor = self._connection().execute(
+                """
+                INSERT INTO message_ids (message_sid, expires_at) VALUES (?, ?)
+                ON CONFLICT (message_sid) DO UPDATE SET expires_at = excluded.expires_at
+                WHERE message_ids.expires_at <= ?
+                """,
+                (message_sid, now + self.ttl, now)
+            )
+            claimed = cursor.rowcount == 1
+        except sqlite3.Error as e:
+            with self.lock:
+                self.errors += 1
+            logger.warning("⚠️ Idempotency store unavailable, allowing %s: %s", message_sid, e)
+            return True
+
+        with self.lock:
+            if claimed:
+                self.claimed += 1
+                purge = self.claimed % self.purge_every == 0
+            else:
+                self.duplicates += 1
+                purge = False
+        if purge:
+            self.purge(now)
+        return claimed
+
+    def purge(self, now: float = None) -> int:
+        """
+        Delete expired rows, then the oldest rows beyond max_entries.
+
+        Returns:
+            int: Number of deleted rows
+        """
+        now = time.time() if now is None else now
+        try:
+            conn = self._connection()
+            removed = conn.execute("DELETE FROM message_ids WHERE expires_at <= ?", (now,)).rowcount
+            excess = conn.execute("SELECT COUNT(*) FROM message_ids").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    """
+                    DELETE FROM message_ids WHERE message_sid IN (
+                        SELECT message_sid FROM message_ids ORDER BY expires_at LIMIT ?
+                    )
+                    """,
+                    (excess,)
+                )
+                with self.lock:
+                    self.evictions += excess
+                removed += excess
+            return removed
+        except sqlite3.Error as e:
+            logger.warning("⚠️ Failed to purge the idempotency store: %s", e)
+            return 0
+
+    def get_stats(self) -> dict:
+        """
+        Snapshot of idempotency metrics for this process.
+
+        Returns:
+            dict: MessageSids claimed, duplicates rejected, database errors and evictions
+        """
+        with self.lock:
+            return {
+                "claimed": self.claimed,
+                "duplicates": self.duplicates,
+                "errors": self.errors,
+                "evictions": self.evictions,
+            }
+
+def create_idempotency_store(backend: str = None):
+    """
+    Build the idempotency store selected by Config.IDEMPOTENCY_BACKEND.
+
+    Backends:
+      memory - bounded in-process dict (default, per process)
+      sqlite - SQLite file shared by all processes on one host
+    """
+    backend = (backend or Config.IDEMPOTENCY_BACKEND).lower()
+
+    if backend == "memory":
+        return MemoryIdempotencyStore()
+    if backend == "sqlite":
+        return SQLiteIdempotencyStore()
+
+    raise ValueError(f"Unknown idempotency backend: {backend}")
+
+# Global idempotency store (None unless enabled)
+idempotency_store = create_idempotency_store() if Config.IDEMPOTENCY_ENABLED else None
@@ -1,26 +1,128 @@
+import atexit
+import json
 import logging
 import logging.handlers
 import os
+import queue
+import threading
+import time
 from app.settings.config import Config
 
+# Argument types that can be formatted later, on the listener thread, without
+# the caller changing them in the meantime
+_IMMUTABLE_ARGS = (str, int, float, bool, type(None), bytes)
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message (and exception)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+                    + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler for a bounded queue that never blocks the caller.
+
+    When the queue is full the record is dropped and counted; the next record
+    that fits is preceded by a warning saying how many were lost. Records whose
+    arguments are immutable keep them, so the message is only built on the
+    listener thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(arg, _IMMUTABLE_ARGS) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            # Tracebacks hold the caller's frames; render them now and let go
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self._unreported:
+            self._report_drops()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                self._unreported += 1
+
+    def _report_drops(self):
+        with self._lock:
+            unreported, self._unreported = self._unreported, 0
+        if not unreported:
+            return
+        warning = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                    "⚠️ Log queue full, dropped %s records", (unreported,), None)
+        try:
+            self.queue.put_nowait(warning)
+        except queue.Full:
+            with self._lock:
+                self._unreported += unreported
+
+# The queue handler and listener of this process (queue mode only)
+_queue_handler = None
+_listener = None
+_listener_pid = None
+
+def _stop_listener():
+    """Flush queued records and stop the listener thread of this process."""
+    global _listener, _queue_handler
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None
+    _queue_handler = None
+
+atexit.register(_stop_listener)
+
 def setup_logging():
     """
     Setup centralized logging with rotation.
     Creates a single log file with 5MB max size and 5 backup files.
+
+    With LOG_MODE=queue (default) callers only put records on a bounded
+    in-memory queue; a listener thread formats them and does the file
+    writes (and rotations), so a slow disk never stalls a request.
+    LOG_FORMAT=json writes one JSON object per line instead of text.
     """
+    global _queue_handler, _listener, _listener_pid
+
     # Create logs directory if it doesn't exist
-    log_dir = "logs"
+    log_dir = Config.LOG_DIR
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
-    
+
     # Configure root logger
     logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-    
-    # Remove any existing handlers
+    logger.setLevel(Config.LOG_LEVEL)
+
+    # Remove any existing handlers, flushing the previous listener (if it runs in this process)
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
-    
+    _stop_listener()
+
     # Create rotating file handler (5MB max, 5 backups)
     file_handler = logging.handlers.RotatingFileHandler(
         filename=os.path.join(log_dir, "app.log"),
@@ -28,33 +130,59 @@ def setup_logging():
         backupCount=5,
         encoding='utf-8'
     )
-    
+
     # Create console handler for development
     console_handler = logging.StreamHandler()
-    
+
     # Create formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
+    if Config.LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+
     # Set formatters
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
-    
-    # Add handlers to logger
-    logger.addHandler(file_handler)
-    
+
     # Only add console handler in development
-    if Config.DEBUG:
-        logger.addHandler(console_handler)
-    
+    handlers = [file_handler, console_handler] if Config.DEBUG else [file_handler]
+
+    # Add handlers to logger, behind a queue and a listener thread in queue mode
+    if Config.LOG_MODE == "queue":
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=Config.LOG_QUEUE_SIZE))
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener_pid = os.getpid()
+        _listener.start()
+        logger.addHandler(_queue_handler)
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
     # Set specific logger levels
     logging.getLogger('requests').setLevel(logging.WARNING)
     logging.getLogger('urllib3').setLevel(logging.WARNING)
-    
+
     return logger
 
+def get_logging_stats():
+    """
+    Snapshot of the log queue (queue mode only).
+
+    Returns:
+        dict: Records waiting to be written, queue capacity and records dropped, or None
+    """
+    handler = _queue_handler
+    if handler is None:
+        return None
+    return {
+        "queued": handler.queue.qsize(),
+        "capacity": handler.queue.maxsize,
+        "dropped": handler.dropped,
+    }
+
 def get_logger(name):
     """Get a logger instance with the specified name."""
     return logging.getLogger(name)
@@ -1,7 +1,17 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
 import time
 from collections import defaultdict
 from threading import Lock
 from app.settings.config import Config
+from app.utils.logger import get_logger
+from app.utils.resp_client import RespClient
+
+logger = get_logger(__name__)
 
 class SimpleRateLimiter:
     """
@@ -9,6 +19,9 @@ class SimpleRateLimiter:
     Limits users to prevent abuse while allowing normal usage.
     """
     
+    # Checks are dict operations, cheap enough to call on the event loop
+    blocking = False
+
     def __init__(self, max_requests_per_minute=Config.RATE_LIMITER_MAX_REQUESTS_PER_MINUTE):
         self.max_requests = max_requests_per_minute
         self.requests = defaultdict(list)
@@ -50,12 +63,362 @@ class SimpleRateLimiter:
         Returns:
             int: Seconds to wait, 0 if can request now
         """
-        if not self.requests[user_id]:
-            return 0
-            
-        oldest_request = min(self.requests[user_id])
+        with self.lock:
+            requests = self.requests.get(user_id)
+            if not requests:
+                return 0
+            # Timestamps are appended in order, so the first one is the oldest
+            oldest_request = requests[0]
+        
         wait_time = 60 - (time.time() - oldest_request)
         return max(0, int(wait_time))
 
+class TokenBucketRateLimiter:
+    """
+    Token-bucket rate limiter with O(1) checks and bounded memory.
+
+    Implemented as GCRA (generic cell rate algorithm), the single-number form
+    of a token bucket: each user's whole state is one float, the "theoretical
+    arrival time" at which their bucket of `max_requests_per_minute` tokens is
+    full again. Users live in two generations of dicts that rotate once per
+    refill period; when the older generation is dropped, every user in it has
+    been idle for at least a full period (a full bucket), so no state is lost.
+    """
+
+    # Checks are dict operations, cheap enough to call on the event loop
+    blocking = False
+
+    def __init__(self, max_requests_per_minute=Config.RATE_LIMITER_MAX_REQUESTS_PER_MINUTE):
+        self.max_requests = max_requests_per_minute
+        self.period = 60.0                                              # seconds for an empty bucket to refill
+        self.interval = self.period / max(1, max_requests_per_minute)   # seconds per token
+        self.burst = self.period - self.interval                        # how far ahead of now the TAT may run
+
+        self._current = {}    # user_id -> theoretical arrival time, touched this generation
+        self._previous = {}   # user_id -> theoretical arrival time, touched last generation
+        self._rotate_at = time.monotonic() + self.period
+        self.lock = Lock()
+
+    def _lookup_unsafe(self, user_id: str, now: float):
+        """
+        Find a user's TAT, promoting it to the current generation.
+        NOT thread-safe - must be called within lock.
+
+        Returns:
+            tuple: (TAT or None, dict of idle users to release outside the lock or None)
+        """
+        dropped = None
+        if now >= self._rotate_at:
+            # Everyone in the previous generation has been idle for at least one period
+            dropped = self._previous
+            self._previous = self._current
+            self._current = {}
+            self._rotate_at = now + self.period
+
+        tat = self._current.get(user_id)
+        if tat is None:
+            tat = self._previous.pop(user_id, None)
+        return tat, dropped
+
+    def is_allowed(self, user_id: str) -> bool:
+        """
+        Check if user is allowed to make a request.
+        
+        Args:
+            user_id (str): User identifier (phone number)
+            
+        Returns:
+            bool: True if request is allowed, False if rate limited
+        """
+        if self.max_requests <= 0:
+            return False
+        now = time.monotonic()
+        
+        with self.lock:
+            tat, dropped = self._lookup_unsafe(user_id, now)
+            if tat is None or tat < now:
+                tat = now
+            
+            allowed = tat - now <= self.burst
+            self._current[user_id] = tat + self.interval if allowed else tat
+        
+        # Free a dropped generation outside the lock
+        del dropped
+        return allowed
+    
+    def get_wait_time(self, user_id: str) -> int:
+        """
+        Get seconds until user can make next request.
+        
+        Args:
+            user_id (str): User identifier
+            
+        Returns:
+            int: Seconds to wait, 0 if can request now
+        """
+        if self.max_requests <= 0:
+            return int(self.period)
+        now = time.monotonic()
+        
+        with self.lock:
+            tat, dropped = self._lookup_unsafe(user_id, now)
+            if tat is not None:
+                self._current[user_id] = tat
+        
+        del dropped
+        if tat is None:
+            return 0
+        return max(0, math.ceil(tat - now - self.burst))
+
+    def tracked_users(self) -> int:
+        """Number of users currently holding rate-limit state."""
+        with self.lock:
+            return len(self._current) + len(self._previous)
+
+class MmapRateLimiter:
+    """
+    Rate limiter whose state lives in a memory-mapped file, shared by every
+    process on the host (e.g. all gunicorn workers), so a user gets the
+    configured limit once and not once per worker.
+
+    Uses the same GCRA algorithm as TokenBucketRateLimiter. The file is a
+    fixed-size open-addressing table of 16-byte slots (key hash, TAT), split
+    into stripes; a check locks one stripe with a thread lock plus an fcntl
+    byte-range lock and probes a few slots inside it. When a stripe runs out
+    of room, the slot closest to a full bucket is reused.
+    """
+
+    _SLOT = struct.Struct("<Qd")  # 64-bit key hash, theoretical arrival time (epoch seconds)
+    _STRIPES = 256
+    _PROBES = 8
+    # Serializes first use per process, so all threads share one mapping and one set of stripe locks
+    _open_lock = Lock()
+
+    # A check holds its stripe lock for microseconds, cheap enough to call on the event loop
+    blocking = False
+
+    def __init__(self, max_requests_per_minute=Config.RATE_LIMITER_MAX_REQUESTS_PER_MINUTE,
+                 path: str = Config.RATE_LIMITER_MMAP_PATH, slots: int = Config.RATE_LIMITER_MMAP_SLOTS):
+        self.max_requests = max_requests_per_minute
+        self.period = 60.0
+        self.interval = self.period / max(1, max_requests_per_minute)
+        self.burst = self.period - self.interval
+
+        self.path = path
+        self.stripe_slots = max(self._PROBES, slots // self._STRIPES)
+        self.slots = self.stripe_slots * self._STRIPES
+        self._pid = None
+
+    def _open(self):
+        """Map the table on first use in each process (after a fork the thread locks are recreated)."""
+        if self._pid == os.getpid():
+            return
+        with self._open_lock:
+            if self._pid != os.getpid():
+                self._open_unsafe()
+
+    def _open_unsafe(self):
+        """Map the table and create the stripe locks. Must hold _open_lock."""
+        size = self.slots * self._SLOT.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)  # new pages read as zeros, i.e. empty slots
+        self._fd = fd
+        self._map = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self._locks = [Lock() for _ in range(self._STRIPES)]
+        self._pid = os.getpid()
+
+    @staticmethod
+    def _hash(user_id: str) -> int:
+        # Stable across processes (unlike hash()); 0 is reserved for empty slots
+        return int.from_bytes(hashlib.blake2b(user_id.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+    def _locate(self, key: int, now: float, create: bool):
+        """
+        Find the slot offset for key within its stripe. Must hold the stripe lock.
+
+        Returns:
+            tuple: (byte offset or None, stored TAT or None if the key is new)
+        """
+        stripe = key % self._STRIPES
+        base = stripe * self.stripe_slots
+        start = (key // self._STRIPES) % self.stripe_slots
+        free = None
+        oldest = None
+
+        for i in range(self._PROBES):
+            offset = (base + (start + i) % self.stripe_slots) * self._SLOT.size
+            slot_key, tat = self._SLOT.unpack_from(self._map, offset)
+            if slot_key == key:
+                return offset, tat
+            if free is None and (slot_key == 0 or tat <= now):
+                free = offset  # empty, or that user's bucket is full again
+            if oldest is None or tat < oldest[1]:
+                oldest = (offset, tat)
+
+        if not create:
+            return None, None
+        return (free if free is not None else oldest[0]), None
+
+    def _check(self, user_id: str, consume: bool):
+        self._open()
+        key = self._hash(user_id)
+        stripe = key % self._STRIPES
+        now = time.time()
+
+        with self._locks[stripe]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                offset, tat = self._locate(key, now, create=consume)
+                if tat is None or tat < now:
+                    tat = now
+                if not consume:
+                    return tat
+
+                allowed = tat - now <= self.burst
+                self._SLOT.pack_into(self._map, offset, key, tat + self.interval if allowed else tat)
+                return allowed
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+
+    def is_allowed(self, user_id: str) -> bool:
+        """
+        Check if user is allowed to make a request.
+        
+        Args:
+            user_id (str): User identifier (phone number)
+            
+        Returns:
+            bool: True if request is allowed, False if rate limited
+        """
+        if self.max_requests <= 0:
+            return False
+        return self._check(user_id, consume=True)
+
+    def get_wait_time(self, user_id: str) -> int:
+        """
+        Get seconds until user can make next request.
+        
+        Args:
+            user_id (str): User identifier
+            
+        Returns:
+            int: Seconds to wait, 0 if can request now
+        """
+        if self.max_requests <= 0:
+            return int(self.period)
+        tat = self._check(user_id, consume=False)
+        return max(0, math.ceil(tat - time.time() - self.burst))
+
+class RedisRateLimiter:
+    """
+    Rate limiter backed by a Redis-protocol server, shared by every process
+    and host using the same server.
+
+    Uses a sliding-window counter: one counter per user per minute, with the
+    previous minute's count weighted by how much of it still overlaps the
+    last 60 seconds. A check is a single pipelined round trip (GET previous,
+    INCR + EXPIRE current); a rejected request is handed back with DECR so it
+    doesn't count. Only plain commands are used, so any RESP stand-in works.
+    If the server is unreachable, requests are allowed (fail open).
+    """
+
+    # Checks are network round trips; run them off the event loop
+    blocking = True
+
+    def __init__(self, max_requests_per_minute=Config.RATE_LIMITER_MAX_REQUESTS_PER_MINUTE,
+                 url: str = Config.RATE_LIMITER_REDIS_URL, prefix: str = Config.RATE_LIMITER_REDIS_PREFIX):
+        self.max_requests = max_requests_per_minute
+        self.window = 60
+        self.prefix = prefix
+        self.client = RespClient(url)
+
+    def _keys(self, user_id: str, now: float):
+        window = int(now // self.window)
+        return f"{self.prefix}{user_id}:{window - 1}", f"{self.prefix}{user_id}:{window}"
+
+    def _previous_weight(self, now: float) -> float:
+        return 1.0 - (now % self.window) / self.window
+
+    def is_allowed(self, user_id: str) -> bool:
+        """
+        Check if user is allowed to make a request.
+        
+        Args:
+            user_id (str): User identifier (phone number)
+            
+        Returns:
+            bool: True if request is allowed, False if rate limited
+        """
+        now = time.time()
+        previous_key, current_key = self._keys(user_id, now)
+        try:
+            previous, current, _ = self.client.pipeline(
+                ("GET", previous_key),
+                ("INCR", current_key),
+                ("EXPIRE", current_key, self.window * 2)
+            )
+            estimate = int(previous or 0) * self._previous_weight(now) + current
+            if estimate <= self.max_requests:
+                return True
+            self.client.execute("DECR", current_key)
+            return False
+        except Exception as e:
+            logger.warning("⚠️ Rate limit backend unavailable, allowing %s: %s", user_id, e)
+            return True
+
+    def get_wait_time(self, user_id: str) -> int:
+        """
+        Get seconds until user can make next request.
+        
+        Args:
+            user_id (str): User identifier
+            
+        Returns:
+            int: Seconds to wait, 0 if can request now
+        """
+        now = time.time()
+        previous_key, current_key = self._keys(user_id, now)
+        try:
+            previous, current = self.client.pipeline(("GET", previous_key), ("GET", current_key))
+        except Exception:
+            return 0
+        previous, current = int(previous or 0), int(current or 0)
+
+        if current + 1 > self.max_requests:
+            # Full for this window regardless of the previous one
+            return math.ceil(self.window - (now % self.window))
+        if previous == 0:
+            return 0
+
+        # Wait until the previous window's weight has decayed enough for one more request
+        needed_weight = (self.max_requests - current - 1) / previous
+        excess_weight = self._previous_weight(now) - needed_weight
+        return max(0, math.ceil(excess_weight * self.window))
+
+def create_rate_limiter(backend: str = None):
+    """
+    Build the rate limiter selected by Config.RATE_LIMITER_BACKEND.
+
+    Backends:
+      token_bucket - O(1) checks, idle users evicted (default, per process)
+      simple       - sliding log of request timestamps per user (per process)
+      mmap         - shared memory-mapped table for all processes on one host
+      redis        - Redis-protocol server shared by all processes and hosts
+    """
+    backend = (backend or Config.RATE_LIMITER_BACKEND).lower()
+    max_requests = Config.RATE_LIMITER_MAX_REQUESTS_PER_MINUTE
+
+    if backend == "token_bucket":
+        return TokenBucketRateLimiter(max_requests_per_minute=max_requests)
+    if backend == "simple":
+        return SimpleRateLimiter(max_requests_per_minute=max_requests)
+    if backend == "mmap":
+        return MmapRateLimiter(max_requests_per_minute=max_requests)
+    if backend == "redis":
+        return RedisRateLimiter(max_requests_per_minute=max_requests)
+
+    raise ValueError(f"Unknown rate limiter backend: {backend}")
+
 # Global rate limiter instance
-rate_limiter = SimpleRateLimiter(max_requests_per_minute=Config.RATE_LIMITER_MAX_REQUESTS_PER_MINUTE)
+rate_limiter = create_rate_limiter()
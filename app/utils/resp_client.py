@@ -0,0 +1,123 @@
+import os
+import socket
+import threading
+from typing import List, Optional
+from urllib.parse import urlparse
+
+class RespError(Exception):
+    """Error reply ("-ERR ...") returned by the server."""
+
+class RespClient:
+    """
+    Minimal Redis-protocol (RESP2) client: just enough for pipelined commands.
+
+    Works with Redis, Valkey, KeyDB or any local stand-in that speaks RESP.
+    Each thread gets its own connection, re-established after a fork or a
+    socket error. Supports redis://host:port/db and unix:///path/to.sock URLs.
+    """
+
+    def __init__(self, url: str, timeout: float = 1.0):
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+
+        parsed = urlparse(url)
+        self._unix_path = parsed.path if parsed.scheme == "unix" else None
+        self._address = (parsed.hostname or "127.0.0.1", parsed.port or 6379)
+        self._db = int(parsed.path.strip("/") or 0) if parsed.scheme != "unix" else 0
+        self._password = parsed.password
+
+    def _connect(self):
+        if self._unix_path:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self._unix_path)
+        else:
+            sock = socket.create_connection(self._address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self._local.sock = sock
+        self._local.reader = sock.makefile("rb")
+        self._local.pid = os.getpid()
+
+        setup = []
+        if self._password:
+            setup.append(("AUTH", self._password))
+        if self._db:
+            setup.append(("SELECT", self._db))
+        if setup:
+            try:
+                self._execute(setup)
+            except Exception:
+                # Never keep a connection that is unauthenticated or on the wrong database
+                self._close()
+                raise
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                self._local.reader.close()
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    @staticmethod
+    def _encode(command: tuple) -> bytes:
+        parts = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError("connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            return RespError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            data = self._local.reader.read(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(payload)
+            return None if size < 0 else [self._read_reply() for _ in range(size)]
+        raise ConnectionError(f"unexpected reply type {kind!r}")
+
+    def _execute(self, commands: List[tuple]) -> list:
+        self._local.sock.sendall(b"".join(self._encode(c) for c in commands))
+        replies = [self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def pipeline(self, *commands: tuple) -> list:
+        """
+        Send several commands in one round trip and return their replies in order.
+
+        Raises:
+            RespError: If any command returned an error reply
+            OSError: On connection problems (the connection is reset for the next call)
+        """
+        if getattr(self._local, "sock", None) is None or self._local.pid != os.getpid():
+            self._connect()
+        try:
+            return self._execute(list(commands))
+        except (OSError, ConnectionError):
+            self._close()
+            raise
+
+    def execute(self, *command) -> Optional[object]:
+        """Run a single command and return its reply."""
+        return self.pipeline(tuple(command))[0]
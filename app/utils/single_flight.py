@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+class _Call:
+    """A single in-flight call and the outcome shared with everyone waiting on it."""
+
+    __slots__ = ("done", "result", "error", "started_at")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.started_at = time.monotonic()
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    still running wait for it and receive the same result (or exception)
+    instead of starting their own call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+        # Metrics
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, func: Callable, *args, max_age: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Run func(*args) unless a call with the same key is already in flight.
+
+        Args:
+            key (Hashable): Identifies calls that may share a result
+            func (Callable): Function to run when this caller leads
+            max_age (float): Only join in-flight calls started at most this many
+                seconds ago; older ones are left to finish on their own
+
+        Returns:
+            tuple: (result, True if the result came from another caller's execution)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and (max_age is None or time.monotonic() - call.started_at <= max_age):
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args)
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        """Number of keys with a call currently running."""
+        with self._lock:
+            return len(self._calls)
+
+    def get_stats(self) -> dict:
+        """
+        Snapshot of how many calls ran and how many were served from a shared call.
+
+        Returns:
+            dict: executed, shared and in_flight counts
+        """
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "shared": self.shared,
+                "in_flight": len(self._calls),
+            }
+
+class AsyncSingleFlight:
+    """
+    asyncio version of SingleFlight: collapse concurrent coroutine calls with
+    the same key into one execution. Must be used from a single event loop.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Tuple[asyncio.Future, float]] = {}
+
+        # Metrics
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable], *args,
+                 max_age: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Await func(*args) unless a call with the same key is already in flight.
+
+        Args:
+            key (Hashable): Identifies calls that may share a result
+            func (Callable): Coroutine function to run when this caller leads
+            max_age (float): Only join in-flight calls started at most this many
+                seconds ago; older ones are left to finish on their own
+
+        Returns:
+            tuple: (result, True if the result came from another caller's execution)
+        """
+        entry = self._calls.get(key)
+        if entry is not None and (max_age is None or time.monotonic() - entry[1] <= max_age):
+            self.shared += 1
+            # shield: a cancelled follower must not cancel the leader's call
+            return await asyncio.shield(entry[0]), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = (future, time.monotonic())
+        self.executed += 1
+        try:
+            result = await func(*args)
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved: nobody may be waiting
+            raise
+        finally:
+            if self._calls.get(key, (None,))[0] is future:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        """Number of keys with a call currently running."""
+        return len(self._calls)
+
+    def get_stats(self) -> dict:
+        """
+        Snapshot of how many calls ran and how many were served from a shared call.
+
+        Returns:
+            dict: executed, shared and in_flight counts
+        """
+        return {
+            "executed": self.executed,
+            "shared": self.shared,
+            "in_flight": len(self._calls),
+        }
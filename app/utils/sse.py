@@ -0,0 +1,140 @@
+import json
+import re
+from typing import Iterator, List, Optional
+
+_decode = json.JSONDecoder().decode
+
+def _json_loads(data: bytes):
+    """json.loads for UTF-8 bytes, minus its per-call encoding detection."""
+    return _decode(data.decode("utf-8"))
+
+try:
+    import orjson  # Optional, several times faster than json for large events
+    _loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    _loads = _json_loads
+    JSON_BACKEND = "json"
+
+# Text events carry "isText": true; everything else (status, SQL, chart data) can skip JSON decoding
+_IS_TEXT = re.compile(rb'"isText"\s*:\s*true')
+
+class SSEParser:
+    """
+    Incremental Server-Sent Events parser working on raw bytes.
+
+    Chunks of any size are appended to one buffer, events are found with
+    bytes-level searches for the blank line that ends them, and the common
+    single-line `data:` event is sliced out through a memoryview without
+    splitting it into lines. Only the `data` field is kept; comments and the
+    event/id/retry fields are ignored.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._pending_cr = False
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """
+        Add a chunk of the stream and return the data of every event it completed.
+
+        Returns:
+            list: Data payloads (bytes), multi-line data joined with "\\n"
+        """
+        if self._pending_cr:
+            chunk = b"\r" + chunk
+            self._pending_cr = False
+        if b"\r" in chunk:
+            # A "\r\n" may be split across chunks: keep a trailing "\r" for the next one
+            if chunk.endswith(b"\r"):
+                chunk = chunk[:-1]
+                self._pending_cr = True
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+        buffer = self._buffer
+        buffer += chunk
+        events = []
+        start = 0
+        with memoryview(buffer) as view:
+            while True:
+                end = buffer.find(b"\n\n", start)
+                if end < 0:
+                    break
+                data = self._event_data(buffer, view, start, end)
+                if data is not None:
+                    events.append(data)
+                start = end + 2
+        if start:
+            del buffer[:start]
+        return events
+
+    def flush(self) -> List[bytes]:
+        """Return the data of a final event the stream ended without a blank line."""
+        if self._pending_cr:
+            self._buffer += b"\n"
+            self._pending_cr = False
+        buffer, self._buffer = self._buffer, bytearray()
+        if not buffer.strip(b"\n"):
+            return []
+        with memoryview(buffer) as view:
+            data = self._event_data(buffer, view, 0, len(buffer))
+        return [] if data is None else [data]
+
+    @staticmethod
+    def _event_data(buffer: bytearray, view: memoryview, start: int, end: int) -> Optional[bytes]:
+        """Extract the data field of the event in buffer[start:end]."""
+        # Fast path: a single "data:" line
+        if buffer.startswith(b"data:", start) and buffer.find(b"\n", start, end) < 0:
+            offset = start + 5
+            if offset < end and buffer[offset] == 0x20:  # one optional space
+                offset += 1
+            return bytes(view[offset:end])
+
+        data_lines = []
+        for line in bytes(view[start:end]).split(b"\n"):
+            if line.startswith(b"data:"):
+                value = line[5:]
+                data_lines.append(value[1:] if value.startswith(b" ") else value)
+            elif line == b"data":
+                data_lines.append(b"")
+        return b"\n".join(data_lines) if data_lines else None
+
+def iter_response_chunks(resp, size: int) -> Iterator[bytes]:
+    """
+    Yield the body of a streaming requests response in reads of up to `size`
+    bytes, returning whatever has arrived instead of waiting for a full read.
+    A compressed body (Content-Encoding: gzip, deflate) is decoded on the way.
+    """
+    raw = resp.raw
+    if hasattr(raw, "read1"):
+        while True:
+            # requests leaves decoding to its own iterators, so ask urllib3 for it here
+            chunk = raw.read1(size, decode_content=True)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        # urllib3 < 2: let requests yield data as it arrives
+        yield from resp.iter_content(chunk_size=None)
+
+def iter_sse_data(chunks) -> Iterator[bytes]:
+    """Yield the data payload of every SSE event in an iterable of byte chunks."""
+    parser = SSEParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.flush()
+
+def text_content(data: bytes) -> Optional[str]:
+    """
+    Return the text of an AYD text event, or None for any other event.
+    Events without `"isText": true` are skipped without being decoded.
+
+    Raises:
+        ValueError: If a text event is not valid JSON
+    """
+    if not _IS_TEXT.search(data):
+        return None
+    event = _loads(data)
+    if not isinstance(event, dict) or not event.get("isText"):
+        return None  # The pattern matched inside some other field
+    return event.get("content") or ""
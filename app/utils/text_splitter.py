@@ -0,0 +1,209 @@
+import re
+import unicodedata
+from bisect import bisect_left
+from typing import Callable, List, Tuple
+
+_WHITESPACE = re.compile(r"\s*")
+# Two or more consecutive lines starting with "|": a markdown table
+_TABLE = re.compile(r"^[ \t]*\|[^\n]*(?:\n[ \t]*\|[^\n]*)+", re.MULTILINE)
+
+def utf16_len(text: str) -> int:
+    """Length of text in UTF-16 code units, the unit WhatsApp's message limit counts."""
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-16-le")) // 2
+
+def find_tables(text: str) -> List[Tuple[int, int]]:
+    """
+    Locate markdown tables (two or more consecutive lines starting with "|").
+
+    Returns:
+        list: (start, end) offsets of each table, end excluding its last newline
+    """
+    return [(m.start(), m.end()) for m in _TABLE.finditer(text)]
+
+def part_header(index: int, total: int) -> str:
+    """Header prepended to each part of a split message."""
+    return f"[Part {index}/{total}]\n"
+
+def _is_regional_indicator(char: str) -> bool:
+    return "\U0001F1E6" <= char <= "\U0001F1FF"
+
+def _extends_cluster(char: str) -> bool:
+    """True if char belongs to the grapheme cluster before it (combining mark, ZWJ, emoji modifier...)."""
+    code = ord(char)
+    return (code == 0x200D                        # zero width joiner
+            or 0xFE00 <= code <= 0xFE0F           # variation selectors (emoji presentation)
+            or 0x1F3FB <= code <= 0x1F3FF         # skin tone modifiers
+            or 0xE0020 <= code <= 0xE007F         # tag characters (subdivision flags)
+            or 0xE0100 <= code <= 0xE01EF
+            or unicodedata.category(char) in ("Mn", "Mc", "Me"))
+
+def _is_grapheme_boundary(text: str, index: int) -> bool:
+    """
+    Approximate extended grapheme cluster boundary check (UAX #29) for a cut
+    before text[index]: keeps base characters with their combining marks,
+    emoji ZWJ sequences, modified emoji, flags, Indic conjuncts and CR LF together.
+    """
+    if index <= 0 or index >= len(text):
+        return True
+    before, char = text[index - 1], text[index]
+    if before == "\r" and char == "\n":
+        return False
+    if before == "\u200d" or _extends_cluster(char):
+        return False
+    if unicodedata.combining(before) == 9:  # virama: joins the next consonant
+        return False
+    if _is_regional_indicator(before) and _is_regional_indicator(char):
+        # Flags are pairs of regional indicators: only cut after an even run
+        run = 0
+        while index - 1 - run >= 0 and _is_regional_indicator(text[index - 1 - run]):
+            run += 1
+        return run % 2 == 0
+    return True
+
+class _Splitter:
+    """
+    Cut-point finder over one text, working on index offsets only.
+
+    Built once per text with a single scan for markdown tables; every cut
+    after that looks at one window of at most `budget` characters (bounded
+    rfind calls, one UTF-16 encode of the window for non-ASCII text), so the
+    whole text is processed in one pass and only the chunks themselves are
+    copied out.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.ascii = text.isascii()
+        self.tables = find_tables(text)
+        self.table_starts = [table_start for table_start, _ in self.tables]
+
+    def units(self, start: int, end: int) -> int:
+        """UTF-16 units in text[start:end]."""
+        if self.ascii:
+            return end - start
+        return utf16_len(self.text[start:end])
+
+    def fit(self, start: int, budget: int) -> int:
+        """Largest end such that text[start:end] fits in budget UTF-16 units."""
+        end = min(len(self.text), start + budget)
+        if self.ascii:
+            return end
+        # Astral characters only make the window longer in UTF-16: encode at most
+        # `budget` characters, cut at `budget` units and count the characters kept
+        encoded = self.text[start:end].encode("utf-16-le")
+        if len(encoded) <= 2 * budget:
+            return end
+        cut = 2 * budget
+        if 0xD8 <= encoded[cut - 1] <= 0xDB:  # Don't keep half of a surrogate pair
+            cut -= 2
+        return start + len(encoded[:cut].decode("utf-16-le"))
+
+    def skip_whitespace(self, index: int) -> int:
+        return _WHITESPACE.match(self.text, index).end()
+
+    def next_cut(self, start: int, budget: int) -> int:
+        """
+        Find where the chunk starting at `start` should end.
+
+        Prefers paragraph breaks, then line breaks, sentences and finally words,
+        moves cuts out of markdown tables and grapheme clusters, and always
+        returns an index past `start`.
+        """
+        limit = self.fit(start, budget)
+        if limit >= len(self.text):
+            return len(self.text)
+        cut = self._preferred_cut(start, limit)
+        cut = self._outside_table(start, cut, limit, budget)
+        cut = self._at_grapheme_boundary(start, cut)
+        return max(cut, start + 1)
+
+    def _preferred_cut(self, start: int, limit: int) -> int:
+        text = self.text
+        window = limit - start
+
+        # Paragraph breaks first, unless that leaves the part too short
+        paragraph_split = text.rfind("\n\n", start, limit)
+        if paragraph_split - start > window * 0.6:
+            return paragraph_split + 2
+        line_split = text.rfind("\n", start, limit)
+        if line_split - start > window * 0.7:
+            return line_split + 1
+        sentence_split = text.rfind(". ", start, limit)
+        if sentence_split - start > window * 0.7:
+            return sentence_split + 2
+        word_split = text.rfind(" ", start, limit)
+        if word_split - start > window * 0.8:
+            return word_split + 1
+        return limit
+
+    def _outside_table(self, start: int, cut: int, limit: int, budget: int) -> int:
+        """Move a cut that falls inside a markdown table before the table, or to a row boundary."""
+        i = bisect_left(self.table_starts, cut) - 1
+        if i < 0:
+            return cut
+        table_start, table_end = self.tables[i]
+        if cut >= table_end:
+            return cut
+
+        if table_end <= limit:
+            return table_end  # The rest of the table fits in this part
+        if table_start > start and self.units(table_start, table_end) <= budget:
+            return table_start  # The whole table fits in the next part
+        # Too long for one part: cut between rows
+        row_split = self.text.rfind("\n", max(start, table_start), limit)
+        return row_split + 1 if row_split > start else cut
+
+    def _at_grapheme_boundary(self, start: int, cut: int) -> int:
+        safe = cut
+        while safe > start and not _is_grapheme_boundary(self.text, safe):
+            safe -= 1
+        return safe if safe > start else cut
+
+    def split(self, budget_for: Callable[[int], int]) -> List[str]:
+        """Split the whole text; budget_for(index) gives the units available to part `index`."""
+        text = self.text
+        chunks = []
+        start = self.skip_whitespace(0)
+        while start < len(text):
+            end = self.next_cut(start, budget_for(len(chunks) + 1))
+            chunks.append(text[start:end].rstrip())
+            start = self.skip_whitespace(end)
+        return chunks
+
+def split_message(text: str, max_units: int) -> List[str]:
+    """
+    Split a long message into chunks that, once prefixed with their part
+    header, fit WhatsApp's limit of max_units UTF-16 units.
+
+    Header space is exact: parts are sized for headers whose total has as many
+    digits as the lower bound on the part count, and the text is split again
+    with wider headers only if more parts than that were needed.
+
+    Args:
+        text (str): The text to split
+        max_units (int): Maximum UTF-16 units per message, header included
+
+    Returns:
+        list: [text] if it fits in one message, otherwise the chunks (without headers)
+    """
+    units = utf16_len(text)
+    if units <= max_units:
+        return [text]
+
+    splitter = _Splitter(text)
+    total_digits = len(str(units // max_units + 1))
+    while True:
+        chunks = splitter.split(
+            lambda index: max_units - len(part_header(index, 10 ** (total_digits - 1))))
+        if len(str(len(chunks))) <= total_digits:
+            return chunks
+        total_digits = len(str(len(chunks)))
+
+def find_split_point(text: str, max_units: int) -> int:
+    """
+    Index at which to cut text so the first piece fits in max_units UTF-16
+    units, using the same boundary rules as split_message.
+    """
+    return _Splitter(text).next_cut(0, max_units)
@@ -7,6 +7,21 @@ from app.utils.logger import get_logger
 _validator = RequestValidator(Config.TWILIO_AUTH_TOKEN)
 logger = get_logger(__name__)
 
+def is_valid_twilio_signature(params: dict, signature: str) -> bool:
+    """
+    Check an X-Twilio-Signature header against the request parameters.
+    Framework independent, so the asyncio webhook can share it.
+
+    Args:
+        params (dict): All POST/GET parameters Twilio sent
+        signature (str): Value of the X-Twilio-Signature header
+
+    Returns:
+        bool: True if the signature matches the configured webhook URL
+    """
+    # Your publicly accessible webhook URL, must match what you configured in Twilio
+    return _validator.validate(Config.TWILIO_WEBHOOK_URL, params, signature)
+
 def validate_twilio_request():
     """
     Verify that incoming requests to your webhook endpoint genuinely originate
@@ -17,17 +32,14 @@ def validate_twilio_request():
     # Fetch the signature Twilio sent in the request headers
     signature = request.headers.get("X-Twilio-Signature", "")
     
-    # Your publicly accessible webhook URL, must match what you configured in Twilio
-    url = Config.TWILIO_WEBHOOK_URL
-    
     # All POST/GET parameters Twilio sent, as a simple dict
     params = request.values.to_dict()
     
     # Perform the cryptographic check
-    if not _validator.validate(url, params, signature):
+    if not is_valid_twilio_signature(params, signature):
         # Log failure and reject the request
-        logger.warning(f"🚫 Invalid Twilio signature from {request.remote_addr}")
-        logger.debug(f"Expected URL: {url}, Signature: {signature[:20]}...")
+        logger.warning("🚫 Invalid Twilio signature from %s", request.remote_addr)
+        logger.debug("Expected URL: %s, Signature: %s...", Config.TWILIO_WEBHOOK_URL, signature[:20])
         abort(403, description="Invalid Twilio signature")
     
     logger.debug("✅ Twilio signature validated successfully")
@@ -0,0 +1,291 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from app.settings.config import Config
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Circuit states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class UpstreamRejected(Exception):
+    """A call the guard turned away: reason is "circuit_open" or "overloaded"."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class Permit:
+    """
+    Admission of one call, handed back to release() with its outcome.
+
+    The caller sets first_event to the seconds from sending the request to the
+    first response event; that, not the whole call, is the latency the limit
+    adapts to.
+    """
+
+    __slots__ = ("probe", "started_at", "first_event")
+
+    def __init__(self, probe: bool):
+        self.probe = probe
+        self.started_at = time.monotonic()
+        self.first_event = None
+
+class UpstreamGuard:
+    """
+    Adaptive concurrency limit plus circuit breaker for one upstream service.
+
+    The limit follows AIMD: every call whose first response event arrives
+    within `latency_target` seconds raises it by 1/limit (about +1 per limit's
+    worth of calls), a failed or slow call halves it (times `backoff`), at
+    most once per `latency_target` so one burst of failures counts once.
+    Time to first event tracks how loaded the upstream is; the length of a
+    streamed answer depends mostly on the question. Calls over the
+    limit wait up to `queue_timeout` seconds for a slot, then are rejected
+    as "overloaded".
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    are rejected right away ("circuit_open"). After `open_seconds` it goes
+    half-open: up to `half_open_probes` calls are let through as probes; a
+    successful probe closes the circuit, a failed one opens it again.
+
+    acquire() blocks the calling thread, acquire_async() only the coroutine;
+    both kinds of callers can share one guard.
+    """
+
+    def __init__(self, name: str = "upstream",
+                 initial_limit: float = Config.AYD_GUARD_INITIAL_LIMIT,
+                 min_limit: float = Config.AYD_GUARD_MIN_LIMIT,
+                 max_limit: float = Config.AYD_GUARD_MAX_LIMIT,
+                 latency_target: float = Config.AYD_GUARD_LATENCY_TARGET,
+                 backoff: float = Config.AYD_GUARD_BACKOFF,
+                 queue_timeout: float = Config.AYD_GUARD_QUEUE_TIMEOUT,
+                 failure_threshold: int = Config.AYD_GUARD_FAILURE_THRESHOLD,
+                 open_seconds: float = Config.AYD_GUARD_OPEN_SECONDS,
+                 half_open_probes: int = Config.AYD_GUARD_HALF_OPEN_PROBES):
+        self.name = name
+        self.min_limit = max(1.0, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial_limit))
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+
+        self._cond = threading.Condition()
+        self._async_waiters = deque()  # (loop, future) of coroutines waiting for a slot
+        self.state = CLOSED
+        self.in_flight = 0
+        self.waiting = 0
+        self._probes = 0
+        self._failures_in_row = 0
+        self._opened_at = 0.0
+        self._last_decrease = float("-inf")
+
+        # Metrics
+        self.admitted = 0
+        self.rejected_open = 0
+        self.rejected_overloaded = 0
+        self.successes = 0
+        self.failures = 0
+        self.slow = 0
+        self.opened = 0
+
+    def _try_acquire_unsafe(self):
+        """
+        Admit a call if the circuit and the limit allow it. NOT thread-safe - must be called within the condition.
+
+        Returns:
+            Permit: The admission, or None if the call has to wait for a slot
+
+        Raises:
+            UpstreamRejected: The circuit is open (or half-open with all probes out)
+        """
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.rejected_open += 1
+                raise UpstreamRejected("circuit_open")
+            self.state = HALF_OPEN
+            logger.info("🔌 %s circuit half-open, probing", self.name)
+
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                self.rejected_open += 1
+                raise UpstreamRejected("circuit_open")
+            self._probes += 1
+            self.in_flight += 1
+            self.admitted += 1
+            return Permit(probe=True)
+
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            self.admitted += 1
+            return Permit(probe=False)
+        return None
+
+    def _reject_overloaded_unsafe(self):
+        self.rejected_overloaded += 1
+        raise UpstreamRejected("overloaded")
+
+    def acquire(self, timeout: float = None) -> Permit:
+        """
+        Wait for a slot under the concurrency limit (blocking the thread).
+
+        Args:
+            timeout (float): Seconds to wait for a slot (default queue_timeout)
+
+        Returns:
+            Permit: Pass it to release() when the call finished
+
+        Raises:
+            UpstreamRejected: Circuit open, or no slot freed up within the timeout
+        """
+        deadline = time.monotonic() + (self.queue_timeout if timeout is None else timeout)
+        with self._cond:
+            while True:
+                permit = self._try_acquire_unsafe()
+                if permit is not None:
+                    return permit
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._reject_overloaded_unsafe()
+                self.waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+    async def acquire_async(self, timeout: float = None) -> Permit:
+        """
+        Wait for a slot under the concurrency limit (suspending only the coroutine).
+
+        Args:
+            timeout (float): Seconds to wait for a slot (default queue_timeout)
+
+        Returns:
+            Permit: Pass it to release() when the call finished
+
+        Raises:
+            UpstreamRejected: Circuit open, or no slot freed up within the timeout
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + (self.queue_timeout if timeout is None else timeout)
+        while True:
+            with self._cond:
+                permit = self._try_acquire_unsafe()
+                if permit is not None:
+                    return permit
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._reject_overloaded_unsafe()
+                waiter = (loop, loop.create_future())
+                self._async_waiters.append(waiter)
+                self.waiting += 1
+            try:
+                await asyncio.wait_for(waiter[1], remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    self.waiting -= 1
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+
+    @staticmethod
+    def _wake(loop, future):
+        loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+    def _wake_unsafe(self, everyone: bool = False):
+        """
+        Let one waiting thread and one waiting coroutine retry, or all of them
+        (so they fail fast when the circuit opened). NOT thread-safe - must be called within the condition.
+        """
+        if everyone:
+            self._cond.notify_all()
+            while self._async_waiters:
+                self._wake(*self._async_waiters.popleft())
+        else:
+            self._cond.notify()
+            if self._async_waiters:
+                self._wake(*self._async_waiters.popleft())
+
+    def release(self, permit: Permit, success: bool):
+        """
+        Finish a call and feed its outcome into the limit and the circuit.
+
+        Args:
+            permit (Permit): What acquire() returned, with first_event set if the
+                             response started (otherwise the whole call is its latency)
+            success (bool): False if the upstream failed (timeout, connection error, 5xx)
+        """
+        now = time.monotonic()
+        latency = permit.first_event if permit.first_event is not None else now - permit.started_at
+        slow = success and latency > self.latency_target
+        with self._cond:
+            opened = False
+            self.in_flight -= 1
+            if permit.probe:
+                self._probes -= 1
+
+            if success:
+                self.successes += 1
+                self._failures_in_row = 0
+                if permit.probe and self.state == HALF_OPEN:
+                    self.state = CLOSED
+                    logger.info("✅ %s circuit closed, limit %.1f", self.name, self.limit)
+            else:
+                self.failures += 1
+                self._failures_in_row += 1
+                if self.state == HALF_OPEN or (self.state == CLOSED
+                                               and self._failures_in_row >= self.failure_threshold):
+                    self.state = OPEN
+                    opened = True
+                    self._opened_at = now
+                    self.opened += 1
+                    logger.warning("🔌 %s circuit open for %ss after %s failures in a row",
+                                   self.name, self.open_seconds, self._failures_in_row)
+
+            if slow:
+                self.slow += 1
+            if success and not slow:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif now - self._last_decrease >= self.latency_target:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+                logger.info("📉 %s concurrency limit lowered to %.1f (%s after %.1fs)",
+                            self.name, self.limit, "slow" if success else "failure", latency)
+
+            self._wake_unsafe(everyone=opened)
+
+    def get_stats(self) -> dict:
+        """
+        Snapshot of the limit and the circuit.
+
+        Returns:
+            dict: Circuit state, current limit, calls in flight, admissions,
+                  rejections, outcomes and how often the circuit opened
+        """
+        with self._cond:
+            return {
+                "state": self.state,
+                "open": 1 if self.state == OPEN else 0,
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "rejected_open": self.rejected_open,
+                "rejected_overloaded": self.rejected_overloaded,
+                "successes": self.successes,
+                "failures": self.failures,
+                "slow": self.slow,
+                "opened": self.opened,
+            }
+
+# Global guard for AskYourDatabase calls (None unless enabled), shared by the sync and async clients
+ayd_guard = UpstreamGuard("AYD") if Config.AYD_GUARD_ENABLED else None
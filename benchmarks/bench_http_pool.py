@@ -0,0 +1,90 @@
+"""
+Benchmark: pooled keep-alive HTTP sessions vs a fresh requests.Session per call.
+
+Runs SessionBasedAYDClient.ask_with_session against a local FakeAYDServer that
+sleeps --handshake-ms on every new connection to stand in for the TCP+TLS
+handshake to askyourdatabase.com.
+
+    python -m benchmarks.bench_http_pool --handshake-ms 150 --questions 50 --concurrency 8
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_servers import FakeAYDServer
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _run(client, users, questions, concurrency):
+    def ask(i):
+        phone = users[i % len(users)]
+        start = time.perf_counter()
+        result = client.ask_with_session(phone, f"sales today #{i}")
+        if not result.get("success"):
+            raise RuntimeError(result)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(ask, range(questions)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--handshake-ms", type=float, default=150, help="Emulated connection setup cost")
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    with FakeAYDServer(handshake_delay=args.handshake_ms / 1000) as stub:
+        workdir = tempfile.mkdtemp(prefix="ayd-bench-")
+        os.environ.update({
+            "ASKYOURDATABASE_BASE_URL": stub.url,
+            "ASKYOURDATABASE_API_KEY": os.environ.get("ASKYOURDATABASE_API_KEY", "bench-key"),
+            "ASKYOURDATABASE_CHAT_ID": os.environ.get("ASKYOURDATABASE_CHAT_ID", "bench-bot"),
+            "SESSION_STORAGE_BACKEND": "journal",
+            "SESSION_CSV_PATH": os.path.join(workdir, "sessions.csv"),
+            "FLASK_DEBUG": "False",
+        })
+
+        import requests
+        from app.services import simple_ayd_client
+
+        users = [f"+1555000{i:04d}" for i in range(args.users)]
+        results = {}
+        for mode in ("fresh", "pooled"):
+            if mode == "fresh":
+                simple_ayd_client.pooled_session = requests.Session
+            else:
+                from app.utils.http_pool import pooled_session
+                simple_ayd_client.pooled_session = pooled_session
+
+            client = simple_ayd_client.SessionBasedAYDClient()
+            for phone in users:
+                client.session_storage.remove_session(phone)
+
+            connections_before = stub.connections
+            started = time.perf_counter()
+            latencies = _run(client, users, args.questions, args.concurrency)
+            elapsed = time.perf_counter() - started
+            results[mode] = (latencies, elapsed, stub.connections - connections_before)
+
+    print(f"{args.questions} questions, {args.users} users, concurrency {args.concurrency}, "
+          f"handshake {args.handshake_ms:.0f} ms\n")
+    print(f"{'mode':<8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'total s':>10}{'conns':>8}")
+    for mode, (latencies, elapsed, connections) in results.items():
+        ms = [x * 1000 for x in latencies]
+        print(f"{mode:<8}{statistics.mean(ms):>10.1f}{_percentile(ms, 50):>10.1f}"
+              f"{_percentile(ms, 95):>10.1f}{elapsed:>10.2f}{connections:>8}")
+
+
+if __name__ == "__main__":
+    main()
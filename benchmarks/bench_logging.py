@@ -0,0 +1,170 @@
+"""
+Benchmark: webhook latency with synchronous file logging vs. the log queue.
+
+Each LOG_MODE runs in its own subprocess (Config is read at import) with the
+Flask app pointed at a local FakeAYDServer and FakeTwilioServer, so the
+background workers log their usual AYD/Twilio lines while --threads clients
+post signed webhooks through the test client. Every --stall-every-th write to
+app.log sleeps --stall-ms, standing in for a slow or contended disk, a log
+rotation or a network filesystem hiccup; in sync mode that pause lands on
+whichever request happens to log at that moment. It also reports what one
+logger.info() call costs the caller, and what a DEBUG line filtered out at
+INFO costs with an f-string vs. %-style arguments.
+
+    python -m benchmarks.bench_logging --requests 2000 --threads 8 --stall-every 200 --stall-ms 50
+    python -m benchmarks.bench_logging --modes queue --format json --queue-size 100
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _slow_down_file_writes(every: int, stall: float):
+    """Make every `every`-th app.log write sleep `stall` seconds."""
+    import logging.handlers
+
+    original_emit = logging.handlers.RotatingFileHandler.emit
+    counter = {"writes": 0}
+    lock = threading.Lock()
+
+    def emit(self, record):
+        with lock:
+            counter["writes"] += 1
+            stalled = every > 0 and counter["writes"] % every == 0
+        if stalled:
+            time.sleep(stall)
+        original_emit(self, record)
+
+    logging.handlers.RotatingFileHandler.emit = emit
+
+
+def _call_costs(calls: int = 5000):
+    """Microseconds per logger.info() call, and per filtered debug call (f-string, %-style)."""
+    import logging
+
+    logger = logging.getLogger("bench")
+    phone, text = "+15550000000", "How many orders did we ship last week?" * 3
+
+    start = time.perf_counter()
+    for i in range(calls):
+        logger.info("📥 Received from %s: %s (%s)", phone, text[:100], i)
+    info = (time.perf_counter() - start) / calls * 1e6
+
+    start = time.perf_counter()
+    for i in range(calls):
+        logger.debug(f"📥 Received from {phone}: {text[:100]} ({i})")
+    eager = (time.perf_counter() - start) / calls * 1e6
+
+    start = time.perf_counter()
+    for i in range(calls):
+        logger.debug("📥 Received from %s: %s (%s)", phone, text[:100], i)
+    lazy = (time.perf_counter() - start) / calls * 1e6
+    return info, eager, lazy
+
+
+def _run_one(args):
+    """Child process: serve webhooks with the LOG_MODE from the environment and print a JSON result."""
+    from benchmarks.stub_servers import FakeAYDServer, FakeTwilioServer
+    from benchmarks.webhooks import WebhookSigner
+
+    _slow_down_file_writes(args.stall_every, args.stall_ms / 1000)
+    with FakeAYDServer(response_delay=args.ayd_ms / 1000) as ayd, FakeTwilioServer() as twilio:
+        os.environ["ASKYOURDATABASE_BASE_URL"] = ayd.url
+        os.environ["TWILIO_API_BASE_URL"] = twilio.url
+        from app import create_app
+        from app.settings.config import Config
+        from app.services.dispatcher import dispatcher
+        from app.utils.logger import get_logging_stats
+
+        client = create_app().test_client()
+        signer = WebhookSigner(Config.TWILIO_WEBHOOK_URL, Config.TWILIO_AUTH_TOKEN)
+
+        def post(i):
+            params, headers = signer.build(f"+1555{i % args.users:07d}", f"How many orders on day {i}?")
+            start = time.perf_counter()
+            response = client.post("/whatsapp", data=params, headers=headers)
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200, response.status_code
+            return elapsed * 1000
+
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            latencies = list(pool.map(post, range(args.requests)))
+        dispatcher.shutdown(timeout=60)
+        stats = get_logging_stats() or {}
+        info_us, eager_us, lazy_us = _call_costs()
+
+    print(json.dumps({
+        "mean": statistics.mean(latencies),
+        "p50": _percentile(latencies, 50),
+        "p99": _percentile(latencies, 99),
+        "max": max(latencies),
+        "dropped": stats.get("dropped", 0),
+        "info_us": info_us,
+        "eager_us": eager_us,
+        "lazy_us": lazy_us,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="sync,queue", help="Comma-separated LOG_MODE values")
+    parser.add_argument("--format", default="text", choices=["text", "json"], help="LOG_FORMAT")
+    parser.add_argument("--requests", type=int, default=2000, help="Webhooks to post per mode")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent webhook clients")
+    parser.add_argument("--users", type=int, default=500, help="Distinct sender numbers")
+    parser.add_argument("--ayd-ms", type=float, default=5, help="Fake AYD answer delay")
+    parser.add_argument("--stall-every", type=int, default=200, help="Every Nth log file write stalls (0: never)")
+    parser.add_argument("--stall-ms", type=float, default=50, help="Length of a stalled write")
+    parser.add_argument("--queue-size", type=int, default=10000, help="LOG_QUEUE_SIZE")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return _run_one(args)
+
+    print(f"{args.requests} webhooks, {args.threads} threads, {args.format} logs, "
+          f"1 in {args.stall_every} writes stalls {args.stall_ms:g} ms")
+    print(f"{'mode':<8}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'dropped':>10}"
+          f"{'info() us':>12}{'debug f us':>12}{'debug % us':>12}")
+    for mode in args.modes.split(","):
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(
+                os.environ,
+                LOG_MODE=mode,
+                LOG_FORMAT=args.format,
+                LOG_QUEUE_SIZE=str(args.queue_size),
+                LOG_DIR=os.path.join(workdir, "logs"),
+                FLASK_DEBUG="False",
+                TWILIO_ACCOUNT_SID=os.environ.get("TWILIO_ACCOUNT_SID", "ACbench"),
+                TWILIO_AUTH_TOKEN=os.environ.get("TWILIO_AUTH_TOKEN", "bench-token"),
+                TWILIO_FROM_NUMBER=os.environ.get("TWILIO_FROM_NUMBER", "+15550000000"),
+                TWILIO_WEBHOOK_URL="http://localhost/whatsapp",
+                SESSION_CSV_PATH=os.path.join(workdir, "sessions.csv"),
+                RATE_LIMITER_BACKEND="token_bucket",
+                RATE_LIMITER_MAX_REQUESTS_PER_MINUTE="1000000",
+                DISPATCHER_MAX_QUEUE_SIZE=str(args.requests),
+                TWILIO_SEND_RATE="0",
+            )
+            child = [sys.executable, "-m", "benchmarks.bench_logging", "--child"] + sys.argv[1:]
+            output = subprocess.run(child, env=env, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<8}{result['mean']:>10.2f}{result['p50']:>10.2f}{result['p99']:>10.2f}"
+              f"{result['max']:>10.2f}{result['dropped']:>10}{result['info_us']:>12.2f}"
+              f"{result['eager_us']:>12.2f}{result['lazy_us']:>12.2f}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark: AYD calls and answer latency with and without message merging.
+
+Users often type one thought as several quick messages ("how many orders",
+"last week", "by region"). Each MERGE_WINDOW runs in its own subprocess
+(Config is read at import) with the Flask app pointed at a local
+FakeAYDServer and FakeTwilioServer; --users clients each send --bursts
+bursts of --burst messages --gap-ms apart and wait for the answers. It
+reports AYD asks per message, replies per burst, and the time from a
+burst's last message until its answers arrived.
+
+    python -m benchmarks.bench_merging --windows 0,1,2 --burst 3 --gap-ms 400
+    python -m benchmarks.bench_merging --users 50 --ayd-ms 800 --env JOB_JOURNAL_ENABLED=True
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _run_one(args):
+    """Child process: send the message bursts with the MERGE_WINDOW from the environment, print a JSON result."""
+    from benchmarks.stub_servers import FakeAYDServer, FakeTwilioServer
+    from benchmarks.webhooks import WebhookSigner
+
+    with FakeAYDServer(response_delay=args.ayd_ms / 1000) as ayd, FakeTwilioServer() as twilio:
+        os.environ["ASKYOURDATABASE_BASE_URL"] = ayd.url
+        os.environ["TWILIO_API_BASE_URL"] = twilio.url
+        from app import create_app
+        from app.settings.config import Config
+        from app.services.dispatcher import dispatcher
+
+        client = create_app().test_client()
+        signer = WebhookSigner(Config.TWILIO_WEBHOOK_URL, Config.TWILIO_AUTH_TOKEN)
+        gap = args.gap_ms / 1000
+        merged = Config.MERGE_WINDOW > gap and args.burst <= Config.MERGE_MAX_MESSAGES
+        replies_per_burst = 1 if merged else args.burst
+
+        def user(u):
+            sender = f"+1555{u:07d}"
+            latencies, lost = [], 0
+            for b in range(args.bursts):
+                for m in range(args.burst):
+                    if m:
+                        time.sleep(gap)
+                    params, headers = signer.build(sender, f"part {m} of question {b}")
+                    response = client.post("/whatsapp", data=params, headers=headers)
+                    assert response.status_code == 200, response.status_code
+                sent_at = time.perf_counter()
+                if twilio.wait_for(f"whatsapp:{sender}", (b + 1) * replies_per_burst, args.timeout):
+                    latencies.append((time.perf_counter() - sent_at) * 1000)
+                else:
+                    lost += 1
+            return latencies, lost
+
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            results = list(pool.map(user, range(args.users)))
+        dispatcher.shutdown(timeout=60)
+        messages = args.users * args.bursts * args.burst
+
+    latencies = [latency for user_latencies, _ in results for latency in user_latencies]
+    print(json.dumps({
+        "asks_per_msg": ayd.asks / messages,
+        "replies_per_burst": sum(twilio.received.values()) / (args.users * args.bursts),
+        "p50": _percentile(latencies, 50) if latencies else 0.0,
+        "p99": _percentile(latencies, 99) if latencies else 0.0,
+        "mean": statistics.mean(latencies) if latencies else 0.0,
+        "lost": sum(lost for _, lost in results),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--windows", default="0,1,2", help="Comma-separated MERGE_WINDOW values (seconds)")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent users")
+    parser.add_argument("--bursts", type=int, default=3, help="Bursts (questions) per user")
+    parser.add_argument("--burst", type=int, default=3, help="Messages per burst")
+    parser.add_argument("--gap-ms", type=float, default=400, help="Pause between the messages of a burst")
+    parser.add_argument("--ayd-ms", type=float, default=300, help="Fake AYD answer delay")
+    parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for a burst's answers")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the app under test (repeatable)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return _run_one(args)
+
+    print(f"{args.users} users x {args.bursts} bursts of {args.burst} messages, {args.gap_ms:g} ms apart, "
+          f"AYD answers in {args.ayd_ms:g} ms")
+    print(f"{'window s':<10}{'asks/msg':>10}{'replies/burst':>15}{'answer p50 ms':>15}"
+          f"{'answer p99 ms':>15}{'lost':>6}")
+    for window in args.windows.split(","):
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(
+                os.environ,
+                MERGE_WINDOW=window,
+                LOG_DIR=os.path.join(workdir, "logs"),
+                FLASK_DEBUG="False",
+                TWILIO_ACCOUNT_SID=os.environ.get("TWILIO_ACCOUNT_SID", "ACbench"),
+                TWILIO_AUTH_TOKEN=os.environ.get("TWILIO_AUTH_TOKEN", "bench-token"),
+                TWILIO_FROM_NUMBER=os.environ.get("TWILIO_FROM_NUMBER", "+15550000000"),
+                TWILIO_WEBHOOK_URL="http://localhost/whatsapp",
+                SESSION_CSV_PATH=os.path.join(workdir, "sessions.csv"),
+                JOB_JOURNAL_PATH=os.path.join(workdir, "jobs.db"),
+                IDEMPOTENCY_SQLITE_PATH=os.path.join(workdir, "idempotency.db"),
+                RATE_LIMITER_BACKEND="token_bucket",
+                RATE_LIMITER_MAX_REQUESTS_PER_MINUTE="1000000",
+                TWILIO_SEND_RATE="0",
+            )
+            env.update(item.split("=", 1) for item in args.env)
+            child = [sys.executable, "-m", "benchmarks.bench_merging", "--child"] + sys.argv[1:]
+            output = subprocess.run(child, env=env, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+        print(f"{window:<10}{result['asks_per_msg']:>10.2f}{result['replies_per_burst']:>15.2f}"
+              f"{result['p50']:>15.1f}{result['p99']:>15.1f}{result['lost']:>6}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Microbenchmark: rate limiter checks per second and memory at 1M distinct numbers.
+
+Each limiter runs in its own subprocess so RSS figures are not mixed up. The
+redis backend runs against --redis-url, or a local RESP stand-in if omitted
+(use fewer --users then: the stand-in is pure Python). --accuracy-procs also
+checks that shared backends hold the limit when several processes hammer the
+same user.
+
+    python -m benchmarks.bench_rate_limiter --users 1000000 --hot-checks 1000000
+    python -m benchmarks.bench_rate_limiter --backends mmap,redis --users 20000 --accuracy-procs 4
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _rss_mb() -> float:
+    """Current resident set size of this process in MB (Linux), falling back to peak RSS."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _make_limiter(backend: str, workdir: str, redis_url: str, prefix: str):
+    os.environ.setdefault("FLASK_DEBUG", "False")
+    from app.utils import rate_limiter
+
+    if backend == "mmap":
+        return rate_limiter.MmapRateLimiter(path=os.path.join(workdir, "rate_limits.bin"))
+    if backend == "redis":
+        return rate_limiter.RedisRateLimiter(url=redis_url, prefix=prefix)
+    return rate_limiter.create_rate_limiter(backend)
+
+
+def _run_one(backend: str, users: int, hot_checks: int, workdir: str, redis_url: str):
+    limiter = _make_limiter(backend, workdir, redis_url, f"bench:{time.time_ns()}:")
+    numbers = [f"+1{i:010d}" for i in range(users)]
+    limiter.is_allowed("+warmup")  # open files / connections before measuring
+    baseline = _rss_mb()
+
+    # Distinct numbers: every check creates new state
+    start = time.perf_counter()
+    for number in numbers:
+        limiter.is_allowed(number)
+    distinct_elapsed = time.perf_counter() - start
+    rss = _rss_mb() - baseline
+
+    # Hot path: a small set of active users checked repeatedly
+    hot = numbers[:1000]
+    start = time.perf_counter()
+    for i in range(hot_checks):
+        limiter.is_allowed(hot[i % len(hot)])
+    hot_elapsed = time.perf_counter() - start
+
+    print(f"{backend:<14}{users / distinct_elapsed:>16,.0f}{hot_checks / hot_elapsed:>16,.0f}"
+          f"{hot_elapsed / hot_checks * 1e6:>12.2f}{rss:>12.1f}", flush=True)
+
+
+def _hammer(backend: str, workdir: str, redis_url: str, prefix: str, attempts: int, results):
+    limiter = _make_limiter(backend, workdir, redis_url, prefix)
+    results.put(sum(limiter.is_allowed("+15550000000") for _ in range(attempts)))
+
+
+def _accuracy(backend: str, procs: int, workdir: str, redis_url: str):
+    """N processes try 50 requests each for the same user; a shared backend allows only the limit."""
+    from app.settings.config import Config
+
+    prefix = f"bench:{time.time_ns()}:"
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_hammer, args=(backend, workdir, redis_url, prefix, 50, results))
+               for _ in range(procs)]
+    for worker in workers:
+        worker.start()
+    allowed = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    print(f"{backend:<14}{procs} processes allowed {allowed} requests "
+          f"(limit {Config.RATE_LIMITER_MAX_REQUESTS_PER_MINUTE}/min)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000, help="Distinct phone numbers")
+    parser.add_argument("--hot-checks", type=int, default=1_000_000, help="Checks over 1000 active users")
+    parser.add_argument("--backends", default="simple,token_bucket,mmap")
+    parser.add_argument("--redis-url", help="Real Redis-protocol server for the redis backend")
+    parser.add_argument("--accuracy-procs", type=int, default=0, help="Processes for the shared-limit check")
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        return _run_one(args.backend, args.users, args.hot_checks, args.workdir, args.redis_url)
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    stand_in = None
+    redis_url = args.redis_url
+    if "redis" in backends and not redis_url:
+        from benchmarks.stub_servers import FakeRedisServer
+        stand_in = FakeRedisServer().start()
+        redis_url = stand_in.url
+
+    try:
+        print(f"{args.users:,} distinct numbers, {args.hot_checks:,} hot checks\n")
+        print(f"{'backend':<14}{'new checks/s':>16}{'hot checks/s':>16}{'us/check':>12}{'state MB':>12}")
+        for backend in backends:
+            workdir = tempfile.mkdtemp(prefix="ratelimit-bench-")
+            command = [sys.executable, "-m", "benchmarks.bench_rate_limiter", "--backend", backend,
+                       "--users", str(args.users), "--hot-checks", str(args.hot_checks), "--workdir", workdir]
+            if redis_url:
+                command += ["--redis-url", redis_url]
+            subprocess.run(command, check=True)
+
+        if args.accuracy_procs:
+            print()
+            for backend in backends:
+                _accuracy(backend, args.accuracy_procs, tempfile.mkdtemp(prefix="ratelimit-acc-"), redis_url)
+    finally:
+        if stand_in is not None:
+            stand_in.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark: splitting long answers into WhatsApp parts.
+
+Compares the previous splitter (re-slicing the remaining text after every
+part, code point lengths, a fixed 15-character header reserve) with
+app.utils.text_splitter on generated multi-megabyte answers: plain ASCII
+prose, emoji/non-Latin prose and a markdown-table-heavy answer. Besides the
+time, it reports how many parts would exceed the limit once their real
+"[Part i/n]" header is added (counted in UTF-16 units, as WhatsApp does) and
+how many markdown tables were split across parts.
+
+    python -m benchmarks.bench_splitter --mb 4
+"""
+import argparse
+import random
+import time
+
+
+def _legacy_find_split_point(text: str, chunk_limit: int) -> int:
+    split_point = chunk_limit
+    paragraph_split = text.rfind('\n\n', 0, chunk_limit)
+    if paragraph_split > chunk_limit * 0.6:
+        split_point = paragraph_split + 2
+    else:
+        line_split = text.rfind('\n', 0, chunk_limit)
+        if line_split > chunk_limit * 0.7:
+            split_point = line_split + 1
+        else:
+            sentence_split = text.rfind('. ', 0, chunk_limit)
+            if sentence_split > chunk_limit * 0.7:
+                split_point = sentence_split + 2
+            else:
+                word_split = text.rfind(' ', 0, chunk_limit)
+                if word_split > chunk_limit * 0.8:
+                    split_point = word_split + 1
+    return split_point
+
+
+def legacy_split(text: str, max_chars: int) -> list:
+    """The previous _split_message."""
+    chunk_limit = max_chars - 15
+    if len(text) <= chunk_limit:
+        return [text]
+    chunks = []
+    remaining = text
+    while remaining:
+        if len(remaining) <= chunk_limit:
+            chunks.append(remaining)
+            break
+        split_point = _legacy_find_split_point(remaining, chunk_limit)
+        chunks.append(remaining[:split_point].strip())
+        remaining = remaining[split_point:].strip()
+    return chunks
+
+
+def _prose(size: int, words) -> str:
+    rng = random.Random(42)
+    out, length = [], 0
+    while length < size:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(5, 20))) + ". "
+        if rng.random() < 0.1:
+            sentence += "\n\n" if rng.random() < 0.5 else "\n"
+        out.append(sentence)
+        length += len(sentence)
+    return "".join(out)
+
+
+def _tables(size: int) -> str:
+    rng = random.Random(7)
+    out, length, n = [], 0, 0
+    while length < size:
+        rows = "".join(f"| {i} | Region {rng.randint(1, 30)} | {rng.random() * 1e5:.2f} |\n"
+                       for i in range(rng.randint(3, 40)))
+        block = f"Result {n}:\n\n| id | region | sales |\n|---|---|---|\n{rows}\n"
+        out.append(block)
+        length += len(block)
+        n += 1
+    return "".join(out)
+
+
+FIXTURES = {
+    "ascii prose": lambda size: _prose(size, ["revenue", "grew", "in", "the", "north", "region", "by",
+                                               "twelve", "percent", "quarter", "orders", "customers"]),
+    "emoji + CJK": lambda size: _prose(size, ["売上", "増加", "📈", "👍🏽", "🇯🇵", "地域", "顧客", "👨‍👩‍👧",
+                                               "🚀", "数据", "增长", "é", "नमस्ते"]),
+    "markdown tables": _tables,
+}
+
+
+def _check(text_splitter, chunks, limit):
+    """Parts over the limit once headed, and tables cut mid-way."""
+    total = len(chunks)
+    over = 0
+    split_tables = 0
+    for i, chunk in enumerate(chunks, 1):
+        if total > 1 and text_splitter.utf16_len(text_splitter.part_header(i, total) + chunk) > limit:
+            over += 1
+        if i < total and chunk.rstrip().endswith("|") and chunks[i].lstrip().startswith("|"):
+            split_tables += 1
+    return over, split_tables
+
+
+def _time(func, text, limit, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text, limit)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=4, help="Size of each generated answer in MB of text")
+    parser.add_argument("--limit", type=int, default=1600, help="Max UTF-16 units per message")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per splitter (best time is reported)")
+    args = parser.parse_args()
+
+    from app.utils import text_splitter
+
+    size = int(args.mb * 1_000_000)
+    print(f"{'answer':<17}{'splitter':<10}{'ms':>9}{'MB/s':>8}{'parts':>8}{'too long':>10}{'split tables':>14}")
+    for name, build in FIXTURES.items():
+        text = build(size)
+        for label, func in (("previous", legacy_split), ("new", text_splitter.split_message)):
+            elapsed, chunks = _time(func, text, args.limit, args.repeat)
+            over, split_tables = _check(text_splitter, chunks, args.limit)
+            print(f"{name:<17}{label:<10}{elapsed * 1000:>9.1f}{len(text) / 1e6 / elapsed:>8.1f}"
+                  f"{len(chunks):>8}{over:>10}{split_tables:>14}")
+
+
+if __name__ == "__main__":
+    main()
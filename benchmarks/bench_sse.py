@@ -0,0 +1,188 @@
+"""
+Benchmark: parsing AYD answer streams (SSE) into answer text.
+
+Compares the previous pipeline (sseclient-py over requests' default 1-byte
+iter_content chunks, json.loads on every event) with app.utils.sse, using the
+stdlib json and, when installed, orjson. The fixture is a generated AYD-style
+stream for a large tabular answer: status events, a big non-text event with
+the query result, and one text event per table row. Pass --fixture to parse a
+recorded stream instead (`curl -N ... > answer.sse`), or --save to write the
+generated one to disk. The stream is also served from a local HTTP server,
+plain and gzip-compressed, and read through requests the way the AYD client
+does, so a body that is not decoded shows up as "text differs".
+
+    python -m benchmarks.bench_sse --rows 5000
+    python -m benchmarks.bench_sse --fixture answer.sse --repeat 20
+"""
+import argparse
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def build_fixture(rows: int) -> bytes:
+    """A recorded-like AYD answer stream with `rows` table rows."""
+    records = [{"id": i, "region": f"Region {i % 17}", "sales": round(i * 13.37, 2), "orders": i % 101}
+               for i in range(rows)]
+    events = [
+        {"isText": False, "type": "status", "content": "thinking"},
+        {"isText": False, "type": "sql", "content": "SELECT id, region, sales, orders FROM sales ORDER BY id"},
+        {"isText": False, "type": "data", "content": records},
+        {"isText": True, "content": "Here are the sales per region:\n\n| id | region | sales | orders |\n|---|---|---|---|\n"},
+    ]
+    for record in records:
+        events.append({"isText": True, "content": f"| {record['id']} | {record['region']} | "
+                                                  f"{record['sales']} | {record['orders']} |\n"})
+        if record["id"] % 50 == 0:
+            events.append({"isText": False, "type": "progress", "content": record["id"]})
+    events.append({"isText": True, "content": f"\nTotal: {rows} rows."})
+    events.append({"isText": False, "type": "done"})
+    return b"".join(b"data: " + json.dumps(event).encode() + b"\n\n" for event in events)
+
+
+def _chunks(payload: bytes, size: int):
+    for i in range(0, len(payload), size):
+        yield payload[i:i + size]
+
+
+def parse_sseclient(payload: bytes, chunk_size: int) -> str:
+    """The previous implementation: SSEClient + json.loads on every event."""
+    from sseclient import SSEClient
+
+    parts = []
+    for event in SSEClient(_chunks(payload, chunk_size)).events():
+        try:
+            data = json.loads(event.data)
+            if data.get("isText"):
+                parts.append(data.get("content", ""))
+        except (ValueError, TypeError):
+            continue
+    return "".join(parts)
+
+
+def parse_new(payload: bytes, chunk_size: int) -> str:
+    from app.utils.sse import iter_sse_data, text_content
+
+    parts = []
+    for data in iter_sse_data(_chunks(payload, chunk_size)):
+        content = text_content(data)
+        if content:
+            parts.append(content)
+    return "".join(parts)
+
+
+def parse_http(url: str, chunk_size: int) -> str:
+    """The AYD client's path: a streaming requests response read with iter_response_chunks."""
+    import requests
+    from app.utils.sse import iter_response_chunks, iter_sse_data, text_content
+
+    parts = []
+    with requests.get(url, stream=True, timeout=30) as resp:
+        resp.raise_for_status()
+        for data in iter_sse_data(iter_response_chunks(resp, chunk_size)):
+            content = text_content(data)
+            if content:
+                parts.append(content)
+    return "".join(parts)
+
+
+def serve(payload: bytes) -> ThreadingHTTPServer:
+    """Serve the stream at /plain and, gzip-compressed, at /gzip on a local port."""
+    bodies = {"/plain": payload, "/gzip": gzip.compress(payload)}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            body = bodies[self.path]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Content-Length", str(len(body)))
+            if self.path == "/gzip":
+                self.send_header("Content-Encoding", "gzip")
+            self.end_headers()
+            for i in range(0, len(body), 65536):
+                self.wfile.write(body[i:i + 65536])
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _time(func, payload, chunk_size, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(payload, chunk_size)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000, help="Table rows in the generated answer")
+    parser.add_argument("--fixture", help="Recorded SSE stream to parse instead")
+    parser.add_argument("--save", help="Write the generated fixture to this file")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per parser (best time is reported)")
+    args = parser.parse_args()
+
+    if args.fixture:
+        with open(args.fixture, "rb") as file:
+            payload = file.read()
+    else:
+        payload = build_fixture(args.rows)
+        if args.save:
+            with open(args.save, "wb") as file:
+                file.write(payload)
+
+    from app.utils import sse
+
+    candidates = []
+    try:
+        import sseclient  # noqa: F401  (no longer a dependency, compared when installed)
+        candidates += [("sseclient, 1 B reads", parse_sseclient, 1),
+                       ("sseclient, 64 KB reads", parse_sseclient, 65536)]
+    except ImportError:
+        print("sseclient-py not installed, skipping the previous implementation\n")
+
+    backend_loads = sse._loads
+    runs = [("sse + json, 64 KB reads", sse._json_loads)]
+    if sse.JSON_BACKEND != "json":
+        runs.append((f"sse + {sse.JSON_BACKEND}, 64 KB reads", backend_loads))
+
+    events = payload.count(b"\n\n")
+    print(f"{len(payload) / 1e6:.2f} MB, {events:,} events\n")
+    print(f"{'parser':<28}{'ms':>10}{'MB/s':>10}{'events/s':>14}")
+
+    reference = None
+    results = []
+    for name, func, chunk_size in candidates:
+        results.append((name, *_time(func, payload, chunk_size, 1 if chunk_size == 1 else args.repeat)))
+    for name, loads in runs:
+        sse._loads = loads
+        results.append((name, *_time(parse_new, payload, 65536, args.repeat)))
+    sse._loads = backend_loads
+
+    server = serve(payload)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    for name, path in (("sse over HTTP", "/plain"), ("sse over HTTP, gzip", "/gzip")):
+        results.append((name, *_time(parse_http, base_url + path, 65536, args.repeat)))
+    server.shutdown()
+
+    for name, elapsed, text in results:
+        if reference is None:
+            reference = text
+        status = "" if text == reference else "  (text differs!)"
+        print(f"{name:<28}{elapsed * 1000:>10.1f}{len(payload) / 1e6 / elapsed:>10.1f}"
+              f"{events / elapsed:>14,.0f}{status}")
+
+
+if __name__ == "__main__":
+    main()
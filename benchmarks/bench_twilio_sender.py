@@ -0,0 +1,137 @@
+"""
+Benchmark and checks for TwilioSender against a local FakeTwilioServer.
+
+Sends --answers multi-part answers (--parts parts each) to different users,
+first one part at a time (the previous behaviour) and then pipelined, and
+reports answer latency, per-part latency and whether every user received
+their parts in order. A second round injects 429 and 503 responses to
+exercise the jittered retries; there, a part already in flight may overtake
+one that is backing off, so order is reported but not required. These rounds
+run without a send rate.
+
+A last round checks the outbound governor's fairness at --rate messages per
+second: one user gets a --long-parts answer while --answers other users each
+get a one-part reply, started just after it. With round-robin scheduling the
+short replies go out within about (users / rate) seconds instead of queueing
+behind the whole long answer.
+
+    python -m benchmarks.bench_twilio_sender --parts 6 --answers 20 --latency-ms 150 --rate 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_servers import FakeTwilioServer
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _round(sender, stub, name, answers, parts, users_prefix):
+    """Send every answer from its own thread; return a result row and whether order held."""
+    def answer(i):
+        to = f"whatsapp:{users_prefix}{i:06d}"
+        bodies = [f"[Part {p}/{parts}]\nanswer {i} part {p}" for p in range(1, parts + 1)]
+        start = time.perf_counter()
+        results = sender.send_parts(to, bodies)
+        return to, bodies, time.perf_counter() - start, [r.latency for r in results]
+
+    with ThreadPoolExecutor(max_workers=answers) as pool:
+        outcomes = list(pool.map(answer, range(answers)))
+
+    in_order = all(stub.bodies_for(to) == bodies for to, bodies, _, _ in outcomes)
+    answer_ms = [elapsed * 1000 for _, _, elapsed, _ in outcomes]
+    part_ms = [latency * 1000 for *_, latencies in outcomes for latency in latencies]
+    return (name, statistics.mean(answer_ms), _percentile(answer_ms, 95),
+            statistics.mean(part_ms), in_order)
+
+
+def _fairness_round(sender, stub, users, long_parts):
+    """One long answer plus `users` one-part replies; return the short replies' latencies and governor stats."""
+    def short(i):
+        to = f"whatsapp:+1888{i:06d}"
+        start = time.perf_counter()
+        sender.send(to, f"short reply {i}")
+        return time.perf_counter() - start
+
+    long_to = "whatsapp:+1999000000"
+    with ThreadPoolExecutor(max_workers=users + 1) as pool:
+        start = time.perf_counter()
+        long_answer = pool.submit(sender.send_parts, long_to,
+                                  [f"[Part {p}/{long_parts}]\nlong {p}" for p in range(1, long_parts + 1)])
+        time.sleep(0.05)  # let the long answer queue first
+        short_ms = [elapsed * 1000 for elapsed in pool.map(short, range(users))]
+        long_answer.result()
+        long_ms = (time.perf_counter() - start) * 1000
+    return short_ms, long_ms, sender.governor.get_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parts", type=int, default=6)
+    parser.add_argument("--answers", type=int, default=20, help="Concurrent answers (one user each)")
+    parser.add_argument("--latency-ms", type=float, default=150, help="Fake Twilio response time")
+    parser.add_argument("--concurrency", type=int, default=3, help="Parts in flight per answer")
+    parser.add_argument("--rate", type=float, default=20, help="Messages/second in the fairness round")
+    parser.add_argument("--long-parts", type=int, default=40, help="Parts of the long answer in the fairness round")
+    args = parser.parse_args()
+
+    with FakeTwilioServer(response_delay=args.latency_ms / 1000, retry_after=0.05) as stub:
+        os.environ.update({
+            "TWILIO_API_BASE_URL": stub.url,
+            "TWILIO_ACCOUNT_SID": os.environ.get("TWILIO_ACCOUNT_SID", "ACbench"),
+            "TWILIO_AUTH_TOKEN": os.environ.get("TWILIO_AUTH_TOKEN", "bench-token"),
+            "TWILIO_FROM_NUMBER": os.environ.get("TWILIO_FROM_NUMBER", "+15550000000"),
+            "ASKYOURDATABASE_API_KEY": os.environ.get("ASKYOURDATABASE_API_KEY", "bench-key"),
+            "ASKYOURDATABASE_CHAT_ID": os.environ.get("ASKYOURDATABASE_CHAT_ID", "bench-bot"),
+            "HTTP_POOL_MAXSIZE": str(args.answers * args.concurrency),
+            "FLASK_DEBUG": "False",
+        })
+        from app.services.twilio_client import OutboundGovernor, TwilioSender
+
+        threads = args.answers * args.concurrency
+        unlimited = OutboundGovernor(rate=0)
+        rows = [
+            _round(TwilioSender(concurrency=1, threads=threads, governor=unlimited), stub, "serial",
+                   args.answers, args.parts, "+1555"),
+            _round(TwilioSender(concurrency=args.concurrency, threads=threads, governor=unlimited), stub,
+                   "pipelined", args.answers, args.parts, "+1666"),
+        ]
+
+        # The first fifth of the next round's requests get a 429 or 503 first
+        stub.fail_next(*([429, 503] * (args.answers * args.parts // 10)))
+        sender = TwilioSender(concurrency=args.concurrency, threads=threads, backoff=0.05, governor=unlimited)
+        rows.append(_round(sender, stub, "with 429/5xx", args.answers, args.parts, "+1777"))
+        retried = sender.get_stats()["retried"]
+
+        governed = TwilioSender(concurrency=args.concurrency, threads=threads,
+                                governor=OutboundGovernor(rate=args.rate, burst=1))
+        short_ms, long_ms, governor_stats = _fairness_round(governed, stub, args.answers, args.long_parts)
+
+    print(f"{args.answers} answers x {args.parts} parts, Twilio latency {args.latency_ms:.0f} ms\n")
+    print(f"{'mode':<14}{'answer ms':>12}{'p95 ms':>10}{'part ms':>10}{'in order':>10}")
+    for name, mean_ms, p95_ms, part_ms, in_order in rows:
+        print(f"{name:<14}{mean_ms:>12.1f}{p95_ms:>10.1f}{part_ms:>10.1f}{'yes' if in_order else 'NO':>10}")
+    print(f"\n{retried} retried sends in the 429/5xx round")
+
+    total = args.long_parts + args.answers
+    print(f"\nFairness at {args.rate:g} msg/s: {args.long_parts}-part answer + {args.answers} one-part replies")
+    print(f"  short replies: mean {statistics.mean(short_ms):.0f} ms, max {max(short_ms):.0f} ms "
+          f"(behind the long answer FIFO: ~{args.long_parts / args.rate * 1000:.0f} ms)")
+    print(f"  long answer:   {long_ms:.0f} ms (all {total} messages at the rate: ~{total / args.rate * 1000:.0f} ms)")
+    print(f"  queue wait:    avg {governor_stats['wait_avg'] * 1000:.0f} ms, "
+          f"p95 {governor_stats['wait_p95'] * 1000:.0f} ms, max {governor_stats['wait_max'] * 1000:.0f} ms")
+
+    if not all(row[-1] for row in rows[:2]):
+        print("FAIL: parts delivered out of order")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Load test: the whole /whatsapp -> AYD -> Twilio path at increasing concurrency.
+
+Starts a FakeAYDServer and a FakeTwilioServer in this process and the real app
+(`python run.py`, threaded or --mode async) in a child process, pointed at the
+stubs through ASKYOURDATABASE_BASE_URL and TWILIO_API_BASE_URL. For each
+--concurrency level, that many simulated users each post a signed webhook,
+wait until their reply reaches the fake Twilio endpoint, and send the next one
+until --duration seconds have passed (a closed loop: one message in flight per
+user). Per level it reports:
+
+  msg/s        replies delivered per second
+  ack p50/95/99   webhook response time (what Twilio's 15 s timeout sees)
+  reply p50/95/99 webhook sent until the reply arrived at Twilio
+  threads, RSS    peak thread count and resident memory of the app process
+  401s, timeouts  AYD answers the fake server turned into 401s or stalls
+  lost            messages whose reply did not arrive within --reply-timeout
+  busy            messages answered in the webhook response instead (queue full or rate limited)
+  asks/msg        AYD questions per message sent (above 1 with 401s, or with
+                  --duplicate-rate when retried webhooks are not deduplicated)
+
+--duplicate-rate re-posts that fraction of webhooks with the same MessageSid,
+the way Twilio retries a webhook it considers failed.
+
+Answers are kept to a single WhatsApp message so each webhook gets exactly one
+Twilio send. --env KEY=VALUE passes settings to the app (e.g.
+DISPATCHER_WORKERS=32), and --json writes the rows for tracking regressions.
+
+    python -m benchmarks.load_test --concurrency 1,4,16,64 --duration 10 --ayd-ms 200
+    python -m benchmarks.load_test --mode async --unauthorized-rate 0.05 --timeout-rate 0.02 --json load.json
+    python -m benchmarks.load_test --duplicate-rate 0.3 --env IDEMPOTENCY_ENABLED=False
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.stub_servers import FakeAYDServer, FakeTwilioServer
+from benchmarks.webhooks import WebhookSigner
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _proc_status(pid: int):
+    """(threads, RSS in MB) of a process, from /proc (Linux); (0, 0.0) if unavailable."""
+    threads, rss = 0, 0.0
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("Threads:"):
+                    threads = int(line.split()[1])
+                elif line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return threads, rss
+
+
+class _Sampler(threading.Thread):
+    """Polls the app process's thread count and RSS, keeping the peaks."""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.threads = 0
+        self.rss = 0.0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            threads, rss = _proc_status(self.pid)
+            self.threads = max(self.threads, threads)
+            self.rss = max(self.rss, rss)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _start_app(args, workdir: str, port: int, ayd: FakeAYDServer, twilio: FakeTwilioServer, signer):
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO_ROOT,
+        EXECUTION_MODE=args.mode,
+        HOST="127.0.0.1",
+        PORT=str(port),
+        FLASK_DEBUG="False",
+        TWILIO_ACCOUNT_SID=signer.account_sid,
+        TWILIO_AUTH_TOKEN=args.auth_token,
+        TWILIO_FROM_NUMBER=signer.to,
+        TWILIO_WEBHOOK_URL=signer.url,
+        TWILIO_API_BASE_URL=twilio.url,
+        ASKYOURDATABASE_BASE_URL=ayd.url,
+        ASKYOURDATABASE_API_KEY="bench-key",
+        ASKYOURDATABASE_CHAT_ID="bench-bot",
+        HTTP_READ_TIMEOUT=str(args.read_timeout),
+        RATE_LIMITER_MAX_REQUESTS_PER_MINUTE="1000000",
+        RATE_LIMITER_MMAP_PATH=os.path.join(workdir, "rate_limits.bin"),
+        SESSION_CSV_PATH=os.path.join(workdir, "ayd_sessions.csv"),
+        SESSION_SQLITE_PATH=os.path.join(workdir, "ayd_sessions.db"),
+        SESSION_RENEW_LOCK_PATH=os.path.join(workdir, "ayd_sessions.renew.lock"),
+        JOB_JOURNAL_PATH=os.path.join(workdir, "jobs.db"),
+        ATTACHMENTS_DIR=os.path.join(workdir, "attachments"),
+        LOG_DIR=os.path.join(workdir, "logs"),
+        IDEMPOTENCY_ENABLED=os.environ.get("IDEMPOTENCY_ENABLED", "True"),
+        IDEMPOTENCY_SQLITE_PATH=os.path.join(workdir, "idempotency.db"),
+    )
+    for setting in args.env:
+        key, _, value = setting.partition("=")
+        env[key] = value
+    # Retried webhooks get a second reply unless the app deduplicates them
+    args.deduplicating = env["IDEMPOTENCY_ENABLED"].lower() == "true"
+
+    output = open(os.path.join(workdir, "app.out"), "w")
+    process = subprocess.Popen([sys.executable, "run.py"], cwd=REPO_ROOT, env=env,
+                               stdout=output, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"app exited with code {process.returncode}, see {output.name}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/metrics", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"app did not start listening on port {port}, see {output.name}")
+
+
+def _run_level(args, concurrency: int, port: int, pid: int, ayd, twilio, signer) -> dict:
+    url = f"http://127.0.0.1:{port}/whatsapp"
+    acks, replies = [], []
+    counts = {"sent": 0, "delivered": 0, "lost": 0, "errors": 0, "rejected": 0, "duplicates": 0}
+    lock = threading.Lock()
+    with ayd.lock:
+        unauthorized, timeouts, asks = ayd.unauthorized, ayd.timeouts, ayd.asks
+    deadline = time.monotonic() + args.duration
+
+    def user(index: int):
+        phone = f"+1555{index:07d}"
+        to = f"whatsapp:{phone}"
+        http = requests.Session()
+        retries = random.Random(args.seed * 1000003 + index)
+        sent = 0
+        with twilio.lock:
+            expected = twilio.received.get(to, 0)
+        while time.monotonic() < deadline:
+            params, headers = signer.build(phone, f"How many orders came in on day {sent}?")
+            start = time.monotonic()
+            try:
+                response = http.post(url, data=params, headers=headers, timeout=30)
+                acked = time.monotonic()
+                response.raise_for_status()
+            except requests.RequestException:
+                with lock:
+                    counts["errors"] += 1
+                continue
+            sent += 1
+            if "<Message>" in response.text:
+                # Busy or rate limited: answered in the TwiML, nothing goes through the Twilio API
+                with lock:
+                    counts["rejected"] += 1
+                    acks.append((acked - start) * 1000)
+                continue
+
+            expected += 1
+            duplicated = retries.random() < args.duplicate_rate
+            if duplicated:
+                try:
+                    retry = http.post(url, data=params, headers=headers, timeout=30)
+                    if not args.deduplicating and "<Message>" not in retry.text:
+                        expected += 1
+                except requests.RequestException:
+                    pass
+            delivered = twilio.wait_for(to, expected, args.reply_timeout)
+            if not delivered:
+                with twilio.lock:
+                    expected = twilio.received.get(to, 0)
+            with lock:
+                counts["sent"] += 1
+                counts["duplicates"] += duplicated
+                acks.append((acked - start) * 1000)
+                if delivered:
+                    replies.append((time.monotonic() - start) * 1000)
+                    counts["delivered"] += 1
+                else:
+                    counts["lost"] += 1
+
+    sampler = _Sampler(pid)
+    sampler.start()
+    started = time.monotonic()
+    users = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in users:
+        thread.start()
+    for thread in users:
+        thread.join()
+    elapsed = time.monotonic() - started
+    sampler.stop()
+
+    with ayd.lock:
+        unauthorized, timeouts, asks = ayd.unauthorized - unauthorized, ayd.timeouts - timeouts, ayd.asks - asks
+    return {
+        "concurrency": concurrency,
+        "messages_per_second": counts["delivered"] / elapsed,
+        "ack_p50_ms": _percentile(acks, 50),
+        "ack_p95_ms": _percentile(acks, 95),
+        "ack_p99_ms": _percentile(acks, 99),
+        "reply_p50_ms": _percentile(replies, 50),
+        "reply_p95_ms": _percentile(replies, 95),
+        "reply_p99_ms": _percentile(replies, 99),
+        "reply_mean_ms": statistics.mean(replies) if replies else float("nan"),
+        "threads": sampler.threads,
+        "rss_mb": sampler.rss,
+        "unauthorized": unauthorized,
+        "timeouts": timeouts,
+        "lost": counts["lost"],
+        "errors": counts["errors"],
+        "rejected": counts["rejected"],
+        "duplicates": counts["duplicates"],
+        "asks_per_message": asks / counts["sent"] if counts["sent"] else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", default="threaded", choices=["threaded", "async"], help="EXECUTION_MODE")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated simulated user counts")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per concurrency level")
+    parser.add_argument("--ayd-ms", type=float, default=200, help="Fake AYD delay before the first SSE byte")
+    parser.add_argument("--chunk-ms", type=float, default=20, help="Fake AYD delay between SSE events")
+    parser.add_argument("--chunks", type=int, default=5, help="Text events per answer")
+    parser.add_argument("--chunk-size", type=int, default=40, help="Characters per text event")
+    parser.add_argument("--session-ms", type=float, default=100, help="Fake AYD session creation delay")
+    parser.add_argument("--twilio-ms", type=float, default=50, help="Fake Twilio response delay")
+    parser.add_argument("--unauthorized-rate", type=float, default=0.0, help="Fraction of asks answered 401")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of asks that stall past the timeout")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0,
+                        help="Fraction of webhooks posted twice with the same MessageSid")
+    parser.add_argument("--read-timeout", type=float, default=2, help="HTTP_READ_TIMEOUT of the app")
+    parser.add_argument("--reply-timeout", type=float, default=30, help="Seconds to wait for a reply at Twilio")
+    parser.add_argument("--auth-token", default="bench-token", help="TWILIO_AUTH_TOKEN used to sign webhooks")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the injected 401s and stalls")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra app setting")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    if args.chunks * args.chunk_size > 1500:
+        parser.error("--chunks x --chunk-size must fit in one WhatsApp message (1500 characters)")
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    ayd = FakeAYDServer(response_delay=args.ayd_ms / 1000, chunk_delay=args.chunk_ms / 1000, chunks=args.chunks,
+                        chunk_size=args.chunk_size, session_delay=args.session_ms / 1000,
+                        unauthorized_rate=args.unauthorized_rate, timeout_rate=args.timeout_rate,
+                        stall=args.read_timeout + 1, seed=args.seed)
+    twilio = FakeTwilioServer(response_delay=args.twilio_ms / 1000)
+    port = _free_port()
+    signer = WebhookSigner(f"http://127.0.0.1:{port}/whatsapp", args.auth_token)
+
+    rows = []
+    with ayd, twilio, tempfile.TemporaryDirectory(prefix="ayd-load-") as workdir:
+        process = _start_app(args, workdir, port, ayd, twilio, signer)
+        try:
+            print(f"{args.mode} mode, {args.duration:g}s per level, AYD {args.ayd_ms:g} ms + "
+                  f"{args.chunks} x {args.chunk_ms:g} ms, Twilio {args.twilio_ms:g} ms")
+            print(f"{'users':>6}{'msg/s':>9}{'ack p50':>9}{'p95':>8}{'p99':>8}{'reply p50':>11}{'p95':>8}{'p99':>8}"
+                  f"{'threads':>9}{'RSS MB':>8}{'401s':>6}{'timeouts':>10}{'lost':>6}{'busy':>6}{'asks/msg':>10}")
+            for concurrency in levels:
+                row = _run_level(args, concurrency, port, process.pid, ayd, twilio, signer)
+                rows.append(row)
+                print(f"{concurrency:>6}{row['messages_per_second']:>9.1f}{row['ack_p50_ms']:>9.1f}"
+                      f"{row['ack_p95_ms']:>8.1f}{row['ack_p99_ms']:>8.1f}{row['reply_p50_ms']:>11.0f}"
+                      f"{row['reply_p95_ms']:>8.0f}{row['reply_p99_ms']:>8.0f}{row['threads']:>9}"
+                      f"{row['rss_mb']:>8.1f}{row['unauthorized']:>6}{row['timeouts']:>10}{row['lost']:>6}"
+                      f"{row['rejected']:>6}{row['asks_per_message']:>10.2f}", flush=True)
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"mode": args.mode, "args": vars(args), "levels": rows}, file, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
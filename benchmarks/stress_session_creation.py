@@ -0,0 +1,103 @@
+"""
+Stress test: concurrent messages from new users must create one AYD session each.
+
+Fires --threads concurrent questions per user at SessionBasedAYDClient, against
+a local FakeAYDServer whose session endpoint takes --session-ms, and counts the
+upstream session creations. It runs three rounds:
+
+  unguarded   the old lookup-then-create path, for comparison
+  first-use   new users, every thread misses the session storage at once
+  expired     every stored token is rejected with 401 at once
+
+    python -m benchmarks.stress_session_creation --users 20 --threads 8 --session-ms 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+
+from benchmarks.stub_servers import FakeAYDServer
+
+
+def _burst(users, threads, target):
+    """Run target(phone) from `threads` threads per user, all released together."""
+    barrier = threading.Barrier(len(users) * threads)
+    errors = []
+
+    def run(phone):
+        barrier.wait()
+        try:
+            target(phone)
+        except Exception as e:  # collected, so a failure does not hang the barrier
+            errors.append(e)
+
+    workers = [threading.Thread(target=run, args=(phone,)) for phone in users for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if errors:
+        raise errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent messages per user")
+    parser.add_argument("--session-ms", type=float, default=200, help="Emulated session creation latency")
+    args = parser.parse_args()
+
+    with FakeAYDServer(session_delay=args.session_ms / 1000) as stub:
+        workdir = tempfile.mkdtemp(prefix="ayd-stress-")
+        os.environ.update({
+            "ASKYOURDATABASE_BASE_URL": stub.url,
+            "ASKYOURDATABASE_API_KEY": os.environ.get("ASKYOURDATABASE_API_KEY", "bench-key"),
+            "ASKYOURDATABASE_CHAT_ID": os.environ.get("ASKYOURDATABASE_CHAT_ID", "bench-bot"),
+            "SESSION_STORAGE_BACKEND": "sqlite",
+            "SESSION_SQLITE_PATH": os.path.join(workdir, "sessions.db"),
+            "SESSION_CSV_PATH": os.path.join(workdir, "sessions.csv"),
+            "HTTP_POOL_MAXSIZE": str(args.users * args.threads),
+            "FLASK_DEBUG": "False",
+        })
+        from app.services.simple_ayd_client import SessionBasedAYDClient
+
+        client = SessionBasedAYDClient()
+        expected = args.users
+        rounds = []
+
+        def unguarded(phone):
+            if not client.session_storage.get_session(phone):
+                client._create_session(phone)
+
+        def ask(phone):
+            result = client.ask_with_session(phone, "sales today")
+            if not result.get("success"):
+                raise RuntimeError(result)
+
+        for name, prefix, target in (("unguarded", "+1666", unguarded), ("first-use", "+1555", ask)):
+            users = [f"{prefix}{i:07d}" for i in range(args.users)]
+            before = stub.sessions_created
+            _burst(users, args.threads, target)
+            rounds.append((name, stub.sessions_created - before))
+
+        with stub.lock:
+            stub.tokens.clear()  # every stored token now gets a 401
+        before = stub.sessions_created
+        _burst([f"+1555{i:07d}" for i in range(args.users)], args.threads, ask)
+        rounds.append(("expired", stub.sessions_created - before))
+
+    print(f"{args.users} users x {args.threads} concurrent messages, session creation {args.session_ms:.0f} ms\n")
+    print(f"{'round':<12}{'sessions':>10}{'expected':>10}")
+    failed = False
+    for name, created in rounds:
+        print(f"{name:<12}{created:>10}{expected:>10}")
+        failed |= name != "unguarded" and created != expected
+    if failed:
+        print("\nFAIL: duplicate session creations")
+        sys.exit(1)
+    print("\nOK: one session creation per user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+"""
+Local stand-in servers for benchmarks and load tests.
+
+These speak just enough of the AskYourDatabase API to exercise the real client
+code paths without credentials: session creation, the callback-URL login that
+sets the accessToken cookie, and the streaming /api/ask endpoint. FakeTwilioServer
+accepts Messages.json sends, and FakeRedisServer speaks enough RESP for the
+rate limiter.
+"""
+import itertools
+import json
+import random
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import deque
+from urllib.parse import parse_qs, urlparse
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return  # the client gave up (e.g. timed out on a stalled answer)
+        super().handle_error(request, client_address)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Keep-alive capable handler base with a per-connection setup delay."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        stub = self.server.stub
+        with stub.lock:
+            stub.connections += 1
+        # Stands in for the TCP + TLS handshake cost of a new connection
+        if stub.handshake_delay:
+            time.sleep(stub.handshake_delay)
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+class _FakeAYDHandler(_StubHandler):
+
+    def do_POST(self):
+        stub = self.server.stub
+        path = urlparse(self.path).path
+        body = self._read_body()
+
+        if path == "/api/chatbot/v2/session":
+            if stub.session_delay:
+                time.sleep(stub.session_delay)
+            with stub.lock:
+                stub.sessions_created += 1
+                user = next(stub._ids)
+            payload = json.dumps({"url": f"{stub.url}/login?user={user}"}).encode()
+            return self._send(200, payload)
+
+        if path == "/api/ask":
+            token = self.headers.get("x-ayd-access-token", "")
+            with stub.lock:
+                stub.asks += 1
+                valid = token in stub.tokens
+                if valid and stub.unauthorized_rate and stub._random.random() < stub.unauthorized_rate:
+                    stub.tokens.discard(token)  # the session "expired": the client must create a new one
+                    stub.unauthorized += 1
+                    valid = False
+                stalled = stub.timeout_rate and stub._random.random() < stub.timeout_rate
+                if stalled:
+                    stub.timeouts += 1
+            if not valid:
+                return self._send(401, b'{"error":"Unauthorized"}')
+            if stalled:
+                time.sleep(stub.stall)  # longer than the client's read timeout
+            if stub.response_delay:
+                time.sleep(stub.response_delay)
+
+            events = stub.build_events(json.loads(body or b"{}").get("question", ""))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Content-Length", str(sum(len(e) for e in events)))
+            self.end_headers()
+            for event in events:
+                self.wfile.write(event)
+                if stub.chunk_delay:
+                    self.wfile.flush()
+                    time.sleep(stub.chunk_delay)
+            return
+
+        self._send(404, b'{"error":"Not found"}')
+
+    def do_GET(self):
+        stub = self.server.stub
+        parsed = urlparse(self.path)
+        if parsed.path == "/login":
+            token = f"tok-{parsed.query.split('=')[-1]}-{time.monotonic_ns()}"
+            with stub.lock:
+                stub.tokens.add(token)
+            return self._send(200, b"ok", "text/plain", {"Set-Cookie": f"accessToken={token}; Path=/"})
+        self._send(404, b'{"error":"Not found"}')
+
+
+class FakeAYDServer:
+    """
+    Fake AskYourDatabase server on a local port.
+
+    Args:
+        handshake_delay (float): Seconds slept once per new connection (emulates TCP+TLS setup)
+        response_delay (float): Seconds before the first SSE byte of an answer
+        chunk_delay (float): Seconds between SSE events
+        chunks (int): Number of text events per answer
+        chunk_size (int): Characters per text event
+        session_delay (float): Seconds spent creating a session (before the callback URL is returned)
+        unauthorized_rate (float): Fraction of asks answered 401, invalidating the caller's token
+        timeout_rate (float): Fraction of asks that stall for `stall` seconds before answering
+        stall (float): Seconds a stalled ask waits; set it above the client's read timeout
+        seed (int): Seed for picking the 401s and stalls, for repeatable runs
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, handshake_delay: float = 0.0,
+                 response_delay: float = 0.0, chunk_delay: float = 0.0, chunks: int = 5, chunk_size: int = 40,
+                 session_delay: float = 0.0, unauthorized_rate: float = 0.0, timeout_rate: float = 0.0,
+                 stall: float = 5.0, seed: int = None):
+        self.handshake_delay = handshake_delay
+        self.session_delay = session_delay
+        self.response_delay = response_delay
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.unauthorized_rate = unauthorized_rate
+        self.timeout_rate = timeout_rate
+        self.stall = stall
+
+        self.lock = threading.Lock()
+        self.tokens = set()
+        self.connections = 0
+        self.sessions_created = 0
+        self.asks = 0
+        self.unauthorized = 0
+        self.timeouts = 0
+        self._ids = itertools.count(1)
+        self._random = random.Random(seed)
+
+        self._server = _StubHTTPServer((host, port), _FakeAYDHandler)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def build_events(self, question: str) -> list:
+        """Encode one answer as SSE events: a status event, text chunks, and a done event."""
+        events = [b'data: {"isText": false, "type": "status", "content": "thinking"}\n\n']
+        text = (f"Answer to {question!r}. " * (self.chunk_size // 10 + 1))[:self.chunk_size]
+        for _ in range(self.chunks):
+            events.append(b"data: " + json.dumps({"isText": True, "content": text}).encode() + b"\n\n")
+        events.append(b'data: {"isText": false, "type": "done"}\n\n')
+        return events
+
+    def start(self) -> "FakeAYDServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _FakeTwilioHandler(_StubHandler):
+
+    def do_POST(self):
+        stub = self.server.stub
+        path = urlparse(self.path).path
+        form = {key: values[0] for key, values in parse_qs(self._read_body().decode("utf-8")).items()}
+
+        if not (path.startswith("/2010-04-01/Accounts/") and path.endswith("/Messages.json")):
+            return self._send(404, b'{"message": "Not found"}')
+
+        with stub.lock:
+            stub.requests += 1
+            status = stub.failures.popleft() if stub.failures else 201
+        if stub.response_delay:
+            time.sleep(stub.response_delay)
+
+        if status != 201:
+            headers = {"Retry-After": str(stub.retry_after)} if status == 429 and stub.retry_after is not None else {}
+            return self._send(status, json.dumps({"code": 20429, "message": "Too Many Requests"}).encode(),
+                              headers=headers)
+
+        with stub.lock:
+            sid = f"SM{next(stub._ids):032d}"
+            stub.messages.append((form.get("To"), form.get("Body", ""), time.monotonic()))
+            stub.received[form.get("To")] = stub.received.get(form.get("To"), 0) + 1
+            if form.get("MediaUrl"):
+                stub.media.append((form.get("To"), form["MediaUrl"]))
+            stub.arrived.notify_all()
+        self._send(201, json.dumps({"sid": sid, "status": "queued", "to": form.get("To")}).encode())
+
+
+class FakeTwilioServer:
+    """
+    Fake Twilio REST endpoint for Messages.json on a local port.
+
+    Accepted messages are recorded in arrival order in `messages` as
+    (to, body, monotonic time), and media messages also in `media` as
+    (to, media URL); wait_for() blocks until a recipient got a number of
+    messages. Statuses queued in `failures` (e.g. 429, 503) are returned
+    for the next requests before sends succeed again.
+
+    Args:
+        response_delay (float): Seconds before each response
+        handshake_delay (float): Seconds slept once per new connection
+        retry_after (float): Retry-After header sent with 429 responses (None: no header)
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, response_delay: float = 0.0,
+                 handshake_delay: float = 0.0, retry_after: float = None):
+        self.response_delay = response_delay
+        self.handshake_delay = handshake_delay
+        self.retry_after = retry_after
+
+        self.lock = threading.Lock()
+        self.arrived = threading.Condition(self.lock)
+        self.failures = deque()
+        self.messages = []
+        self.media = []
+        self.received = {}  # recipient -> accepted message count
+        self.connections = 0
+        self.requests = 0
+        self._ids = itertools.count(1)
+
+        self._server = _StubHTTPServer((host, port), _FakeTwilioHandler)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, *statuses: int):
+        """Answer the next requests with these HTTP statuses, in order."""
+        with self.lock:
+            self.failures.extend(statuses)
+
+    def bodies_for(self, to: str) -> list:
+        """Bodies accepted for one recipient, in arrival order."""
+        with self.lock:
+            return [body for recipient, body, _ in self.messages if recipient == to]
+
+    def wait_for(self, to: str, count: int, timeout: float) -> bool:
+        """Wait until `count` messages to a recipient were accepted; False on timeout."""
+        with self.arrived:
+            return self.arrived.wait_for(lambda: self.received.get(to, 0) >= count, timeout)
+
+    def start(self) -> "FakeTwilioServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeRedisServer:
+    """
+    Tiny single-node Redis-protocol stand-in: GET, SET, INCR, DECR, EXPIRE,
+    DEL, PING and SELECT over RESP2, with lazy key expiry. Enough for the
+    redis rate-limit backend without a real Redis install.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.lock = threading.Lock()
+        self.data = {}
+        self.expires = {}
+        self.commands = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(128)
+        self._running = False
+
+    @property
+    def url(self) -> str:
+        host, port = self._sock.getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    def _alive(self, key):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _run(self, name: bytes, args: list) -> bytes:
+        name = name.upper()
+        with self.lock:
+            self.commands += 1
+            if name == b"PING":
+                return b"+PONG\r\n"
+            if name == b"SELECT":
+                return b"+OK\r\n"
+            if name == b"GET":
+                if not self._alive(args[0]):
+                    return b"$-1\r\n"
+                value = self.data[args[0]]
+                return b"$%d\r\n%s\r\n" % (len(value), value)
+            if name == b"SET":
+                self.data[args[0]] = args[1]
+                self.expires.pop(args[0], None)
+                return b"+OK\r\n"
+            if name in (b"INCR", b"DECR"):
+                current = int(self.data[args[0]]) if self._alive(args[0]) else 0
+                current += 1 if name == b"INCR" else -1
+                self.data[args[0]] = str(current).encode()
+                return b":%d\r\n" % current
+            if name == b"EXPIRE":
+                if not self._alive(args[0]):
+                    return b":0\r\n"
+                self.expires[args[0]] = time.time() + int(args[1])
+                return b":1\r\n"
+            if name == b"DEL":
+                removed = sum(1 for key in args if self._alive(key) and self.data.pop(key, None) is not None)
+                return b":%d\r\n" % removed
+        return b"-ERR unknown command '%s'\r\n" % name
+
+    def _serve(self, conn):
+        reader = conn.makefile("rb")
+        try:
+            while True:
+                header = reader.readline()
+                if not header:
+                    return
+                args = []
+                for _ in range(int(header[1:-2])):
+                    size = int(reader.readline()[1:-2])
+                    args.append(reader.read(size + 2)[:-2])
+                conn.sendall(self._run(args[0], args[1:]))
+        except (OSError, ValueError):
+            pass
+        finally:
+            conn.close()
+
+    def _accept(self):
+        while self._running:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def start(self) -> "FakeRedisServer":
+        self._running = True
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,49 @@
+"""
+Signed Twilio WhatsApp webhooks for benchmarks and load tests.
+
+The app rejects webhooks whose X-Twilio-Signature does not match
+TWILIO_WEBHOOK_URL and TWILIO_AUTH_TOKEN, so generated requests are signed
+with twilio's own RequestValidator, exactly as Twilio would sign them.
+"""
+import itertools
+import os
+
+from twilio.request_validator import RequestValidator
+
+
+class WebhookSigner:
+    """
+    Builds the form fields and headers of incoming-message webhooks.
+
+    Args:
+        url (str): The webhook URL the app validates against (TWILIO_WEBHOOK_URL)
+        auth_token (str): The Twilio auth token the app validates with
+        account_sid (str): AccountSid sent with each webhook
+        to (str): The bot's WhatsApp number (E.164)
+    """
+
+    def __init__(self, url: str, auth_token: str, account_sid: str = "ACbench", to: str = "+15550000000"):
+        self.url = url
+        self.account_sid = account_sid
+        self.to = to
+        self._validator = RequestValidator(auth_token)
+        self._sids = itertools.count(1)
+        self._prefix = os.urandom(4).hex()
+
+    def build(self, sender: str, body: str):
+        """
+        Build one incoming message from `sender` (E.164, without the whatsapp: prefix).
+
+        Returns:
+            tuple: (form fields, headers) to POST to the webhook URL
+        """
+        params = {
+            "MessageSid": f"SM{self._prefix}{next(self._sids):024d}",
+            "AccountSid": self.account_sid,
+            "From": f"whatsapp:{sender}",
+            "To": f"whatsapp:{self.to}",
+            "Body": body,
+            "NumMedia": "0",
+        }
+        headers = {"X-Twilio-Signature": self._validator.compute_signature(self.url, params)}
+        return params, headers
@@ -1,14 +1,25 @@
-from app import create_app                 # Import the application factory
 from app.settings.config import Config     # Import centralized configuration
 
-# Instantiate the Flask application
-app = create_app()
+if Config.EXECUTION_MODE == "async":
+    # Instantiate the ASGI application (serve with uvicorn: `uvicorn run:app`)
+    from app.asgi import create_asgi_app
+    app = create_asgi_app()
+else:
+    # Instantiate the Flask application (imported here so async mode never loads
+    # the threaded pipeline and its second session storage)
+    from app import create_app
+    app = create_app()
 
 if __name__ == "__main__":
-    # When executed as the main program, start the Flask development server
-    # with host, port, and debug settings pulled from the Config class.
-    app.run(
-        host=Config.HOST,       # Network interface to bind to (e.g., "0.0.0.0")
-        port=Config.PORT,       # TCP port to listen on (e.g., 5000)
-        debug=Config.DEBUG      # Enable debug mode if True (auto-reloads on change)
-    )
+    if Config.EXECUTION_MODE == "async":
+        # Serve the asyncio pipeline with uvicorn, keeping our own logging setup
+        import uvicorn
+        uvicorn.run(app, host=Config.HOST, port=Config.PORT, log_config=None)
+    else:
+        # When executed as the main program, start the Flask development server
+        # with host, port, and debug settings pulled from the Config class.
+        app.run(
+            host=Config.HOST,       # Network interface to bind to (e.g., "0.0.0.0")
+            port=Config.PORT,       # TCP port to listen on (e.g., 5000)
+            debug=Config.DEBUG      # Enable debug mode if True (auto-reloads on change)
+        )
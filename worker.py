@@ -0,0 +1,14 @@
+import sys
+from app.settings.config import Config                  # Import centralized configuration
+from app.services.worker_pool import WorkerSupervisor  # Worker process pool
+from app.utils.logger import setup_logging              # Centralized logging setup
+
+# Answers messages the webhook queued in the job journal (WORKER_MODE=external).
+# Run it next to the webhook process: `python worker.py`
+if __name__ == "__main__":
+    if Config.WORKER_MODE != "external":
+        # In-process mode answers messages inside the webhook process; there is no queue to serve
+        sys.exit(f"worker.py needs WORKER_MODE=external (currently {Config.WORKER_MODE!r}); "
+                 "set it for both the webhook and the workers")
+    setup_logging()
+    WorkerSupervisor().run()